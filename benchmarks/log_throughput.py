@@ -0,0 +1,120 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Benchmark of the task throughput of the worker log file handler, at DEBUG
+and at INFO. Every task emits 50 debug records and 5 info records, which
+are written once through a synchronous RotatingFileHandler, and once
+through the QueueHandler the agent workers use.
+
+This is not part of the unit tests. Run it from a development environment:
+
+    python benchmarks/log_throughput.py [tasks]
+
+"""
+
+import logging
+import logging.handlers
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from cloudify_agent import logs
+
+FORMAT = '%(levelname)s %(message)s'
+TASKS = 200
+DEBUG_RECORDS = 50
+INFO_RECORDS = 5
+
+
+def _task(logger, task_id):
+    for i in range(DEBUG_RECORDS):
+        logger.debug('task %d: debug record %d', task_id, i)
+    for i in range(INFO_RECORDS):
+        logger.info('task %d: info record %d', task_id, i)
+
+
+def _throughput(handler, level, tasks):
+    handler.setLevel(level)
+    handler.setFormatter(logging.Formatter(FORMAT))
+    logger = logging.getLogger('cloudify_agent.benchmarks.logs')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [handler]
+    try:
+        start = time.time()
+        for task_id in range(tasks):
+            _task(logger, task_id)
+        duration = time.time() - start
+    finally:
+        handler.close()
+        logger.handlers = []
+    return tasks / max(duration, 1e-6)
+
+
+def _verify(logfile, expected):
+    with open(logfile) as f:
+        written = len(f.read().splitlines())
+    if written != expected:
+        raise RuntimeError('{0} records were written instead of {1}'
+                           .format(written, expected))
+    os.remove(logfile)
+
+
+def benchmark(level, tasks, directory):
+
+    """
+    Measure the task throughput of both handlers.
+
+    :param level: the handlers level.
+    :param tasks: the number of tasks.
+    :param directory: the directory of the log file.
+
+    :return: the tasks per second of the synchronous handler, and of the
+             queue handler.
+    :rtype: tuple
+    """
+
+    records = DEBUG_RECORDS + INFO_RECORDS if level <= logging.DEBUG \
+        else INFO_RECORDS
+    logfile = os.path.join(directory, 'worker.log')
+
+    sync = _throughput(logging.handlers.RotatingFileHandler(logfile),
+                       level, tasks)
+    _verify(logfile, tasks * records)
+
+    file_handler = logs.CompressingRotatingFileHandler(logfile)
+    file_handler.setFormatter(logging.Formatter(FORMAT))
+    queued = _throughput(logs.QueueHandler(file_handler), level, tasks)
+    _verify(logfile, tasks * records)
+    return sync, queued
+
+
+def main(tasks):
+    directory = tempfile.mkdtemp(prefix='log-throughput-')
+    try:
+        for level in [logging.DEBUG, logging.INFO]:
+            sync, queued = benchmark(level, tasks, directory)
+            print('{0}: {1:.0f} tasks/s with a synchronous handler, '
+                  '{2:.0f} tasks/s with a queue handler'.format(
+                      logging.getLevelName(level), sync, queued))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else TASKS)
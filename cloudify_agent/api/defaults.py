@@ -21,9 +21,18 @@ MANAGER_PORT = 8101
 BROKER_PORT = 5672
 MIN_WORKERS = 0
 MAX_WORKERS = 5
+POOL = 'prefork'
+CONTROL_WORKERS = 1
 BROKER_URL = 'amqp://{username}:{password}@{host}:{port}//'
 DELETE_AMQP_QUEUE_BEFORE_START = True
 DAEMON_FORCE_DELETE = False
 CLOUDIFY_AGENT_PREFIX = 'cfy-agent'
 LOG_LEVEL = 'debug'
 CELERY_TASK_RESULT_EXPIRES = 600
+INSTALL_SCRIPT_PROGRESS_INTERVAL = 10
+REST_CACHE_TTL = 5
+NODE_INSTANCES_PAGE_SIZE = 1000
+BROKER_CONFIG_TTL = 300
+OUTPUT_TAIL_LINES = 100
+OUTPUT_MAX_LINE_LENGTH = 4096
+WHEELHOUSE_MAX_SIZE = 1024 * 1024 * 1024
@@ -15,6 +15,7 @@
 
 import os
 import json
+import tempfile
 
 from cloudify.utils import setup_logger
 
@@ -201,10 +202,21 @@ class DaemonFactory(object):
         )
         self.logger.debug('Saving daemon configuration at: {0}'
                           .format(daemon_path))
-        with open(daemon_path, 'w') as f:
-            props = utils.internal.daemon_to_dict(daemon)
-            json.dump(props, f, indent=2)
-            f.write(os.linesep)
+
+        # the configuration is written to a temporary file that replaces
+        # the existing one, so readers never observe a partial file.
+        fd, temp_path = tempfile.mkstemp(dir=self.storage, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                props = utils.internal.daemon_to_dict(daemon)
+                json.dump(props, f, indent=2)
+                f.write(os.linesep)
+            if os.name == 'nt' and os.path.exists(daemon_path):
+                os.remove(daemon_path)
+            os.rename(temp_path, daemon_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
 
     def delete(self, name):
 
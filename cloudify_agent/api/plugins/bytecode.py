@@ -0,0 +1,143 @@
+#########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Compiles the python sources of an installed plugin ahead of time, so the
+workers that import the plugin do not compile it on every import.
+
+The sources are compiled by a process pool. Since agent workers are
+daemonic processes, which may not have child processes, this module is
+executed as a script, and therefore should only import modules from the
+standard library.
+
+"""
+
+import json
+import multiprocessing
+import os
+import py_compile
+import struct
+import sys
+import time
+
+try:
+    from importlib.util import MAGIC_NUMBER
+    from importlib.util import cache_from_source
+except ImportError:
+    # python 2
+    import imp
+    MAGIC_NUMBER = imp.get_magic()
+    cache_from_source = None
+
+# the offset of the source modification time in the bytecode header
+MTIME_OFFSET = 8 if sys.version_info >= (3, 7) else 4
+
+
+def compile_dir(directory, processes=None, destination=None):
+
+    """
+    Compile all python sources of a directory that are not compiled yet,
+    and verify that the bytecode of every compiled source is up to date.
+
+    :param directory: the directory.
+    :param processes: the number of compiling processes. defaults to the
+                      number of cpus.
+    :param destination: the directory the sources are moved to after they
+                        are compiled, which the source paths recorded in
+                        the bytecode (and shown in tracebacks) refer to.
+                        defaults to the directory.
+
+    :return: a dictionary with the number of 'compiled' sources, the
+             number of sources that 'failed' compiling or verification,
+             and the compilation time in 'seconds'.
+    :rtype: dict
+    """
+
+    started = time.time()
+    sources = [source for source in _sources(directory)
+               if not is_compiled(source)]
+    failed = 0
+    if sources:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_compile, [
+                (source, _destination_path(source, directory, destination))
+                for source in sources])
+        finally:
+            pool.close()
+            pool.join()
+        failed = sum(1 for source, result in zip(sources, results)
+                     if not result or not is_compiled(source))
+    return {
+        'compiled': len(sources) - failed,
+        'failed': failed,
+        'seconds': time.time() - started
+    }
+
+
+def is_compiled(source):
+
+    """
+    :param source: path to a python source.
+
+    :return: whether the bytecode of the source is up to date.
+    :rtype: bool
+    """
+
+    compiled = _compiled_path(source)
+    try:
+        with open(compiled, 'rb') as f:
+            header = f.read(MTIME_OFFSET + 4)
+        mtime = int(os.stat(source).st_mtime)
+    except (IOError, OSError):
+        return False
+    if len(header) < MTIME_OFFSET + 4 or header[:4] != MAGIC_NUMBER:
+        return False
+    return struct.unpack(
+        '<I', header[MTIME_OFFSET:])[0] == mtime & 0xFFFFFFFF
+
+
+def _compiled_path(source):
+    if cache_from_source:
+        return cache_from_source(source)
+    return source + ('c' if __debug__ else 'o')
+
+
+def _sources(directory):
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.py'):
+                yield os.path.join(root, name)
+
+
+def _destination_path(source, directory, destination):
+    if not destination:
+        return None
+    return os.path.join(destination, os.path.relpath(source, directory))
+
+
+def _compile(args):
+    source, dfile = args
+    try:
+        py_compile.compile(source, dfile=dfile, doraise=True)
+        return True
+    except (py_compile.PyCompileError, IOError, OSError):
+        return False
+
+
+if __name__ == '__main__':
+    sys.stdout.write(json.dumps(compile_dir(
+        sys.argv[1],
+        destination=sys.argv[2] if len(sys.argv) > 2 else None)))
@@ -14,27 +14,36 @@
 #  * limitations under the License.
 
 import errno
+import json
 import os
 import sys
 import shutil
 import tempfile
+import threading
 import platform
+import uuid
 import logging
+from contextlib import contextmanager
 
 import fasteners
 from wagon import wagon
 from wagon import utils as wagon_utils
 
 from cloudify.exceptions import NonRecoverableError
+from cloudify.exceptions import CommandExecutionException
 from cloudify.utils import setup_logger
 from cloudify.utils import LocalCommandRunner
 from cloudify.utils import get_manager_file_server_blueprints_root_url
-from cloudify.manager import get_rest_client
 
 from cloudify_agent import VIRTUALENV
 from cloudify_agent.api import plugins
+from cloudify_agent.api import utils
 from cloudify_agent.api.utils import get_pip_path
 from cloudify_agent.api import exceptions
+from cloudify_agent.api import rest
+from cloudify_agent.api.plugins import bytecode
+from cloudify_agent.api.plugins.store import PluginStore
+from cloudify_agent.api.plugins.wheelhouse import Wheelhouse
 
 
 SYSTEM_DEPLOYMENT = '__system__'
@@ -45,6 +54,11 @@ class PluginInstaller(object):
     def __init__(self, logger=None):
         self.logger = logger or setup_logger(self.__class__.__name__)
         self.runner = LocalCommandRunner(logger=self.logger)
+        self.store = PluginStore(self._full_dst_dir('.store'))
+        self.wheelhouse = Wheelhouse(
+            os.path.join(utils.internal.get_storage_directory(),
+                         'wheelhouse'),
+            self.runner)
 
     def install(self,
                 plugin,
@@ -67,9 +81,9 @@ class PluginInstaller(object):
                                             logger=self.logger)
         source = get_plugin_source(plugin, blueprint_id)
         args = get_plugin_args(plugin)
-        tmp_plugin_dir = tempfile.mkdtemp(prefix='{0}-'.format(plugin['name']))
-        args = '{0} --prefix="{1}"'.format(args, tmp_plugin_dir).strip()
         self._create_plugins_dir_if_missing()
+        tmp_plugin_dir = self._staging_dir(plugin['name'])
+        args = '{0} {1}'.format(args, _prefix_arg(tmp_plugin_dir)).strip()
         try:
             if managed_plugin:
                 self._install_managed_plugin(
@@ -88,7 +102,7 @@ class PluginInstaller(object):
                 raise NonRecoverableError(
                     'No source or managed plugin found for {0}'.format(plugin))
         finally:
-            self._rmtree(tmp_plugin_dir)
+            self._discard(tmp_plugin_dir)
 
     def _install_managed_plugin(self, managed_plugin, plugin, args,
                                 tmp_plugin_dir):
@@ -114,13 +128,13 @@ class PluginInstaller(object):
                             ' on the manager. Existing '
                             'installation will be overridden. '
                             '[existing: {0}]'.format(existing_plugin_id))
-                        self._rmtree(dst_dir)
+                        self._discard(dst_dir)
                 else:
                     self.logger.warning(
                         'Managed plugin installation found but it is '
                         'in a corrupted state. Existing installation '
                         'will be overridden.')
-                    self._rmtree(dst_dir)
+                    self._discard(dst_dir)
 
             fields = ['package_name',
                       'package_version',
@@ -142,6 +156,7 @@ class PluginInstaller(object):
                 try:
                     self._wagon_install(plugin=managed_plugin, args=args)
                     shutil.move(tmp_plugin_dir, dst_dir)
+                    self._compile(dst_dir)
                     with open(os.path.join(dst_dir, 'plugin.id'), 'w') as f:
                         f.write(managed_plugin.id)
                 except Exception as e:
@@ -155,7 +170,7 @@ class PluginInstaller(object):
                 lock.release()
 
     def _wagon_install(self, plugin, args):
-        client = get_rest_client()
+        client = rest.get_client()
         wagon_dir = tempfile.mkdtemp(prefix='{0}-'.format(plugin.id))
         wagon_path = os.path.join(wagon_dir, 'wagon.tar.gz')
         try:
@@ -184,33 +199,134 @@ class PluginInstaller(object):
                 'This probably means a previous deployment with the '
                 'same name was not cleaned properly. Removing existing'
                 ' directory'.format(plugin['name'], deployment_id))
-            self._rmtree(dst_dir)
+            self._discard(dst_dir)
         self.logger.info('Installing plugin from source')
-        self._pip_install(source=source, args=args)
-        shutil.move(tmp_plugin_dir, dst_dir)
+        self._pip_install(source=source, args=args, dst_dir=dst_dir,
+                          tmp_plugin_dir=tmp_plugin_dir)
+
+    def _pip_install(self, source, args, dst_dir, tmp_plugin_dir):
+        prefix_arg = _prefix_arg(tmp_plugin_dir)
+        plugin_args = args.replace(prefix_arg, '').strip()
+        # the plugin directory is linked in a staging directory and only
+        # then renamed into place, so it is never observed incomplete.
+        staged_dir = self._staging_dir(os.path.basename(dst_dir))
+        try:
+            with self._plugin_dir(source) as plugin_dir:
+
+                # a plugin that was already installed with the same sources
+                # and arguments is linked from the plugin store.
+                key = self.store.tree_key(plugin_dir, plugin_args)
+                if self.store.link(key, staged_dir):
+                    os.rename(staged_dir, dst_dir)
+                    self.logger.info('Plugin linked from the plugin store '
+                                     '[{0}]'.format(key))
+                    return
+
+                package_name = extract_package_name(plugin_dir)
+                self.logger.debug('Retrieved package name: {0}'
+                                  .format(package_name))
+                self._install_plugin_dir(key, plugin_dir, package_name,
+                                         plugin_args, prefix_arg)
+                # compiled before it is stored, so the bytecode is shared
+                self._compile(tmp_plugin_dir, destination=dst_dir)
+                self.store.add(key, tmp_plugin_dir, staged_dir)
+                os.rename(staged_dir, dst_dir)
+        finally:
+            if os.path.exists(staged_dir):
+                self._discard(staged_dir)
+
+    def _install_plugin_dir(self, key, plugin_dir, package_name, plugin_args,
+                            prefix_arg):
+        wheels = self.wheelhouse.get(key) or self._build_wheels(
+            key, plugin_dir, plugin_args)
+        if wheels:
+            self.logger.debug('Installing from the wheel cache: {0}'
+                              .format(os.path.dirname(wheels[0])))
+            # only the plugin itself is named, so that its dependencies
+            # are resolved against the packages of the agent virtualenv,
+            # and taken from the cache only when they are missing there.
+            try:
+                self.runner.run('{0} install --no-index --find-links {1} '
+                                '{2} {3} {4}'.format(
+                                    get_pip_path(),
+                                    os.path.dirname(wheels[0]),
+                                    package_name,
+                                    plugin_args,
+                                    prefix_arg),
+                                cwd=plugin_dir)
+                return
+            except CommandExecutionException as e:
+                self.logger.warning('Failed installing from the wheel '
+                                    'cache, installing from source: {0}'
+                                    .format(e))
+                self.wheelhouse.remove(key)
+        self.logger.debug('Installing from directory: {0} '
+                          '[args={1}]'.format(plugin_dir, plugin_args))
+        command = '{0} install {1} {2} {3}'.format(
+            get_pip_path(), plugin_dir, plugin_args, prefix_arg)
+        self.runner.run(command, cwd=plugin_dir)
+
+    def _compile(self, directory, destination=''):
+        # the sources are compiled in a separate process, which may use a
+        # process pool.
+        try:
+            response = self.runner.run('{0} {1} {2} {3}'.format(
+                sys.executable,
+                '{0}.py'.format(os.path.splitext(bytecode.__file__)[0]),
+                directory,
+                destination).strip())
+            stats = json.loads(response.std_out)
+        except (CommandExecutionException, ValueError) as e:
+            self.logger.warning('Failed compiling plugin sources: {0}'
+                                .format(e))
+            return
+        self.logger.info('Compiled {0} plugin modules in {1:.2f} seconds'
+                         .format(stats['compiled'], stats['seconds']))
+        if stats['failed']:
+            self.logger.debug('{0} plugin modules could not be compiled'
+                              .format(stats['failed']))
+
+    def _build_wheels(self, key, plugin_dir, plugin_args):
+        try:
+            return self.wheelhouse.build(key, plugin_dir, plugin_args)
+        except CommandExecutionException as e:
+            # e.g the wheel package is not installed
+            self.logger.debug('Failed building wheels: {0}'.format(e))
+            return None
+
+    def warm(self, source, args=''):
+
+        """
+        Build the wheels of a source plugin and its dependencies into the
+        wheel cache, so later installations of the plugin do not download
+        or build anything.
 
-    def _pip_install(self, source, args):
-        plugin_dir = None
+        :param source: the plugin source url, or an absolute path to the
+                       plugin directory.
+        :param args: the plugin install arguments.
+
+        :return: the paths of the cached wheels.
+        :rtype: list
+        """
+
+        args = (args or '').strip()
+        with self._plugin_dir(source) as plugin_dir:
+            key = self.store.tree_key(plugin_dir, args)
+            return (self.wheelhouse.get(key) or
+                    self.wheelhouse.build(key, plugin_dir, args))
+
+    @contextmanager
+    def _plugin_dir(self, source):
+        if os.path.isabs(source):
+            yield source
+            return
+        self.logger.debug('Extracting archive: {0}'.format(source))
+        plugin_dir = extract_package_to_dir(source)
         try:
-            if os.path.isabs(source):
-                plugin_dir = source
-            else:
-                self.logger.debug('Extracting archive: {0}'.format(source))
-                plugin_dir = extract_package_to_dir(source)
-            self.logger.debug('Installing from directory: {0} '
-                              '[args={1}]'.format(plugin_dir, args))
-            command = '{0} install {1} {2}'.format(
-                get_pip_path(), plugin_dir, args)
-            self.runner.run(command, cwd=plugin_dir)
-            package_name = extract_package_name(plugin_dir)
-            self.logger.debug('Retrieved package name: {0}'
-                              .format(package_name))
+            yield plugin_dir
         finally:
-            if plugin_dir and not os.path.isabs(source):
-                self.logger.debug('Removing directory: {0}'
-                                  .format(plugin_dir))
-                self._rmtree(plugin_dir)
-        return package_name
+            self.logger.debug('Removing directory: {0}'.format(plugin_dir))
+            self._rmtree(plugin_dir)
 
     def uninstall(self, plugin, deployment_id=None):
         """Uninstall a previously installed plugin (only supports source
@@ -220,21 +336,49 @@ class PluginInstaller(object):
         dst_dir = '{0}-{1}'.format(deployment_id, plugin['name'])
         dst_dir = self._full_dst_dir(dst_dir)
         if os.path.isdir(dst_dir):
-            self._rmtree(dst_dir)
+            self._discard(dst_dir)
 
     def uninstall_wagon(self, package_name, package_version):
         """Only used by tests for cleanup purposes"""
         dst_dir = '{0}-{1}'.format(package_name, package_version)
         dst_dir = self._full_dst_dir(dst_dir)
         if os.path.isdir(dst_dir):
-            self._rmtree(dst_dir)
+            self._discard(dst_dir)
+
+    def _staging_dir(self, name):
+        # staging directories are created on the file system of the plugins
+        # directory, so they are moved into place by a rename.
+        staging_dir = self._full_dst_dir('.staging')
+        self._makedirs(staging_dir)
+        return tempfile.mkdtemp(prefix='{0}-'.format(name), dir=staging_dir)
+
+    def _discard(self, path):
+
+        """
+        Move a directory aside and have it deleted in the background, along
+        with any directory that was discarded before but not deleted yet.
+        """
+
+        trash_dir = self._full_dst_dir('.trash')
+        self._makedirs(trash_dir)
+        try:
+            os.rename(path, os.path.join(trash_dir, '{0}-{1}'.format(
+                os.path.basename(path), uuid.uuid4().hex)))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return
+        _TrashReaper.wake(trash_dir, self.store)
+
+    @classmethod
+    def _create_plugins_dir_if_missing(cls):
+        cls._makedirs(os.path.join(VIRTUALENV, 'plugins'))
 
     @staticmethod
-    def _create_plugins_dir_if_missing():
-        plugins_dir = os.path.join(VIRTUALENV, 'plugins')
-        if not os.path.exists(plugins_dir):
+    def _makedirs(path):
+        if not os.path.exists(path):
             try:
-                os.makedirs(plugins_dir)
+                os.makedirs(path)
             except OSError as e:
                 if e.errno != errno.EEXIST:
                     raise
@@ -253,6 +397,54 @@ class PluginInstaller(object):
         shutil.rmtree(path, ignore_errors=True)
 
 
+class _TrashReaper(threading.Thread):
+
+    """
+    Deletes the directories discarded into a trash directory. A single
+    reaper runs for every trash directory of a process, and empties the
+    trash whenever it is woken up.
+    """
+
+    _reapers = {}
+    _reapers_lock = threading.Lock()
+
+    def __init__(self, trash_dir, store):
+        super(_TrashReaper, self).__init__()
+        self.daemon = True
+        self.trash_dir = trash_dir
+        self.store = store
+        self.logger = setup_logger(self.__class__.__name__)
+        self._wakeup = threading.Event()
+
+    @classmethod
+    def wake(cls, trash_dir, store):
+        with cls._reapers_lock:
+            reaper = cls._reapers.get(trash_dir)
+            # a reaper of the parent process does not run in a fork
+            if reaper is None or not reaper.is_alive():
+                reaper = cls(trash_dir, store)
+                reaper.start()
+                cls._reapers[trash_dir] = reaper
+        reaper._wakeup.set()
+
+    def run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self.empty()
+
+    def empty(self):
+        for name in os.listdir(self.trash_dir):
+            try:
+                self.store.remove(os.path.join(self.trash_dir, name))
+            except Exception as e:
+                self.logger.debug('Failed deleting {0}: {1}'.format(name, e))
+
+
+def _prefix_arg(prefix):
+    return '--prefix="{0}"'.format(prefix)
+
+
 def extract_package_to_dir(package_url):
     """
     Extracts a pip package to a temporary directory.
@@ -376,7 +568,7 @@ def get_managed_plugin(plugin, logger=None):
         query_parameters['distribution_release'] = distribution_release
     if supported_platform:
         query_parameters['supported_platform'] = supported_platform
-    client = get_rest_client()
+    client = rest.get_client()
     plugins = client.plugins.list(**query_parameters)
 
     if not supported_platform:
@@ -0,0 +1,244 @@
+#########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+A content addressed store of installed plugin files.
+
+Every file of an installed plugin directory is stored once as an object,
+named after its content and mode, and hardlinked into the plugin
+directories that contain it. Python sources are also named after their
+modification time, which their precompiled bytecode is checked against.
+The link count of an object is its reference count: an object whose only
+link is the store itself is no longer used by any plugin directory.
+
+The files of every stored directory are listed in a tree, so a directory
+that was already stored can be recreated by linking, without installing
+it again.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+import fasteners
+
+# written to every directory created from the store, holding its tree key.
+TREE_KEY_FILE = '.plugin-store'
+
+# held along with the store file lock
+_threads_lock = threading.Lock()
+
+
+class PluginStore(object):
+
+    def __init__(self, root):
+
+        """
+        :param root: the store directory.
+        """
+
+        self.root = root
+        self._objects_dir = os.path.join(root, 'objects')
+        self._trees_dir = os.path.join(root, 'trees')
+
+    def tree_key(self, directory, *extra):
+
+        """
+        Compute the key of the content of a directory.
+
+        :param directory: the directory.
+        :param extra: additional values the key depends on.
+
+        :return: the key.
+        :rtype: str
+        """
+
+        sha256 = hashlib.sha256()
+        for value in extra:
+            sha256.update('{0}\n'.format(value).encode('utf-8'))
+        for path, relpath in _walk(directory):
+            sha256.update('{0}\n'.format(relpath).encode('utf-8'))
+            if os.path.isfile(path) and not os.path.islink(path):
+                sha256.update(_digest(path).encode('utf-8'))
+        return sha256.hexdigest()
+
+    def link(self, key, destination):
+
+        """
+        Create a directory from a stored tree.
+
+        :param key: the tree key.
+        :param destination: the directory to create.
+
+        :return: whether the tree was stored.
+        :rtype: bool
+        """
+
+        with self._lock():
+            tree = self._load_tree(key)
+            if tree is None:
+                return False
+            self._link_tree(key, tree, destination)
+            return True
+
+    def add(self, key, source, destination):
+
+        """
+        Store the files of a directory and link them to a new directory.
+        The files are moved out of the source directory.
+
+        :param key: the tree key.
+        :param source: the directory to store.
+        :param destination: the directory to create.
+        """
+
+        with self._lock():
+            tree = []
+            for path, relpath in _walk(source):
+                if os.path.islink(path):
+                    tree.append({'path': relpath,
+                                 'link': os.readlink(path)})
+                elif os.path.isdir(path):
+                    tree.append({'path': relpath, 'dir': True})
+                else:
+                    tree.append({'path': relpath,
+                                 'object': self._add_object(path)})
+            self._link_tree(key, tree, destination)
+            _makedirs(self._trees_dir)
+            tree_path = self._tree_path(key)
+            with open('{0}.tmp'.format(tree_path), 'w') as f:
+                json.dump(tree, f)
+            os.rename('{0}.tmp'.format(tree_path), tree_path)
+
+    def remove(self, directory):
+
+        """
+        Remove a directory created from the store, along with the objects
+        no other directory links to.
+
+        :param directory: the directory.
+        """
+
+        key_path = os.path.join(directory, TREE_KEY_FILE)
+        key = None
+        if os.path.isfile(key_path):
+            with open(key_path) as f:
+                key = f.read().strip()
+        shutil.rmtree(directory, ignore_errors=True)
+        if not key:
+            return
+        with self._lock():
+            tree = self._load_tree(key) or []
+            orphans = [self._object_path(entry['object'])
+                       for entry in tree if 'object' in entry]
+            orphans = [path for path in orphans
+                       if os.path.exists(path) and os.stat(path).st_nlink == 1]
+            for path in orphans:
+                os.remove(path)
+            if orphans:
+                # the tree can not be linked anymore
+                os.remove(self._tree_path(key))
+
+    def _add_object(self, path):
+        stat = os.stat(path)
+        name = '{0}-{1:o}'.format(_digest(path), stat.st_mode & 0o777)
+        if path.endswith('.py'):
+            # linking a source with another modification time would make
+            # the bytecode stored next to it stale.
+            name = '{0}-{1}'.format(name, int(stat.st_mtime))
+        object_path = self._object_path(name)
+        if not os.path.exists(object_path):
+            _makedirs(os.path.dirname(object_path))
+            shutil.move(path, object_path)
+        return name
+
+    def _link_tree(self, key, tree, destination):
+        _makedirs(destination)
+        for entry in tree:
+            path = os.path.join(destination, entry['path'])
+            if entry.get('dir'):
+                _makedirs(path)
+                continue
+            _makedirs(os.path.dirname(path))
+            if 'link' in entry:
+                os.symlink(entry['link'], path)
+            else:
+                _link(self._object_path(entry['object']), path)
+        with open(os.path.join(destination, TREE_KEY_FILE), 'w') as f:
+            f.write(key)
+
+    def _load_tree(self, key):
+        tree_path = self._tree_path(key)
+        if not os.path.isfile(tree_path):
+            return None
+        with open(tree_path) as f:
+            tree = json.load(f)
+        if not all(os.path.exists(self._object_path(entry['object']))
+                   for entry in tree if 'object' in entry):
+            return None
+        return tree
+
+    def _object_path(self, name):
+        return os.path.join(self._objects_dir, name[:2], name)
+
+    def _tree_path(self, key):
+        return os.path.join(self._trees_dir, '{0}.json'.format(key))
+
+    @contextmanager
+    def _lock(self):
+        _makedirs(self.root)
+        # the file lock does not exclude the threads of the same process
+        with _threads_lock:
+            with fasteners.InterProcessLock(
+                    os.path.join(self.root, 'lock')):
+                yield
+
+
+def _walk(directory):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(dirs + files):
+            path = os.path.join(root, name)
+            yield path, os.path.relpath(path, directory)
+
+
+def _digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _link(source, destination):
+    try:
+        os.link(source, destination)
+    except (AttributeError, OSError):
+        # no hardlinks on this platform or file system. the copy is not
+        # counted as a reference, so the object may be removed while the
+        # copy is kept.
+        shutil.copy2(source, destination)
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
@@ -0,0 +1,129 @@
+#########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+A local cache of the wheels of source plugins and their dependencies.
+Every entry holds the wheels built for one plugin source and its install
+arguments, so the plugin can be installed from the entry without an index.
+The least recently used entries are evicted once the cache exceeds its
+maximum size.
+"""
+
+import os
+import shutil
+import tempfile
+
+from cloudify_agent.api import defaults
+from cloudify_agent.api.utils import get_pip_path
+
+
+class Wheelhouse(object):
+
+    def __init__(self, root, runner, max_size=defaults.WHEELHOUSE_MAX_SIZE):
+
+        """
+        :param root: the cache directory.
+        :param runner: the command runner pip is executed with.
+        :param max_size: the maximum size of the cache in bytes.
+        """
+
+        self.root = root
+        self.max_size = max_size
+        self._runner = runner
+
+    def get(self, key):
+
+        """
+        :param key: the entry key.
+
+        :return: the paths of the cached wheels, or None if the entry
+                 is not cached.
+        :rtype: list
+        """
+
+        path = os.path.join(self.root, key)
+        if not os.path.isdir(path):
+            return None
+        wheels = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                  if name.endswith('.whl')]
+        if not wheels:
+            return None
+        # the modification time orders the entries for eviction
+        os.utime(path, None)
+        return wheels
+
+    def build(self, key, plugin_dir, args=''):
+
+        """
+        Build the wheels of a plugin and its dependencies into a new entry.
+
+        :param key: the entry key.
+        :param plugin_dir: the plugin source directory.
+        :param args: the plugin install arguments.
+
+        :return: the paths of the built wheels.
+        :rtype: list
+        """
+
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        build_dir = tempfile.mkdtemp(dir=self.root, prefix='.build-')
+        try:
+            self._runner.run('{0} wheel --wheel-dir {1} {2} {3}'.format(
+                get_pip_path(), build_dir, plugin_dir, args).strip(),
+                cwd=plugin_dir)
+            path = os.path.join(self.root, key)
+            if os.path.isdir(path):
+                # built concurrently
+                shutil.rmtree(build_dir)
+            else:
+                os.rename(build_dir, path)
+        except BaseException:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        self.evict(keep=key)
+        return self.get(key)
+
+    def remove(self, key):
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def evict(self, keep=None):
+
+        """
+        Remove the least recently used entries until the cache does not
+        exceed its maximum size.
+
+        :param keep: a key that is not evicted.
+        """
+
+        entries = []
+        for key in os.listdir(self.root):
+            path = os.path.join(self.root, key)
+            if key.startswith('.') or not os.path.isdir(path):
+                continue
+            entries.append((os.path.getmtime(path), _size(path), key))
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            self.remove(key)
+            total -= size
+
+
+def _size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, files in os.walk(path) for name in files)
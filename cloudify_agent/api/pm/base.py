@@ -16,21 +16,35 @@
 import getpass
 import json
 import os
+import pkgutil
+import stat
 import time
+from contextlib import contextmanager
 
 from cloudify.utils import (LocalCommandRunner,
                             setup_logger)
 from cloudify import amqp_client
-from cloudify_rest_client.client import CloudifyClient
 from cloudify.constants import (
     BROKER_PORT_NO_SSL,
     BROKER_PORT_SSL,
 )
 
 from cloudify_agent import VIRTUALENV
+from cloudify_agent import scheduler
 from cloudify_agent.api import utils
 from cloudify_agent.api import exceptions
 from cloudify_agent.api import defaults
+from cloudify_agent.api import rest
+
+
+# the package each pool implementation requires
+POOL_PACKAGES = {
+    'prefork': None,
+    'threads': 'threadpool',
+    'gevent': 'gevent',
+    'eventlet': 'eventlet'
+}
+GREEN_POOLS = ['gevent', 'eventlet']
 
 
 class Daemon(object):
@@ -63,6 +77,13 @@ class Daemon(object):
         to create more workers that process tasks from a given queue, use the
         'min_workers' and 'max_workers' keys. defaults to <name>-queue.
 
+    ``queues``:
+
+        additional queues this daemon will listen to, allowing a single
+        daemon to serve the tasks of several deployments. queues can also be
+        added and removed while the daemon is running.
+        defaults to an empty list.
+
     ``host``:
 
         the ip address of the host the agent will be started on. this
@@ -125,6 +146,52 @@ class Daemon(object):
         suggests, it will never exceed this number. allowing for the control
         of resource usage. defaults to 5.
 
+    ``queue_max_workers``:
+
+        the maximum number of tasks of a single deployment this daemon will
+        execute concurrently. tasks exceeding this number are held until
+        other tasks of the same deployment are done, so that a busy
+        deployment does not take over a daemon serving several deployments.
+        defaults to the max_workers value.
+
+    ``workflow_max_workers``:
+
+        the maximum number of workflows of a single deployment this daemon
+        will execute concurrently. defaults to the queue_max_workers value.
+
+    ``deployment_weights``:
+
+        a dictionary mapping deployment ids to their weight. once the daemon
+        runs max_workers tasks, held tasks are dispatched in proportion to
+        the weight of their deployment. the workflows of a deployment are
+        weighted separately, by the '<deployment_id>_workflows' key. may
+        also be given as a 'key:weight,key:weight' string.
+        deployments have a weight of 1 by default.
+
+    ``control_workers``:
+
+        the number of worker slots reserved for short control tasks, such
+        as stopping or restarting the agent. control tasks are executed in
+        these slots even when all max_workers slots are busy. the daemon
+        also consumes a '<queue>.control' queue for every queue it listens
+        to, so that control tasks sent there are not queued behind other
+        tasks on the broker either. 0 disables the reserved slots and the
+        control queues. defaults to 1.
+
+    ``pool``:
+
+        the celery pool implementation executing the tasks of this daemon.
+        one of 'prefork', 'threads', 'gevent' or 'eventlet'. tasks mostly
+        wait for scripts, REST calls and SSH calls, so a threads or green
+        threads pool runs them concurrently using less memory than
+        processes. such pools can not be autoscaled, and always run
+        max_workers tasks concurrently. to keep plugins isolated from each
+        other, every task is executed in a subprocess when a pool other
+        than prefork is used. green thread pools do not run the logging
+        server, which is not cooperative. the threads, gevent and eventlet
+        pools require the threadpool, gevent and eventlet packages
+        respectively. defaults to prefork.
+
     ``extra_env_path``:
 
         path to a file containing environment variables to be added to the
@@ -218,6 +285,7 @@ class Daemon(object):
             'name') or self._get_name_from_manager()
         self.queue = params.get(
             'queue') or self._get_queue_from_manager()
+        self.queues = list(params.get('queues') or [])
         # This is not retrieved by param as an option any more as it then
         # introduces ambiguity over which values should be used if the
         # components of this differ from the passed in broker_user, pass, etc
@@ -233,6 +301,17 @@ class Daemon(object):
             'min_workers') or defaults.MIN_WORKERS
         self.max_workers = params.get(
             'max_workers') or defaults.MAX_WORKERS
+        self.queue_max_workers = params.get(
+            'queue_max_workers') or self.max_workers
+        self.workflow_max_workers = params.get(
+            'workflow_max_workers') or self.queue_max_workers
+        self.deployment_weights = scheduler.parse_weights(
+            params.get('deployment_weights'))
+        self.pool = params.get('pool') or defaults.POOL
+        control_workers = params.get('control_workers')
+        if control_workers is None:
+            control_workers = defaults.CONTROL_WORKERS
+        self.control_workers = int(control_workers)
         self.workdir = params.get(
             'workdir') or os.getcwd()
         self.extra_env_path = params.get('extra_env_path')
@@ -291,6 +370,7 @@ class Daemon(object):
         """
 
         self._validate_autoscale()
+        self._validate_pool()
         self._validate_host()
 
     def _get_broker_port(self):
@@ -540,6 +620,127 @@ class Daemon(object):
         self.start(timeout=start_timeout,
                    interval=start_interval)
 
+    def get_queues(self):
+
+        """
+        :return: all queues this daemon listens to, starting with its
+                 main queue.
+        :rtype: list
+        """
+
+        return [self.queue] + self.queues
+
+    def get_consumed_queues(self):
+
+        """
+        :return: all queues this daemon consumes from, including the
+                 control queues.
+        :rtype: list
+        """
+
+        consumed = []
+        for queue in self.get_queues():
+            consumed.extend(self._lane(queue))
+        return consumed
+
+    def consume(self, queue):
+
+        """
+        Make the running daemon consume from a different queue, without
+        restarting it. The daemon stops consuming from its current queue.
+        Note that the daemon files still refer to the previous queue until
+        the daemon is configured again.
+
+        :param queue: the queue to consume from.
+
+        :raise DaemonException: in case the daemon did not acknowledge
+        consuming from the new queue.
+        """
+
+        with self._control() as (control, destination):
+            for lane_queue in self._lane(queue):
+                self._add_consumer(control, destination, lane_queue)
+            for lane_queue in self._lane(self.queue):
+                control.cancel_consumer(
+                    lane_queue, destination=destination, reply=True)
+        self.queue = queue
+
+    def add_queue(self, queue):
+
+        """
+        Make the running daemon consume from an additional queue, without
+        restarting it. Note that the daemon files do not include the queue
+        until the daemon is configured again.
+
+        :param queue: the queue to add.
+
+        :raise DaemonException: in case the daemon did not acknowledge
+        consuming from the queue.
+        """
+
+        if queue in self.get_queues():
+            return
+        with self._control() as (control, destination):
+            for lane_queue in self._lane(queue):
+                self._add_consumer(control, destination, lane_queue)
+        self.queues.append(queue)
+
+    def remove_queue(self, queue):
+
+        """
+        Make the running daemon stop consuming from an additional queue,
+        without restarting it. Tasks that were already received from the
+        queue are still executed. Note that the daemon files still include
+        the queue until the daemon is configured again.
+
+        :param queue: the queue to remove.
+
+        :raise DaemonException: in case the queue is the main queue of the
+        daemon.
+        """
+
+        if queue == self.queue:
+            raise exceptions.DaemonException(
+                'Cannot remove the main queue {0} of daemon {1}'
+                .format(queue, self.name))
+        if queue not in self.queues:
+            return
+        with self._control() as (control, destination):
+            for lane_queue in self._lane(queue):
+                self._logger.debug('Cancelling consumer for queue {0} of '
+                                   'daemon {1}'.format(lane_queue, self.name))
+                control.cancel_consumer(
+                    lane_queue, destination=destination, reply=True)
+        self.queues.remove(queue)
+
+    def _lane(self, queue):
+        # a queue and its control queue
+        if not self.control_workers:
+            return [queue]
+        return [queue, scheduler.control_queue(queue)]
+
+    @contextmanager
+    def _control(self):
+        celery_client = utils.get_celery_client(
+            broker_url=self.broker_url,
+            ssl_enabled=self.broker_ssl_enabled,
+            ssl_cert_path=self._get_ssl_cert_path())
+        try:
+            yield (celery_client.control,
+                   ['celery@{0}'.format(self.name)])
+        finally:
+            celery_client.close()
+
+    def _add_consumer(self, control, destination, queue):
+        self._logger.debug('Adding consumer for queue {0} to daemon {1}'
+                           .format(queue, self.name))
+        replies = control.add_consumer(
+            queue, destination=destination, reply=True)
+        if not replies:
+            raise exceptions.DaemonException(
+                'Daemon {0} did not start consuming from queue {1}'
+                .format(self.name, queue))
+
     def before_self_stop(self):
 
         """
@@ -549,6 +750,42 @@ class Daemon(object):
         """
         pass
 
+    def get_pool_options(self):
+
+        """
+        :return: the celery worker command line options configuring the
+                 pool of the daemon.
+        :rtype: list
+        """
+
+        if self.pool == 'prefork':
+            return ['--autoscale={0},{1}'.format(self.get_concurrency(),
+                                                 self.min_workers),
+                    '--maxtasksperchild=10',
+                    '-Ofair']
+        return ['--pool={0}'.format(self.pool),
+                '--concurrency={0}'.format(self.get_concurrency()),
+                '--gate-keeper-isolate-tasks']
+
+    def get_concurrency(self):
+
+        """
+        :return: the maximum number of tasks the daemon executes
+                 concurrently, including control tasks.
+        :rtype: int
+        """
+
+        return int(self.max_workers) + self.control_workers
+
+    def uses_logging_server(self):
+
+        """
+        :return: whether the daemon runs the logging server.
+        :rtype: bool
+        """
+
+        return self.pool not in GREEN_POOLS
+
     def get_logfile(self):
 
         """
@@ -599,9 +836,9 @@ class Daemon(object):
 
         try:
             channel = client.connection.channel()
-            self._logger.debug('Deleting queue: {0}'.format(self.queue))
-
-            channel.queue_delete(self.queue)
+            for queue in self._lane(self.queue):
+                self._logger.debug('Deleting queue: {0}'.format(queue))
+                channel.queue_delete(queue)
             pid_box_queue = 'celery@{0}.celery.pidbox'.format(self.name)
             self._logger.debug('Deleting queue: {0}'.format(pid_box_queue))
             channel.queue_delete(pid_box_queue)
@@ -615,6 +852,19 @@ class Daemon(object):
     def _validate_autoscale(self):
         min_workers = self._params.get('min_workers')
         max_workers = self._params.get('max_workers')
+        for name in ['queue_max_workers', 'workflow_max_workers',
+                     'control_workers']:
+            value = self._params.get(name)
+            if value is not None and not str(value).isdigit():
+                raise exceptions.DaemonPropertiesError(
+                    '{0} is supposed to be a number but is: {1}'
+                    .format(name, value)
+                )
+        try:
+            scheduler.parse_weights(self._params.get('deployment_weights'))
+        except ValueError as e:
+            raise exceptions.DaemonPropertiesError(
+                'deployment_weights are invalid: {0}'.format(e))
         if min_workers:
             if not str(min_workers).isdigit():
                 raise exceptions.DaemonPropertiesError(
@@ -638,6 +888,18 @@ class Daemon(object):
                     '[min_workers={0}, max_workers={1}]'
                     .format(min_workers, max_workers))
 
+    def _validate_pool(self):
+        pool = self._params.get('pool') or defaults.POOL
+        if pool not in POOL_PACKAGES:
+            raise exceptions.DaemonPropertiesError(
+                'pool must be one of {0} but is: {1}'
+                .format(', '.join(sorted(POOL_PACKAGES)), pool))
+        package = POOL_PACKAGES[pool]
+        if package and pkgutil.find_loader(package) is None:
+            raise exceptions.DaemonPropertiesError(
+                'The {0} pool requires the {1} package, which is not '
+                'installed'.format(pool, package))
+
     def _validate_host(self):
         queue = self._params.get('queue')
         host = self._params.get('host')
@@ -665,30 +927,22 @@ class Daemon(object):
         return self._runtime_properties['cloudify_agent']['queue']
 
     def _get_runtime_properties(self):
-        client = CloudifyClient(host=self.manager_ip, port=self.manager_port)
-        node_instances = client.node_instances.list(
-            deployment_id=self.deployment_id)
-
-        def match_ip(node_instance):
-            host_id = node_instance.host_id
-            if host_id == node_instance.id:
-                # compute node instance
-                return self.host == node_instance.runtime_properties['ip']
-            return False
-
-        matched = filter(match_ip, node_instances)
+        hosts = rest.get_deployment_hosts(self.deployment_id,
+                                          self.manager_ip,
+                                          self.manager_port)
+        matched = hosts.get(self.host, [])
 
         if len(matched) > 1:
             raise exceptions.DaemonConfigurationError(
                 'Found multiple node instances with ip {0}: {1}'.format(
-                    self.host, ','.join(matched))
+                    self.host, ','.join(n['id'] for n in matched))
             )
 
         if len(matched) == 0:
             raise exceptions.DaemonConfigurationError(
                 'No node instances with ip {0} were found'.format(self.host)
             )
-        self._runtime_properties = matched[0].runtime_propreties
+        self._runtime_properties = matched[0]['runtime_properties']
 
     def _list_plugin_files(self, plugin_name):
 
@@ -787,7 +1041,7 @@ class CronRespawnDaemon(Daemon):
             start_command=self.start_command(),
             status_command=self.status_command()
         )
-        self._runner.run('chmod +x {0}'.format(cron_respawn_path))
+        _make_executable(cron_respawn_path)
         self._logger.debug('Rendering enable cron script from template')
         utils.render_template_to_file(
             template_path='crontab/enable.sh.template',
@@ -798,7 +1052,7 @@ class CronRespawnDaemon(Daemon):
             workdir=self.workdir,
             name=self.name
         )
-        self._runner.run('chmod +x {0}'.format(enable_cron_script))
+        _make_executable(enable_cron_script)
         return enable_cron_script
 
     def create_disable_cron_script(self):
@@ -814,5 +1068,12 @@ class CronRespawnDaemon(Daemon):
             user=self.user,
             workdir=self.workdir
         )
-        self._runner.run('chmod +x {0}'.format(disable_cron_script))
+        _make_executable(disable_cron_script)
         return disable_cron_script
+
+
+def _make_executable(path):
+    # the rendered scripts are owned by the current user, no need to fork
+    # a chmod process.
+    mode = os.stat(path).st_mode
+    os.chmod(path, mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
@@ -18,6 +18,7 @@ import os
 from cloudify.exceptions import CommandExecutionException
 
 from cloudify_agent import VIRTUALENV
+from cloudify_agent import scheduler
 from cloudify_agent.api import defaults
 from cloudify_agent.api import utils
 from cloudify_agent.api import exceptions
@@ -126,7 +127,7 @@ class DetachedDaemon(CronRespawnDaemon):
         rendered = utils.render_template_to_file(
             template_path='pm/detach/detach.template',
             config_path=self.config_path,
-            queue=self.queue,
+            queues=self.get_consumed_queues(),
             name=self.name,
             log_level=self.log_level,
             log_file=self.get_logfile(),
@@ -134,6 +135,13 @@ class DetachedDaemon(CronRespawnDaemon):
             broker_url=self.broker_url,
             min_workers=self.min_workers,
             max_workers=self.max_workers,
+            pool_options=self.get_pool_options(),
+            logging_server=self.uses_logging_server(),
+            queue_max_workers=self.queue_max_workers,
+            workflow_max_workers=self.workflow_max_workers,
+            control_workers=self.control_workers,
+            deployment_weights=scheduler.format_weights(
+                self.deployment_weights),
             virtualenv_path=VIRTUALENV,
             workdir=self.workdir
         )
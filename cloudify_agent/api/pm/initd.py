@@ -14,14 +14,17 @@
 #  * limitations under the License.
 
 import os
+from distutils.spawn import find_executable
 
 from cloudify.exceptions import CommandExecutionException
 
 from cloudify_agent.api import utils
 from cloudify_agent.api import exceptions
 from cloudify_agent import VIRTUALENV
+from cloudify_agent import scheduler
 from cloudify_agent.api import defaults
 from cloudify_agent.api.pm.base import CronRespawnDaemon
+from cloudify_agent.api.pm.installation import FileInstallation
 
 
 class GenericLinuxDaemon(CronRespawnDaemon):
@@ -57,12 +60,20 @@ class GenericLinuxDaemon(CronRespawnDaemon):
 
     def configure(self):
 
+        # all privileged file operations are collected and applied by a
+        # single sudo invocation
+        installation = FileInstallation(self._runner, self._logger)
         self._logger.debug('Creating daemon script: {0}'
                            .format(self.script_path))
-        self._create_script()
+        self._create_script(installation)
         self._logger.debug('Creating daemon conf file: {0}'
                            .format(self.config_path))
-        self._create_config()
+        self._create_config(installation)
+        if self.start_on_boot:
+            self._logger.info('Creating start-on-boot entry')
+            for command in self._start_on_boot_handler.create_commands():
+                installation.add_command(command)
+        installation.apply(sudo=True)
 
         # Add the celery config
         self._logger.info('Deploying SSL cert (if defined).')
@@ -70,10 +81,6 @@ class GenericLinuxDaemon(CronRespawnDaemon):
         self._logger.info('Deploying celery configuration.')
         self._create_celery_conf()
 
-        if self.start_on_boot:
-            self._logger.info('Creating start-on-boot entry')
-            self._start_on_boot_handler.create()
-
     def delete(self, force=defaults.DAEMON_FORCE_DELETE):
         if self._is_agent_registered():
             if not force:
@@ -115,24 +122,20 @@ class GenericLinuxDaemon(CronRespawnDaemon):
             self._logger.debug(str(e))
             return False
 
-    def _create_script(self):
+    def _create_script(self, installation):
         self._logger.debug('Rendering init.d script from template')
         rendered = utils.render_template_to_file(
             template_path='pm/initd/initd.template',
             daemon_name=self.name,
             config_path=self.config_path
         )
-        self._runner.run('sudo mkdir -p {0}'.format(
-            os.path.dirname(self.script_path)))
-        self._runner.run('sudo cp {0} {1}'.format(rendered, self.script_path))
-        self._runner.run('sudo rm {0}'.format(rendered))
-        self._runner.run('sudo chmod +x {0}'.format(self.script_path))
+        installation.add_file(rendered, self.script_path, mode=0o755)
 
-    def _create_config(self):
+    def _create_config(self, installation):
         self._logger.debug('Rendering configuration script from template')
         rendered = utils.render_template_to_file(
             template_path='pm/initd/initd.conf.template',
-            queue=self.queue,
+            queues=self.get_consumed_queues(),
             workdir=self.workdir,
             manager_ip=self.manager_ip,
             manager_port=self.manager_port,
@@ -140,6 +143,13 @@ class GenericLinuxDaemon(CronRespawnDaemon):
             user=self.user,
             min_workers=self.min_workers,
             max_workers=self.max_workers,
+            pool_options=self.get_pool_options(),
+            logging_server=self.uses_logging_server(),
+            queue_max_workers=self.queue_max_workers,
+            workflow_max_workers=self.workflow_max_workers,
+            control_workers=self.control_workers,
+            deployment_weights=scheduler.format_weights(
+                self.deployment_weights),
             virtualenv_path=VIRTUALENV,
             extra_env_path=self.extra_env_path,
             name=self.name,
@@ -151,10 +161,7 @@ class GenericLinuxDaemon(CronRespawnDaemon):
             enable_cron_script=self.create_enable_cron_script(),
             disable_cron_script=self.create_disable_cron_script()
         )
-        self._runner.run('sudo mkdir -p {0}'.format(
-            os.path.dirname(self.config_path)))
-        self._runner.run('sudo cp {0} {1}'.format(rendered, self.config_path))
-        self._runner.run('sudo rm {0}'.format(rendered))
+        installation.add_file(rendered, self.config_path, mode=0o644)
 
 
 def start_command(daemon):
@@ -176,16 +183,14 @@ class _StartOnBootHandler(object):
         self._runner = runner
         self._distro = None
 
-    def create(self):
+    def create_commands(self):
         if self.distro == 'debian':
-            commands = ['sudo update-rc.d {0} defaults'.format(self._name)]
+            return ['update-rc.d {0} defaults'.format(self._name)]
         elif self.distro == 'rpm':
-            commands = ['sudo /sbin/chkconfig --add {0}'.format(self._name),
-                        'sudo /sbin/chkconfig {0} on'.format(self._name)]
+            return ['/sbin/chkconfig --add {0}'.format(self._name),
+                    '/sbin/chkconfig {0} on'.format(self._name)]
         else:
             raise RuntimeError('Illegal state')
-        for command in commands:
-            self._runner.run(command)
 
     def delete(self):
         if self.distro == 'debian':
@@ -199,11 +204,9 @@ class _StartOnBootHandler(object):
     @property
     def distro(self):
         if not self._distro:
-            if self._runner.run('which dpkg',
-                                exit_on_failure=False).return_code == 0:
+            if find_executable('dpkg'):
                 self._distro = 'debian'
-            elif self._runner.run('which rpm',
-                                  exit_on_failure=False).return_code == 0:
+            elif find_executable('rpm'):
                 self._distro = 'rpm'
             else:
                 raise exceptions.DaemonConfigurationError(
@@ -0,0 +1,187 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Batches file installations that require privileged permissions, so that
+they can be applied by a single invocation of this module (e.g a single
+sudo call) instead of a command per file operation.
+
+This module is also executed as a script, and therefore should only
+import modules from the standard library.
+
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BACKUP_SUFFIX = '.cfy-backup'
+
+
+class FileInstallation(object):
+
+    """
+    Collects files and commands into an installation plan. The plan is
+    applied transactionally by a single process: either all files are
+    installed and all commands succeed, or the previous state is restored.
+
+    :param runner: the command runner used to execute the helper process.
+    :param logger: a logger to be used to log various subsequent
+                   operations.
+    """
+
+    def __init__(self, runner, logger):
+        self._runner = runner
+        self._logger = logger
+        self.files = []
+        self.commands = []
+
+    def add_file(self, source, destination, mode=0o644):
+
+        """
+        Add a file to the plan. The source file is removed once the plan
+        has been applied.
+
+        :param source: path to a local file.
+        :param destination: absolute path the file will be installed to.
+        :param mode: permission bits of the installed file.
+        """
+
+        self.files.append({
+            'source': source,
+            'destination': destination,
+            'mode': mode
+        })
+
+    def add_command(self, command):
+
+        """
+        Add a command to execute after all files were installed.
+
+        :param command: the command line. it is executed without a shell.
+        """
+
+        self.commands.append(command)
+
+    def apply(self, sudo=True):
+
+        """
+        Apply the plan in a single helper process.
+
+        :param sudo: run the helper process under sudo.
+        """
+
+        if not self.files and not self.commands:
+            return
+        fd, plan_path = tempfile.mkstemp(suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'files': self.files,
+                           'commands': self.commands}, f)
+            self._logger.debug('Applying installation plan: {0} '
+                               '[files={1}, commands={2}]'
+                               .format(plan_path,
+                                       len(self.files),
+                                       len(self.commands)))
+            self._runner.run('{0}{1} {2} {3}'.format(
+                'sudo ' if sudo else '',
+                sys.executable,
+                '{0}.py'.format(os.path.splitext(__file__)[0]),
+                plan_path))
+        finally:
+            for path in [plan_path] + [f['source'] for f in self.files]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def apply_plan(plan):
+
+    """
+    Installs all files of the plan and executes its commands.
+    Every file is first staged next to its destination and then renamed
+    into place, so a destination is never observed partially written.
+    If any step fails, all destinations are restored to their previous
+    state.
+
+    :param plan: a dictionary with 'files' and 'commands' lists, as created
+                 by FileInstallation.
+    """
+
+    staged = []
+    installed = []
+    try:
+        for entry in plan.get('files', []):
+            staged.append((_stage(entry), entry['destination']))
+        while staged:
+            staged_path, destination = staged.pop(0)
+            backup = None
+            if os.path.exists(destination):
+                backup = '{0}{1}'.format(destination, BACKUP_SUFFIX)
+                if os.path.exists(backup):
+                    os.remove(backup)
+                os.link(destination, backup)
+            try:
+                os.rename(staged_path, destination)
+            except BaseException:
+                staged.insert(0, (staged_path, destination))
+                if backup:
+                    os.remove(backup)
+                raise
+            installed.append((destination, backup))
+        for command in plan.get('commands', []):
+            subprocess.check_call(command.split())
+    except BaseException:
+        _rollback(staged, installed)
+        raise
+    for _, backup in installed:
+        if backup:
+            os.remove(backup)
+
+
+def _stage(entry):
+    destination = entry['destination']
+    directory = os.path.dirname(destination)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, staged_path = tempfile.mkstemp(
+        dir=directory,
+        prefix='.{0}.'.format(os.path.basename(destination)))
+    os.close(fd)
+    try:
+        shutil.copyfile(entry['source'], staged_path)
+        os.chmod(staged_path, entry['mode'])
+    except BaseException:
+        os.remove(staged_path)
+        raise
+    return staged_path
+
+
+def _rollback(staged, installed):
+    for staged_path, _ in staged:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+    for destination, backup in reversed(installed):
+        if backup:
+            os.rename(backup, destination)
+        elif os.path.exists(destination):
+            os.remove(destination)
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1]) as plan_file:
+        apply_plan(json.load(plan_file))
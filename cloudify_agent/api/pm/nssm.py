@@ -18,6 +18,7 @@ import os
 from cloudify.exceptions import CommandExecutionException
 
 from cloudify_agent import VIRTUALENV
+from cloudify_agent import scheduler
 from cloudify_agent.api import defaults
 from cloudify_agent.api import exceptions
 from cloudify_agent.api import utils
@@ -85,7 +86,7 @@ class NonSuckingServiceManagerDaemon(Daemon):
         utils.render_template_to_file(
             template_path='pm/nssm/nssm.conf.template',
             file_path=self.config_path,
-            queue=self.queue,
+            queues=self.get_consumed_queues(),
             nssm_path=self.nssm_path,
             log_level=self.log_level,
             log_file=self.get_logfile(),
@@ -96,6 +97,13 @@ class NonSuckingServiceManagerDaemon(Daemon):
             broker_url=self.broker_url,
             min_workers=self.min_workers,
             max_workers=self.max_workers,
+            pool_options=self.get_pool_options(),
+            logging_server=self.uses_logging_server(),
+            queue_max_workers=self.queue_max_workers,
+            workflow_max_workers=self.workflow_max_workers,
+            control_workers=self.control_workers,
+            deployment_weights=scheduler.format_weights(
+                self.deployment_weights),
             virtualenv_path=VIRTUALENV,
             name=self.name,
             storage_dir=utils.internal.get_storage_directory(self.user),
@@ -175,6 +183,18 @@ class NonSuckingServiceManagerDaemon(Daemon):
         """
         return '{0}'
 
+    def get_pool_options(self):
+
+        """
+        Windows services are not autoscaled.
+
+        """
+
+        if self.pool == 'prefork':
+            return ['--concurrency={0}'.format(self.get_concurrency()),
+                    '-Ofair']
+        return super(NonSuckingServiceManagerDaemon, self).get_pool_options()
+
     def _create_env_string(self):
         env_string = ''
         if self.extra_env_path and os.path.exists(self.extra_env_path):
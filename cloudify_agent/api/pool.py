@@ -0,0 +1,241 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import json
+import uuid
+import subprocess
+
+import fasteners
+
+from cloudify.utils import setup_logger
+
+from cloudify_agent.api import defaults
+from cloudify_agent.api import utils
+from cloudify_agent.api.factory import DaemonFactory
+
+STANDBY_PREFIX = '{0}-standby-'.format(defaults.CLOUDIFY_AGENT_PREFIX)
+
+
+class DaemonPool(object):
+
+    """
+    Keeps a number of started daemons on the host that are not dedicated to
+    any queue yet (standby daemons). Claiming a standby daemon for a queue
+    only switches the queue it consumes from, so tasks sent to the queue
+    are processed right away instead of after the daemon was configured and
+    started. The pool is refilled in the background after every claim.
+
+    Standby daemons are regular daemons, named with the STANDBY_PREFIX and
+    stored by the DaemonFactory. A claimed daemon keeps its name.
+
+    When the pool is configured with more than one queue per daemon, claimed
+    daemons are consolidated: a claimed queue is added to the claimed daemon
+    serving the fewest queues, and a standby daemon is only claimed once all
+    claimed daemons are full. Since all deployments served by a daemon share
+    its worker processes, every deployment is limited to the
+    'queue_max_workers' tasks of the daemon.
+    """
+
+    def __init__(self, factory=None, logger=None):
+
+        """
+        :param factory: the factory the pool daemons are stored by.
+        :param logger: a logger to be used to log various subsequent
+                       operations.
+        """
+
+        self._factory = factory or DaemonFactory()
+        self._logger = logger or setup_logger('cloudify_agent.api.pool')
+        self._pool_dir = os.path.join(self._factory.storage, 'pool')
+        self._config_path = os.path.join(self._pool_dir, 'config.json')
+
+    def configure(self, size, queues_per_daemon=1, **attributes):
+
+        """
+        Set the pool size and the attributes standby daemons are
+        created with.
+
+        :param size: the number of standby daemons to keep.
+        :param queues_per_daemon: the maximum number of queues a claimed
+                                  daemon consumes from.
+        :param attributes: the daemon attributes, as passed to
+                           `DaemonFactory.new`. name and queue are generated
+                           for each standby daemon.
+        """
+
+        with self._lock():
+            with open(self._config_path, 'w') as f:
+                json.dump({'size': size,
+                           'queues_per_daemon': queues_per_daemon,
+                           'attributes': attributes}, f, indent=2)
+
+    def fill(self):
+
+        """
+        Create and start standby daemons until the pool is full.
+
+        :return: the created daemons.
+        :rtype: list
+        """
+
+        config = self._load_config()
+        if not config:
+            return []
+        created = []
+        with self._lock('fill'):
+            while len(self.standby()) < config['size']:
+                created.append(self._create_standby(config['attributes']))
+        return created
+
+    def standby(self):
+
+        """
+        :return: the daemons that were not claimed yet.
+        :rtype: list
+        """
+
+        return [daemon for daemon in self._pool_daemons()
+                if daemon.queue == daemon.name and not daemon.queues]
+
+    def find(self, queue):
+
+        """
+        Find the pool daemon that was claimed for a queue.
+
+        :param queue: the queue.
+
+        :return: the daemon, or None if no daemon was claimed for the queue.
+        """
+
+        for daemon in self._pool_daemons():
+            if queue in daemon.get_queues():
+                return daemon
+        return None
+
+    def claim(self, queue):
+
+        """
+        Dedicate a daemon to a queue, and refill the pool in the
+        background if a standby daemon was claimed.
+
+        :param queue: the queue the daemon should consume from.
+
+        :return: the claimed daemon, or None if no standby daemon
+                 is available.
+        """
+
+        config = self._load_config()
+        if not config:
+            return None
+        queues_per_daemon = config.get('queues_per_daemon', 1)
+        with self._lock():
+            daemon = self._consolidated(queues_per_daemon)
+            if daemon is None:
+                standby = self.standby()
+                if not standby:
+                    return None
+                daemon = standby[0]
+            was_standby = not daemon.queues
+            if queues_per_daemon > 1:
+                daemon.add_queue(queue)
+            else:
+                daemon.consume(queue)
+            self._logger.info('Daemon {0} claimed for queue {1}'
+                              .format(daemon.name, queue))
+            self._factory.save(daemon)
+        if was_standby:
+            self.refill()
+
+        # the daemon files do not refer to the new queue yet, so that is
+        # fixed after the daemon is already consuming from it.
+        daemon.configure()
+        return daemon
+
+    def release(self, queue):
+
+        """
+        Stop consuming from a queue that was added to a consolidated
+        daemon. A daemon that is left without claimed queues becomes a
+        standby daemon again.
+
+        :param queue: the queue.
+
+        :return: whether the queue was released. False if the queue is
+                 the main queue of its daemon, in which case the daemon
+                 should be deleted instead.
+        """
+
+        with self._lock():
+            daemon = self.find(queue)
+            if daemon is None or queue == daemon.queue:
+                return False
+            daemon.remove_queue(queue)
+            self._logger.info('Daemon {0} released queue {1}'
+                              .format(daemon.name, queue))
+            self._factory.save(daemon)
+        daemon.configure()
+        return True
+
+    def refill(self):
+
+        """
+        Fill the pool in a detached background process.
+        """
+
+        with open(os.devnull, 'w') as devnull:
+            subprocess.Popen(
+                [utils.get_cfy_agent_path(), 'daemons', 'pool', '--fill'],
+                stdout=devnull,
+                stderr=devnull,
+                close_fds=os.name != 'nt')
+
+    def _create_standby(self, attributes):
+        attributes = dict(attributes)
+        attributes['name'] = '{0}{1}'.format(STANDBY_PREFIX, uuid.uuid4())
+        attributes['queue'] = attributes['name']
+        daemon = self._factory.new(logger=self._logger, **attributes)
+        daemon.create()
+        daemon.configure()
+        daemon.start()
+        self._logger.debug('Started standby daemon {0}'.format(daemon.name))
+        # only saved once started, so it can not be claimed before
+        self._factory.save(daemon)
+        return daemon
+
+    def _consolidated(self, queues_per_daemon):
+        daemons = [daemon for daemon in self._pool_daemons()
+                   if 0 < len(daemon.queues) < queues_per_daemon]
+        if not daemons:
+            return None
+        return min(daemons, key=lambda daemon: len(daemon.queues))
+
+    def _pool_daemons(self):
+        if not os.path.isdir(self._pool_dir):
+            return []
+        return [daemon for daemon in
+                self._factory.load_all(logger=self._logger)
+                if daemon.name.startswith(STANDBY_PREFIX)]
+
+    def _load_config(self):
+        if not os.path.exists(self._config_path):
+            return None
+        return utils.json_load(self._config_path)
+
+    def _lock(self, name='pool'):
+        if not os.path.isdir(self._pool_dir):
+            os.makedirs(self._pool_dir)
+        return fasteners.InterProcessLock(
+            os.path.join(self._pool_dir, '{0}.lock'.format(name)))
@@ -0,0 +1,248 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Shared manager REST clients. Clients are kept per manager for the lifetime
+of the process and send their requests through a keep-alive session.
+GET requests for resources that rarely change are coalesced and cached
+for a short time.
+"""
+
+import copy
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import requests
+
+from cloudify import utils as cloudify_utils
+from cloudify_rest_client import CloudifyClient
+from cloudify_rest_client.client import HTTPClient
+
+from cloudify_agent.api import defaults
+
+# uris of GET requests that are cached for REST_CACHE_TTL seconds.
+CACHED_URIS = ['/manager/context', '/manager/version', '/plugins']
+
+_clients = {}
+_clients_lock = threading.Lock()
+_hosts = {}
+_hosts_lock = threading.Lock()
+_stats = threading.local()
+
+
+class _CachedRequest(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.expires = None
+        self.value = None
+        self.error = None
+
+
+class _SessionHTTPClient(HTTPClient):
+
+    @classmethod
+    def wrap(cls, http_client):
+        # the http client is created by the CloudifyClient constructor
+        # and shared by all its resource clients, so it is converted
+        # in place.
+        http_client.__class__ = cls
+        http_client._session = requests.Session()
+        http_client._cache = {}
+        http_client._cache_lock = threading.Lock()
+        return http_client
+
+    def _do_request(self, requests_method, request_url, body, params, headers,
+                    expected_status_code, stream, verify):
+        method = getattr(self._session, requests_method.__name__)
+        uri = request_url[len(self.url):]
+        if requests_method is not requests.get:
+            self.clear_cache()
+        elif not stream and body is None and uri.split('?')[0] in CACHED_URIS:
+            key = (request_url,
+                   tuple(sorted(params.items())),
+                   tuple(sorted(headers.items())))
+            return self._cached_request(
+                key, lambda: self._send(method, request_url, body, params,
+                                        headers, expected_status_code,
+                                        stream, verify))
+        return self._send(method, request_url, body, params, headers,
+                          expected_status_code, stream, verify)
+
+    def _send(self, method, request_url, body, params, headers,
+              expected_status_code, stream, verify):
+        _count('sent')
+        return super(_SessionHTTPClient, self)._do_request(
+            method, request_url, body, params, headers,
+            expected_status_code, stream, verify)
+
+    def _cached_request(self, key, send):
+        with self._cache_lock:
+            request = self._cache.get(key)
+            if request and request.expires and request.expires < time.time():
+                request = None
+            owner = request is None
+            if owner:
+                request = self._cache[key] = _CachedRequest()
+        if owner:
+            try:
+                request.value = send()
+            except Exception as e:
+                request.error = e
+                with self._cache_lock:
+                    if self._cache.get(key) is request:
+                        del self._cache[key]
+                raise
+            finally:
+                request.expires = time.time() + defaults.REST_CACHE_TTL
+                request.done.set()
+        else:
+            # an identical request is either in flight or cached
+            _count('cached')
+            request.done.wait()
+            if request.error:
+                raise request.error
+        return copy.deepcopy(request.value)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+
+def get_client(host=None, port=None):
+
+    """
+    Get the shared REST client of a manager.
+
+    :param host: the manager host. defaults to the manager of the
+                 current process.
+    :param port: the manager REST port. defaults to the manager REST port
+                 of the current process.
+
+    :return: a REST client using a keep-alive session.
+    :rtype: cloudify_rest_client.CloudifyClient
+    """
+
+    host = host or cloudify_utils.get_manager_ip()
+    port = port or cloudify_utils.get_manager_rest_service_port()
+    headers = None
+    if cloudify_utils.get_is_bypass_maintenance():
+        headers = {'X-BYPASS-MAINTENANCE': 'True'}
+    key = (host, str(port), bool(headers))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = CloudifyClient(host, port, headers=headers)
+            _SessionHTTPClient.wrap(client._client)
+            _clients[key] = client
+    return client
+
+
+def clear_clients():
+
+    """
+    Close the sessions of all shared clients and drop their caches.
+    """
+
+    with _clients_lock:
+        for client in _clients.values():
+            client._client._session.close()
+        _clients.clear()
+    with _hosts_lock:
+        _hosts.clear()
+
+
+def get_deployment_hosts(deployment_id, host=None, port=None):
+
+    """
+    Get the compute node instances of a deployment, keyed by their ip.
+    Node instances are listed page by page, and only the fields needed
+    to identify a host and its agent are retrieved. The result is cached
+    per deployment for REST_CACHE_TTL seconds.
+
+    :param deployment_id: the deployment id.
+    :param host: the manager host.
+    :param port: the manager REST port.
+
+    :return: a dictionary mapping each ip to a list of the node instances
+             with that ip. every node instance is a dictionary with the
+             'id' and 'runtime_properties' keys, where the runtime
+             properties only contain the 'ip' and 'cloudify_agent' keys.
+    :rtype: dict
+    """
+
+    client = get_client(host, port)
+    key = (id(client), deployment_id)
+    with _hosts_lock:
+        cached = _hosts.get(key)
+    if cached and cached[0] > time.time():
+        return cached[1]
+    hosts = {}
+    offset = 0
+    while True:
+        node_instances = client.node_instances.list(
+            deployment_id=deployment_id,
+            _include=['id', 'host_id', 'runtime_properties'],
+            _offset=offset,
+            _size=defaults.NODE_INSTANCES_PAGE_SIZE)
+        for node_instance in node_instances:
+            if node_instance.host_id != node_instance.id:
+                # not a compute node instance
+                continue
+            runtime_properties = node_instance.runtime_properties or {}
+            ip = runtime_properties.get('ip')
+            hosts.setdefault(ip, []).append({
+                'id': node_instance.id,
+                'runtime_properties': {
+                    'ip': ip,
+                    'cloudify_agent': runtime_properties.get(
+                        'cloudify_agent')
+                }
+            })
+        offset += len(node_instances)
+        if (not node_instances or
+                offset >= node_instances.metadata.pagination.total):
+            break
+    with _hosts_lock:
+        _hosts[key] = (time.time() + defaults.REST_CACHE_TTL, hosts)
+    return hosts
+
+
+@contextmanager
+def count_requests():
+
+    """
+    Count the REST requests made by the current thread within the context.
+    The yielded counter holds the number of 'sent' requests and the number
+    of requests answered from the cache or by an identical in-flight
+    request ('cached').
+    """
+
+    previous = getattr(_stats, 'counter', None)
+    _stats.counter = Counter()
+    try:
+        yield _stats.counter
+    finally:
+        if previous is not None:
+            previous.update(_stats.counter)
+        _stats.counter = previous
+
+
+def _count(name):
+    counter = getattr(_stats, 'counter', None)
+    if counter is not None:
+        counter[name] += 1
@@ -15,21 +15,25 @@
 
 import uuid
 import json
+import time
 import copy
 import tempfile
 import os
 import getpass
 import pkg_resources
-from jinja2 import Template
+
+import fasteners
+from jinja2 import Environment
+from jinja2 import FileSystemBytecodeCache
+from jinja2 import PackageLoader
 
 from cloudify.context import BootstrapContext
 from cloudify.utils import setup_logger
 
-from cloudify_rest_client import CloudifyClient
-
 import cloudify_agent
 from cloudify_agent import VIRTUALENV
 from cloudify_agent.api import defaults
+from cloudify_agent.api import rest
 
 logger = setup_logger('cloudify_agent.api.utils')
 
@@ -158,12 +162,59 @@ class _Internal(object):
                 result.pop(attr)
         return result
 
+    @classmethod
+    def get_broker_configuration(cls, agent):
+
+        """
+        Retrieve the broker configuration from the manager of the agent.
+        The configuration is stored under the storage directory for
+        BROKER_CONFIG_TTL seconds, and is shared by all processes creating
+        daemons on this host. Only a single process fetches an expired
+        configuration, while the others wait for it and use its result.
+
+        :param agent: the agent, must contain 'manager_ip' and
+                      'manager_port'.
+
+        :return: the broker configuration attributes.
+        :rtype: dict
+        """
+
+        try:
+            # stored in a sub directory, since json files directly under the
+            # storage directory are daemons.
+            cache_dir = os.path.join(cls.get_storage_directory(), 'cache')
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+        except (OSError, IOError, KeyError):
+            return cls._fetch_broker_configuration(agent)
+        path = os.path.join(cache_dir, 'broker-config-{0}-{1}.json'.format(
+            agent['manager_ip'], agent['manager_port']))
+        with fasteners.InterProcessLock('{0}.lock'.format(path)):
+            cached = cls._read_broker_configuration(path)
+            if cached and cached['expires'] > time.time():
+                return cached['broker_config']
+            attributes = cls._fetch_broker_configuration(agent)
+            try:
+                with open(path, 'w') as f:
+                    json.dump({
+                        'expires': time.time() + defaults.BROKER_CONFIG_TTL,
+                        'broker_config': attributes
+                    }, f)
+            except (OSError, IOError):
+                pass
+            return attributes
+
     @staticmethod
-    def get_broker_configuration(agent):
-        client = CloudifyClient(
-            agent['manager_ip'],
-            agent['manager_port'],
-        )
+    def _read_broker_configuration(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, IOError, ValueError):
+            return None
+
+    @staticmethod
+    def _fetch_broker_configuration(agent):
+        client = rest.get_client(agent['manager_ip'], agent['manager_port'])
         bootstrap_context_dict = client.manager.get_context()
         bootstrap_context_dict = bootstrap_context_dict['context']['cloudify']
         bootstrap_context = BootstrapContext(bootstrap_context_dict)
@@ -226,11 +277,31 @@ def get_agent_registered(name, celery_client):
 
     """
 
-    destination = 'celery@{0}'.format(name)
+    return get_agents_registered([name], celery_client)[name]
+
+
+def get_agents_registered(names, celery_client):
+
+    """
+    Query for the registered tasks of many agents using a single
+    broadcast. The query returns as soon as all agents have replied.
+
+    :param names: the agent names
+    :param celery_client: the celery client to use
+
+    :return: agents registered tasks, keyed by agent name. agents that did
+             not reply are mapped to None.
+    :rtype: dict
+
+    """
+
+    destinations = ['celery@{0}'.format(name) for name in names]
     inspect = celery_client.control.inspect(
-        destination=[destination])
-    registered = (inspect.registered() or {}).get(destination)
-    return registered
+        destination=destinations,
+        limit=len(destinations))
+    registered = inspect.registered() or {}
+    return dict((name, registered.get(destination))
+                for name, destination in zip(names, destinations))
 
 
 def get_windows_home_dir(username):
@@ -273,9 +344,103 @@ def render_template_to_file(template_path, file_path=None, **values):
     :param values: keyword arguments passed to jinja.
     """
 
-    template = get_resource(template_path)
-    rendered = Template(template).render(**values)
-    return content_to_file(rendered, file_path)
+    template = get_template(template_path)
+    if not file_path:
+        file_path = tempfile.NamedTemporaryFile(mode='w', delete=False).name
+    with open(file_path, 'w') as f:
+        template.stream(**values).dump(f)
+        f.write(os.linesep)
+    return file_path
+
+
+def get_template(template_path):
+
+    """
+    Loads a 'jinja' template resource. Templates are compiled only once per
+    process, subsequent calls return the cached template.
+
+    :param template_path: relative path to the template.
+    """
+
+    # jinja template names are always '/' separated
+    template_path = template_path.replace('\\', '/')
+    return _get_template_environment().get_template(template_path)
+
+
+_template_environment = None
+
+
+def _get_template_environment():
+    global _template_environment
+    if _template_environment is None:
+        _template_environment = Environment(
+            loader=PackageLoader(cloudify_agent.__name__, 'resources'),
+            bytecode_cache=_create_bytecode_cache(),
+            # resources are part of the installed package and never
+            # change while the process is running
+            auto_reload=False)
+    return _template_environment
+
+
+def _create_bytecode_cache():
+
+    """
+    Creates a bytecode cache under the storage directory, so that
+    subsequent cfy-agent invocations do not need to re-compile the
+    templates. Returns None if the cache directory cannot be created.
+    """
+
+    try:
+        cache_dir = os.path.join(internal.get_storage_directory(),
+                                 'templates')
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+    except (OSError, IOError, KeyError) as e:
+        logger.debug('Not using a template bytecode cache: {0}'.format(e))
+        return None
+    return _TemplateBytecodeCache(cache_dir)
+
+
+class _TemplateBytecodeCache(FileSystemBytecodeCache):
+
+    """
+    Bytecode cache that never fails the rendering. The storage directory
+    may be shared by processes running under different users (e.g sudo),
+    so failing to read or write a cache entry just means compiling the
+    template from source.
+
+    Entries are written aside and renamed into place, so processes that
+    render at the same time never read a partially written entry.
+    """
+
+    def load_bytecode(self, bucket):
+        try:
+            super(_TemplateBytecodeCache, self).load_bytecode(bucket)
+        except Exception:
+            # e.g an entry left truncated by a process that was killed
+            bucket.reset()
+
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        try:
+            fd, temp_path = tempfile.mkstemp(
+                dir=self.directory,
+                prefix='{0}.'.format(os.path.basename(filename)),
+                suffix='.tmp')
+        except (OSError, IOError):
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            os.rename(temp_path, filename)
+        except (OSError, IOError):
+            pass
+        finally:
+            if os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
 
 
 def resource_to_tempfile(resource_path):
@@ -21,15 +21,18 @@ import os
 import sys
 import traceback
 import logging
-import logging.handlers
+import threading
 
 from celery import Celery, signals
+from celery.bin import Option
 from celery.utils.log import ColorFormatter
 from celery.worker.loops import asynloop
 
 from cloudify.celery import gate_keeper
 from cloudify.celery import logging_server
 
+from cloudify_agent import logs
+from cloudify_agent import scheduler
 from cloudify_agent.api import utils
 
 LOGFILE_SIZE_BYTES = 5 * 1024 * 1024
@@ -41,11 +44,14 @@ def setup_logging_handler(loglevel, logfile, format, colorize, **kwargs):
     if logfile:
         if os.name == 'nt':
             logfile = logfile.format(os.getpid())
-        handler = logging.handlers.RotatingFileHandler(
+        # records are written by a background thread, see
+        # cloudify_agent.logs
+        file_handler = logs.CompressingRotatingFileHandler(
             logfile,
             maxBytes=LOGFILE_SIZE_BYTES,
             backupCount=LOGFILE_BACKUP_COUNT)
-        handler.setFormatter(logging.Formatter(fmt=format))
+        file_handler.setFormatter(logging.Formatter(fmt=format))
+        handler = logs.QueueHandler(file_handler)
     else:
         handler = logging.StreamHandler(sys.stdout)
         handler.setFormatter(ColorFormatter(fmt=format, use_color=colorize))
@@ -56,6 +62,14 @@ def setup_logging_handler(loglevel, logfile, format, colorize, **kwargs):
     logger.setLevel(loglevel)
 
 
+@signals.worker_process_shutdown.connect
+def flush_logging_handlers(**kwargs):
+    # pool processes exit without running the atexit hook of the logging
+    # module, so records still queued for writing are flushed here.
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+
+
 @signals.worker_process_init.connect
 def declare_fork(**kwargs):
     try:
@@ -80,13 +94,143 @@ def reset_worker_tasks_state(sender, *args, **kwargs):
             pass
     sender.hub.call_soon(callback=callback)
 
+
+class FairGateKeeper(gate_keeper.GateKeeper):
+
+    """
+    Gate keeper that limits the tasks run concurrently by the worker, and
+    dispatches tasks fairly between deployments once the limit is reached.
+    See cloudify_agent.scheduler. Workers that do not run a process pool
+    also use it to execute every task in a subprocess.
+    """
+
+    def __init__(self, worker,
+                 gate_keeper_workflow_bucket_size=0,
+                 gate_keeper_capacity=0,
+                 gate_keeper_weights=None,
+                 gate_keeper_isolate_tasks=False,
+                 gate_keeper_control_slots=0, **kwargs):
+        super(FairGateKeeper, self).__init__(worker, **kwargs)
+        self.isolate_tasks = gate_keeper_isolate_tasks
+        self._scheduler = scheduler.FairScheduler(
+            capacity=gate_keeper_capacity,
+            bucket_size=self.bucket_size,
+            workflow_bucket_size=gate_keeper_workflow_bucket_size,
+            weights=scheduler.parse_weights(gate_keeper_weights),
+            control_slots=gate_keeper_control_slots)
+
+    def info(self, worker):
+        info = super(FairGateKeeper, self).info(worker)
+        with self._lock:
+            info['gate_keeper'].update({
+                'capacity': self._scheduler.capacity,
+                'workflow_bucket_size': self._scheduler.workflow_bucket_size,
+                'isolate_tasks': self.isolate_tasks,
+                'control_slots': self._scheduler.control_slots,
+                'buckets': self._scheduler.stats()
+            })
+        return info
+
+    def task_received(self, request, handler, socket_url=None):
+        if self.isolate_tasks:
+            self._isolate_task(request)
+        if not self.enabled:
+            handler()
+            return
+        bucket_key = self._extract_bucket_key_and_augment_request(
+            request, socket_url)
+        if self._scheduler.control_slots and self._is_control_task(request):
+            bucket_key = scheduler.CONTROL_BUCKET
+        self._patch_request(bucket_key, request)
+        with self._lock:
+            ready = self._scheduler.submit(bucket_key, handler)
+        # handlers are not called while holding the lock
+        for ready_handler in ready:
+            ready_handler()
+
+    def task_ended(self, bucket_key):
+        with self._lock:
+            ready = self._scheduler.done(bucket_key)
+        for ready_handler in ready:
+            ready_handler()
+
+    @staticmethod
+    def _is_control_task(request):
+        cloudify_context = request.kwargs['__cloudify_context']
+        return scheduler.is_control_task(
+            cloudify_context.get('task_name'),
+            request.delivery_info.get('routing_key'))
+
+    @staticmethod
+    def _isolate_task(request):
+        # tasks without a target are executed by the worker process itself,
+        # which a threads pool shares between all the tasks it runs. such
+        # tasks are dispatched to a subprocess, like tasks with a target.
+        cloudify_context = request.kwargs['__cloudify_context']
+        if not cloudify_context.get('task_target'):
+            cloudify_context['task_target'] = (
+                request.delivery_info.get('routing_key') or request.hostname)
+
+    def _patch_request(self, bucket_key, request):
+        # a task that failed to be processed (e.g its worker process was
+        # lost) must also free its place, otherwise the worker would stop
+        # dispatching tasks once its capacity is taken. on_success may call
+        # on_failure, so the task is only ended once.
+        ended = threading.Event()
+        task_ended = self.task_ended
+
+        def patch(name):
+            original = getattr(request, name)
+
+            def patched(*args, **kwargs):
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    if not ended.is_set():
+                        ended.set()
+                        task_ended(bucket_key)
+            setattr(request, name, patched)
+        patch('on_success')
+        patch('on_failure')
+
+
+def configure_gate_keeper(app):
+    gate_keeper.configure_app(app)
+    app.user_options['worker'].add(
+        Option('--gate-keeper-workflow-bucket-size', action='store',
+               type='int', default=0,
+               help='The gate keeper bucket size of workflows. defaults '
+                    'to the gate keeper bucket size'))
+    app.user_options['worker'].add(
+        Option('--gate-keeper-capacity', action='store',
+               type='int', default=0,
+               help='The number of tasks the gate keeper lets run '
+                    'concurrently. 0 means no limit'))
+    app.user_options['worker'].add(
+        Option('--gate-keeper-weights', action='store', default='',
+               help='Weights of gate keeper buckets, given as '
+                    'key:weight,key:weight'))
+    app.user_options['worker'].add(
+        Option('--gate-keeper-isolate-tasks', action='store_true',
+               default=False,
+               help='Execute every task in a subprocess'))
+    app.user_options['worker'].add(
+        Option('--gate-keeper-control-slots', action='store',
+               type='int', default=0,
+               help='The number of control tasks the gate keeper lets run '
+                    'in addition to its capacity'))
+    app.steps['worker'].discard(gate_keeper.GateKeeper)
+    app.steps['worker'].add(FairGateKeeper)
+
 # This attribute is used as the celery App instance.
 # it is referenced in two ways:
 #   1. Celery command line --app options.
 #   2. cloudify.dispatch.dispatch uses it as the 'task' decorator.
 # For app configuration, see cloudify.broker_config.
 app = Celery()
-gate_keeper.configure_app(app)
+# allows restarting the pool processes of a running worker
+app.add_defaults({'CELERYD_POOL_RESTARTS': True})
+configure_gate_keeper(app)
 logging_server.configure_app(app)
 
 try:
@@ -14,17 +14,27 @@
 #  * limitations under the License.
 
 import os
+import json
+import time
+import hashlib
 import tempfile
 import shutil
 import urllib
 import copy
 
 from cloudify.utils import setup_logger
-from cloudify.utils import LocalCommandRunner
+from cloudify.exceptions import CommandExecutionException
 
+from cloudify_agent import scheduler
 from cloudify_agent.api import utils
+from cloudify_agent.installer import exceptions
+from cloudify_agent.installer.runners.local_runner import LocalRunner
 from cloudify_agent.shell import env
 
+# written to the agent directory once a package was installed, to identify
+# the installed package.
+PACKAGE_MANIFEST = '.cfy-agent-package.json'
+
 
 class AgentInstaller(object):
 
@@ -41,14 +51,11 @@ class AgentInstaller(object):
     def run_agent_command(self, command, execution_env=None):
         if execution_env is None:
             execution_env = {}
-        response = self.runner.run(
+        # the output is logged line by line while the command runs
+        return self.runner.run(
             command='{0} {1}'.format(self.cfy_agent_path, command),
-            execution_env=execution_env)
-        output = response.std_out
-        if output:
-            for line in output.splitlines():
-                self.logger.info(line)
-        return response
+            execution_env=execution_env,
+            output_callback=self.logger.info)
 
     def run_daemon_command(self, command,
                            execution_env=None):
@@ -120,16 +127,63 @@ class AgentInstaller(object):
 
     def _from_package(self):
 
+        package_dir = self._package_dir()
+        manifest = self._package_manifest()
+        if manifest and self._installed_package_manifest() == manifest:
+            self.logger.info('Agent package is already installed in {0}'
+                             .format(package_dir))
+            return
+
         self.logger.info('Downloading Agent Package from {0}'.format(
             self.cloudify_agent['package_url']
         ))
-        package_path = self.download(
-            url=self.cloudify_agent['package_url'])
-        self.logger.info('Untaring Agent package...')
-        self.extract(archive=package_path,
-                     destination=self.cloudify_agent['agent_dir'])
+        started = time.time()
+        self.download_and_extract(
+            url=self.cloudify_agent['package_url'],
+            destination=package_dir)
+        self.logger.info('Agent package installed in {0:.2f} seconds'
+                         .format(time.time() - started))
 
         self.run_agent_command('configure {0}'.format(self._configure_flags()))
+        if manifest:
+            self.write_file(self._package_manifest_path(),
+                            json.dumps(manifest))
+
+    def _package_dir(self):
+        # a shared runtime is extracted once per host and package, and used
+        # by all agents on the host that were installed from that package.
+        return (self.cloudify_agent.get('runtime_dir') or
+                self.cloudify_agent['agent_dir'])
+
+    def _package_manifest(self):
+        # the package can only be identified by its checksum or by the
+        # agent version, unless it is installed into a shared runtime that
+        # was named after the package.
+        checksum = self.cloudify_agent.get('package_checksum')
+        version = self.cloudify_agent.get('version')
+        if not checksum and not version and \
+                not self.cloudify_agent.get('runtime_dir'):
+            return None
+        return {
+            'package_url': self.cloudify_agent['package_url'],
+            'package_checksum': checksum,
+            'version': version,
+            'envdir': self.cloudify_agent['envdir']
+        }
+
+    def _installed_package_manifest(self):
+        content = self.read_file(self._package_manifest_path())
+        try:
+            return json.loads(content) if content else None
+        except ValueError:
+            return None
+
+    def _package_manifest_path(self):
+        separator = '\\' if self.cloudify_agent['windows'] else '/'
+        return '{0}{1}{2}'.format(
+            self._package_dir().rstrip(separator),
+            separator,
+            PACKAGE_MANIFEST)
 
     def _configure_flags(self):
         flags = ''
@@ -142,9 +196,26 @@ class AgentInstaller(object):
     def download(self, url, destination=None):
         raise NotImplementedError('Must be implemented by sub-class')
 
+    def download_and_extract(self, url, destination):
+        package_path = self.download(url=url)
+        self.logger.info('Untaring Agent package...')
+        self.extract(archive=package_path, destination=destination)
+
     def move(self, source, target):
         raise NotImplementedError('Must be implemented by sub-class')
 
+    def read_file(self, path):
+
+        """
+        :return: the content of a file on the target, or None if the file
+                 does not exist.
+        """
+
+        raise NotImplementedError('Must be implemented by sub-class')
+
+    def write_file(self, path, content):
+        raise NotImplementedError('Must be implemented by sub-class')
+
     def extract(self, archive, destination):
         raise NotImplementedError('Must be implemented by sub-class')
 
@@ -185,6 +256,15 @@ class AgentInstaller(object):
                 'max_workers'),
             env.CLOUDIFY_DAEMON_MIN_WORKERS: self.cloudify_agent.get(
                 'min_workers'),
+            env.CLOUDIFY_DAEMON_CONTROL_WORKERS: self.cloudify_agent.get(
+                'control_workers'),
+            env.CLOUDIFY_DAEMON_POOL: self.cloudify_agent.get('pool'),
+            env.CLOUDIFY_DAEMON_QUEUE_MAX_WORKERS: self.cloudify_agent.get(
+                'queue_max_workers'),
+            env.CLOUDIFY_DAEMON_WORKFLOW_MAX_WORKERS: self.cloudify_agent.get(
+                'workflow_max_workers'),
+            env.CLOUDIFY_DAEMON_DEPLOYMENT_WEIGHTS: scheduler.format_weights(
+                self.cloudify_agent.get('deployment_weights')) or None,
             env.CLOUDIFY_DAEMON_PROCESS_MANAGEMENT:
             self.cloudify_agent['process_management']['name'],
             env.CLOUDIFY_DAEMON_WORKDIR: self.cloudify_agent['workdir'],
@@ -278,7 +358,7 @@ class LocalInstallerMixin(AgentInstaller):
 
     @property
     def runner(self):
-        return LocalCommandRunner(logger=self.logger)
+        return LocalRunner(logger=self.logger)
 
     def download(self, url, destination=None):
         if destination is None:
@@ -288,6 +368,14 @@ class LocalInstallerMixin(AgentInstaller):
         urllib.urlretrieve(url, destination)
         return destination
 
+    def download_and_extract(self, url, destination):
+        package_path = self.download(url=url)
+        checksum = self.cloudify_agent.get('package_checksum')
+        if checksum:
+            _verify_checksum(package_path, checksum)
+        self.logger.info('Untaring Agent package...')
+        self.extract(archive=package_path, destination=destination)
+
     def delete_agent(self):
         self.run_daemon_command('delete')
         shutil.rmtree(self.cloudify_agent['agent_dir'])
@@ -301,6 +389,16 @@ class LocalInstallerMixin(AgentInstaller):
     def move(self, source, target):
         shutil.move(source, target)
 
+    def read_file(self, path):
+        if not os.path.isfile(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+    def write_file(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
 
 class RemoteInstallerMixin(AgentInstaller):
 
@@ -317,3 +415,30 @@ class RemoteInstallerMixin(AgentInstaller):
 
     def move(self, source, target):
         self.runner.move(source, target)
+
+    def read_file(self, path):
+        command = 'type' if self.cloudify_agent['windows'] else 'cat'
+        try:
+            return self.runner.run('{0} {1}'.format(command, path)).std_out
+        except CommandExecutionException:
+            return None
+
+    def write_file(self, path, content):
+        fd, source = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+            self.runner.put_file(src=source, dst=path)
+        finally:
+            os.remove(source)
+
+
+def _verify_checksum(path, checksum):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    if sha256.hexdigest() != checksum.lower():
+        raise exceptions.AgentInstallerConfigurationError(
+            'Checksum mismatch for {0}: expected {1}, got {2}'
+            .format(path, checksum, sha256.hexdigest()))
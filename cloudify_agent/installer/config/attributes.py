@@ -86,6 +86,21 @@ AGENT_ATTRIBUTES = {
         'group': 'cfy-agent',
         'default': 5
     },
+    'control_workers': {
+        'group': 'cfy-agent'
+    },
+    'pool': {
+        'group': 'cfy-agent'
+    },
+    'queue_max_workers': {
+        'group': 'cfy-agent'
+    },
+    'workflow_max_workers': {
+        'group': 'cfy-agent'
+    },
+    'deployment_weights': {
+        'group': 'cfy-agent'
+    },
     'broker_get_settings_from_manager': {
         'group': 'cfy-agent',
         'default': True,
@@ -114,6 +129,12 @@ AGENT_ATTRIBUTES = {
     'envdir': {
         'group': 'installation'
     },
+    'shared_env': {
+        'group': 'installation'
+    },
+    'runtime_dir': {
+        'group': 'installation'
+    },
     'requirements': {
         'group': 'installation'
     },
@@ -126,6 +147,9 @@ AGENT_ATTRIBUTES = {
     'package_url': {
         'group': 'installation'
     },
+    'package_checksum': {
+        'group': 'installation'
+    },
     'source_url': {
         'group': 'installation'
     }
@@ -14,6 +14,7 @@
 #  * limitations under the License.
 
 import getpass
+import hashlib
 import os
 import platform
 
@@ -24,9 +25,11 @@ from cloudify.utils import get_manager_ip
 from cloudify.utils import get_manager_file_server_url
 
 from cloudify import utils as cloudify_utils
+from cloudify_agent.api import defaults
 from cloudify_agent.api import utils
 from cloudify_agent.installer import exceptions
 from cloudify_agent.installer.config.decorators import group
+from cloudify_agent.installer.config.decorators import configuration_layers
 from cloudify_agent.installer.config.attributes import raise_missing_attribute
 from cloudify_agent.installer.config.attributes import raise_missing_attributes
 
@@ -36,8 +39,9 @@ def prepare_connection(cloudify_agent):
 
 
 def prepare_agent(cloudify_agent, runner):
-    cfy_agent_attributes(cloudify_agent)
-    installation_attributes(cloudify_agent, runner)
+    with configuration_layers():
+        cfy_agent_attributes(cloudify_agent)
+        installation_attributes(cloudify_agent, runner)
 
 
 @group('connection')
@@ -184,8 +188,20 @@ def directory_attributes(cloudify_agent):
             workdir = os.path.join(agent_dir, 'work')
         cloudify_agent['workdir'] = workdir
 
+    if (not cloudify_agent.get('runtime_dir') and
+            cloudify_agent.get('shared_env') and
+            cloudify_agent.get('package_url') and
+            not cloudify_agent['windows']):
+        cloudify_agent['runtime_dir'] = os.path.join(
+            cloudify_agent['basedir'],
+            '{0}-runtime-{1}'.format(defaults.CLOUDIFY_AGENT_PREFIX,
+                                     _package_key(cloudify_agent)))
+
     if not cloudify_agent.get('envdir'):
-        agent_dir = cloudify_agent['agent_dir']
+        # agents using a shared runtime only keep their work directory
+        # in the agent directory
+        agent_dir = (cloudify_agent.get('runtime_dir') or
+                     cloudify_agent['agent_dir'])
         if cloudify_agent['windows']:
             envdir = '{0}\\{1}'.format(agent_dir, 'env')
         else:
@@ -193,6 +209,14 @@ def directory_attributes(cloudify_agent):
         cloudify_agent['envdir'] = envdir
 
 
+def _package_key(cloudify_agent):
+    # every package gets its own runtime, so agents of different versions
+    # never share an env.
+    package = '|'.join(str(cloudify_agent.get(key) or '') for key in
+                       ['package_url', 'package_checksum', 'version'])
+    return hashlib.sha1(package).hexdigest()[:12]
+
+
 @group('installation')
 def _add_installation_defaults(cloudify_agent):
     pass
@@ -204,11 +228,12 @@ def _add_cfy_agent_defaults(cloudify_agent):
 
 
 def reinstallation_attributes(cloudify_agent):
-    _cfy_agent_attributes_no_defaults(cloudify_agent)
-    _add_cfy_agent_defaults(cloudify_agent)
-    if cloudify_agent.get('basedir'):
-        directory_attributes(cloudify_agent)
-    _add_installation_defaults(cloudify_agent)
+    with configuration_layers():
+        _cfy_agent_attributes_no_defaults(cloudify_agent)
+        _add_cfy_agent_defaults(cloudify_agent)
+        if cloudify_agent.get('basedir'):
+            directory_attributes(cloudify_agent)
+        _add_installation_defaults(cloudify_agent)
 
 
 @group('installation')
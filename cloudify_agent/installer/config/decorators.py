@@ -13,6 +13,8 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import threading
+from contextlib import contextmanager
 from functools import wraps
 
 from cloudify import ctx
@@ -20,6 +22,83 @@ from cloudify import context
 
 from cloudify_agent.installer.config.attributes import AGENT_ATTRIBUTES
 
+INPUTS = 'inputs'
+RUNTIME_PROPERTIES = 'runtime_properties'
+NODE_PROPERTIES = 'node_properties'
+BOOTSTRAP_CONTEXT = 'bootstrap_context'
+FUNCTION = 'function'
+DEFAULT = 'default'
+
+_scope = threading.local()
+
+
+class ConfigurationLayers(object):
+
+    """
+    A read only view of the layers agent attributes are resolved from,
+    after the invocation inputs. The layers are read from the context once,
+    and each layer is flattened into a single dictionary so that
+    every lookup is a dictionary access.
+
+    The source every attribute was eventually resolved from is recorded in
+    the provenance dictionary.
+    """
+
+    def __init__(self):
+        layers = []
+        if ctx.type == context.NODE_INSTANCE:
+            # runtime properties are second in precedence order
+            layers.append((RUNTIME_PROPERTIES, _flatten(
+                ctx.instance.runtime_properties.get('cloudify_agent', {}))))
+
+            # node properties are third in precedence order
+            node_properties = dict(ctx.node.properties.get(
+                'cloudify_agent', {}))
+            node_properties.update(ctx.node.properties.get(
+                'agent_config', {}))
+            layers.append((NODE_PROPERTIES, _flatten(node_properties)))
+        self._layers = tuple(layers)
+
+        # bootstrap_context is forth in precedence order
+        self._agent_context = _flatten(
+            ctx.bootstrap_context.cloudify_agent._cloudify_agent or {})
+        self.provenance = {}
+
+    def lookup(self, name):
+        for source, props in self._layers:
+            if name in props:
+                return source, props[name]
+        return None, None
+
+    def lookup_context(self, name, context_attribute):
+        for key in (context_attribute, name):
+            if key in self._agent_context:
+                return BOOTSTRAP_CONTEXT, self._agent_context[key]
+        return None, None
+
+
+@contextmanager
+def configuration_layers():
+
+    """
+    Share the configuration layers by all attributes resolved within the
+    context. Nested contexts reuse the layers of the outermost one.
+    """
+
+    layers = getattr(_scope, 'layers', None)
+    if layers is not None:
+        yield layers
+        return
+    layers = _scope.layers = ConfigurationLayers()
+    try:
+        yield layers
+    finally:
+        _scope.layers = None
+        if layers.provenance:
+            ctx.logger.debug('Agent attributes sources: {0}'.format(
+                ', '.join('{0}={1}'.format(name, source) for name, source
+                          in sorted(layers.provenance.items()))))
+
 
 def attribute(name):
 
@@ -27,74 +106,8 @@ def attribute(name):
 
         @wraps(function)
         def wrapper(cloudify_agent):
-
-            # if the property was given in the invocation, use it.
-            # inputs are first in precedence order
-            if _update_agent_property(name,
-                                      props=cloudify_agent,
-                                      final_props=cloudify_agent):
-                return
-
-            if ctx.type == context.NODE_INSTANCE:
-
-                # if the property is inside a runtime property, use it.
-                # runtime properties are second in precedence order
-                runtime_properties = ctx.instance.runtime_properties.get(
-                    'cloudify_agent', {})
-                if _update_agent_property(name,
-                                          props=runtime_properties,
-                                          final_props=cloudify_agent):
-                    return
-
-                # if the property is declared on the node, use it
-                # node properties are third in precedence order
-                node_properties = ctx.node.properties.get(
-                    'cloudify_agent', {})
-                node_properties.update(ctx.node.properties.get(
-                    'agent_config', {}))
-
-                if _update_agent_property(name,
-                                          props=node_properties,
-                                          final_props=cloudify_agent):
-                    return
-
-            # if the property is inside the bootstrap context,
-            # and its value is not None, use it
-            # bootstrap_context is forth in precedence order
-            attr = AGENT_ATTRIBUTES.get(name)
-            if attr is None:
-                raise RuntimeError('{0} is not an agent attribute'
-                                   .format(name))
-            agent_context = ctx.bootstrap_context.cloudify_agent.\
-                _cloudify_agent or {}
-            context_attribute = attr.get('context_attribute', name)
-            if _update_agent_property(context_attribute,
-                                      props=agent_context,
-                                      final_props=cloudify_agent,
-                                      final_key=name):
-                return
-            if _update_agent_property(name,
-                                      props=agent_context,
-                                      final_props=cloudify_agent):
-                return
-
-            # apply the function itself
-            ctx.logger.debug('Applying function:{0} on Attribute '
-                             '<{1}>'.format(function.__name__, name))
-            value = function(cloudify_agent)
-            if value is not None:
-                ctx.logger.debug('{0} set by function:{1}'
-                                 .format(name, value))
-                cloudify_agent[name] = value
-                return
-
-            # set default value
-            default = attr.get('default')
-            if default is not None:
-                ctx.logger.debug('{0} set by default value'
-                                 .format(name, value))
-                cloudify_agent[name] = default
-                return
+            with configuration_layers() as layers:
+                _resolve_attribute(name, cloudify_agent, layers, function)
 
         return wrapper
 
@@ -108,30 +121,83 @@ def group(name):
         @wraps(group_function)
         def wrapper(cloudify_agent, *args, **kwargs):
 
-            # collect all attributes belonging to that group
-            group_attributes = {}
-            for attr_name, attr_value in AGENT_ATTRIBUTES.iteritems():
-                if attr_value.get('group') == name:
-                    group_attributes[attr_name] = attr_value
-
-            for group_attr_name in group_attributes.iterkeys():
-                # iterate and try to set all the attributes of the group as
-                # defined in the heuristics of @attribute.
-                @attribute(group_attr_name)
-                def setter(_):
-                    pass
+            with configuration_layers() as layers:
 
-                setter(cloudify_agent)
+                # iterate and try to set all the attributes of the group
+                # as defined in the heuristics of @attribute.
+                for attr_name, attr_value in AGENT_ATTRIBUTES.iteritems():
+                    if attr_value.get('group') == name:
+                        _resolve_attribute(attr_name, cloudify_agent, layers)
 
-            # when we are done, invoke the group function to
-            # apply group logic
-            group_function(cloudify_agent, *args, **kwargs)
+                # when we are done, invoke the group function to
+                # apply group logic
+                group_function(cloudify_agent, *args, **kwargs)
 
         return wrapper
 
     return decorator
 
 
+def _resolve_attribute(name, cloudify_agent, layers, function=None):
+
+    # if the property was given in the invocation, use it.
+    # inputs are first in precedence order
+    if _update_agent_property(name,
+                              props=cloudify_agent,
+                              final_props=cloudify_agent):
+        # attributes resolved earlier within the same layers are also
+        # inputs by now, keep their original source.
+        layers.provenance.setdefault(name, INPUTS)
+        return
+
+    source, value = layers.lookup(name)
+    if source is not None:
+        cloudify_agent[name] = value
+        layers.provenance[name] = source
+        return
+
+    # if the property is inside the bootstrap context,
+    # and its value is not None, use it
+    attr = AGENT_ATTRIBUTES.get(name)
+    if attr is None:
+        raise RuntimeError('{0} is not an agent attribute'
+                           .format(name))
+    source, value = layers.lookup_context(
+        name, attr.get('context_attribute', name))
+    if source is not None:
+        cloudify_agent[name] = value
+        layers.provenance[name] = source
+        return
+
+    # apply the function itself
+    if function is not None:
+        ctx.logger.debug('Applying function:{0} on Attribute '
+                         '<{1}>'.format(function.__name__, name))
+        value = function(cloudify_agent)
+        if value is not None:
+            ctx.logger.debug('{0} set by function:{1}'
+                             .format(name, value))
+            cloudify_agent[name] = value
+            layers.provenance[name] = FUNCTION
+            return
+
+    # set default value
+    default = attr.get('default')
+    if default is not None:
+        ctx.logger.debug('{0} set by default value'
+                         .format(name, value))
+        cloudify_agent[name] = default
+        layers.provenance[name] = DEFAULT
+        return
+
+
+def _flatten(props):
+    # values in the 'extra' dictionary take precedence
+    flat = dict(props)
+    flat.update(props.get('extra', {}))
+    return flat
+
+
 def _update_agent_property(name, props, final_props, final_key=None):
     final_key = final_key or name
     extra_props = props.get('extra', {})
@@ -29,6 +29,13 @@ class RemoteLinuxAgentInstaller(LinuxInstallerMixin, RemoteInstallerMixin):
     def extract(self, archive, destination):
         return self.runner.untar(archive, destination)
 
+    def download_and_extract(self, url, destination):
+        # the package is streamed into tar on the remote host, so it is
+        # neither written to disk nor listed back over the connection.
+        self.runner.download_and_untar(
+            url, destination,
+            checksum=self.cloudify_agent.get('package_checksum'))
+
     @property
     def runner(self):
         return self._runner
@@ -31,6 +31,7 @@ from cloudify_agent.installer.runners.winrm_runner import WinRMRunner
 from cloudify_agent.installer.runners.stub_runner import StubRunner
 from cloudify_agent.installer.config import configuration
 from cloudify_agent.api import utils
+from cloudify_agent.api.pool import DaemonPool
 
 
 def prepare_local_installer(cloudify_agent, logger=None):
@@ -52,49 +53,52 @@ def init_agent_installer(func=None, validate_connection=True):
             agent_config = kwargs.get('agent_config') or {}
             cloudify_agent.update(agent_config)
 
-            # first prepare all connection details
-            configuration.prepare_connection(cloudify_agent)
-
-            # create the correct runner according to os
-            # and local/remote execution. we need this runner now because it
-            # will be used to determine the agent basedir in case it wasn't
-            # explicitly set
-            if cloudify_agent['local']:
-                runner = LocalCommandRunner(logger=ctx.logger)
-            elif cloudify_agent['remote_execution'] is False:
-                runner = StubRunner()
-            else:
-                host = cloudify_agent['ip']
-                try:
-                    if cloudify_agent['windows']:
-                        runner = WinRMRunner(
-                            host=host,
-                            port=cloudify_agent.get('port'),
-                            user=cloudify_agent['user'],
-                            password=cloudify_agent['password'],
-                            protocol=cloudify_agent.get('protocol'),
-                            uri=cloudify_agent.get('uri'),
-                            logger=ctx.logger,
-                            validate_connection=validate_connection)
-                    else:
-                        runner = FabricRunner(
-                            host=host,
-                            port=cloudify_agent.get('port'),
-                            user=cloudify_agent['user'],
-                            key=cloudify_agent.get('key'),
-                            password=cloudify_agent.get('password'),
-                            fabric_env=cloudify_agent.get('fabric_env'),
-                            logger=ctx.logger,
-                            validate_connection=validate_connection)
-                except CommandExecutionError as e:
-                    message = e.error
-                    if not message:
-                        message = 'Failed connecting to host on {0}'.format(
-                            host)
-                    return ctx.operation.retry(message=message)
-
-            # now we can create all other agent attributes
-            configuration.prepare_agent(cloudify_agent, runner)
+            # all attributes are resolved from the same configuration
+            # layers
+            with configuration.configuration_layers():
+                # first prepare all connection details
+                configuration.prepare_connection(cloudify_agent)
+
+                # create the correct runner according to os
+                # and local/remote execution. we need this runner now
+                # because it will be used to determine the agent basedir
+                # in case it wasn't explicitly set
+                if cloudify_agent['local']:
+                    runner = LocalCommandRunner(logger=ctx.logger)
+                elif cloudify_agent['remote_execution'] is False:
+                    runner = StubRunner()
+                else:
+                    host = cloudify_agent['ip']
+                    try:
+                        if cloudify_agent['windows']:
+                            runner = WinRMRunner(
+                                host=host,
+                                port=cloudify_agent.get('port'),
+                                user=cloudify_agent['user'],
+                                password=cloudify_agent['password'],
+                                protocol=cloudify_agent.get('protocol'),
+                                uri=cloudify_agent.get('uri'),
+                                logger=ctx.logger,
+                                validate_connection=validate_connection)
+                        else:
+                            runner = FabricRunner(
+                                host=host,
+                                port=cloudify_agent.get('port'),
+                                user=cloudify_agent['user'],
+                                key=cloudify_agent.get('key'),
+                                password=cloudify_agent.get('password'),
+                                fabric_env=cloudify_agent.get('fabric_env'),
+                                logger=ctx.logger,
+                                validate_connection=validate_connection)
+                    except CommandExecutionError as e:
+                        message = e.error
+                        if not message:
+                            message = 'Failed connecting to host on ' \
+                                      '{0}'.format(host)
+                        return ctx.operation.retry(message=message)
+
+                # now we can create all other agent attributes
+                configuration.prepare_agent(cloudify_agent, runner)
 
             # create the correct installer according to os
             # and local/remote execution
@@ -140,6 +144,13 @@ def create(cloudify_agent, installer, **_):
                 cloudify_agent['name']))
             installer.create_agent()
     else:
+        if _use_pool_daemon(cloudify_agent):
+            return
+        daemon = DaemonPool(logger=ctx.logger).claim(cloudify_agent['queue'])
+        if daemon:
+            ctx.logger.info('Agent {0} is served by standby daemon {1}'
+                            .format(cloudify_agent['name'], daemon.name))
+            return
         ctx.logger.info('Creating Agent {0}'.format(cloudify_agent['name']))
         installer.create_agent()
 
@@ -154,6 +165,8 @@ def configure(cloudify_agent, installer, **_):
                 cloudify_agent['name']))
             installer.configure_agent()
     else:
+        if _use_pool_daemon(cloudify_agent):
+            return
         ctx.logger.info('Configuring Agent {0}'.format(cloudify_agent['name']))
         installer.configure_agent()
 
@@ -184,6 +197,9 @@ def start(cloudify_agent, installer, **_):
                 return ctx.operation.retry(
                     message='Waiting for Agent to start...')
     else:
+        if _use_pool_daemon(cloudify_agent):
+            # already consuming from the agent queue
+            return
         ctx.logger.info('Starting Agent {0}'.format(cloudify_agent['name']))
         installer.start_agent()
 
@@ -194,6 +210,14 @@ def stop(cloudify_agent, installer, **_):
 
     # no need to handling remote_execution False because this operation is
     # not invoked in that case
+    daemon = _use_pool_daemon(cloudify_agent)
+    if daemon and cloudify_agent['queue'] in daemon.queues:
+        # the daemon keeps serving other queues, and stops consuming
+        # from the agent queue on delete.
+        ctx.logger.info('Agent {0} is served by consolidated daemon {1}, '
+                        'not stopping it'.format(cloudify_agent['queue'],
+                                                 daemon.name))
+        return
     ctx.logger.info('Stopping Agent {0}'.format(cloudify_agent['name']))
     installer.stop_agent()
 
@@ -211,7 +235,14 @@ def delete(cloudify_agent, installer, **_):
             installer.delete_agent()
     else:
         ctx.logger.info('Deleting Agent {0}'.format(cloudify_agent['name']))
-        installer.delete_agent()
+        if _use_pool_daemon(cloudify_agent):
+            pool = DaemonPool(logger=ctx.logger)
+            if pool.release(cloudify_agent['queue']):
+                return
+            # the agent directory is owned by the pool
+            installer.run_daemon_command('delete')
+        else:
+            installer.delete_agent()
 
 
 @operation
@@ -220,5 +251,18 @@ def restart(cloudify_agent, installer, **_):
 
     # no need to handling remote_execution False because this operation is
     # not invoked in that case
+    _use_pool_daemon(cloudify_agent)
     ctx.logger.info('Restarting Agent {0}'.format(cloudify_agent['name']))
     installer.restart_agent()
+
+
+def _use_pool_daemon(cloudify_agent):
+
+    # deployment workers may be served by a standby daemon claimed
+    # from the daemon pool, which keeps its own name.
+    if ctx.type != context.DEPLOYMENT or not cloudify_agent['local']:
+        return None
+    daemon = DaemonPool(logger=ctx.logger).find(cloudify_agent['queue'])
+    if daemon is not None:
+        cloudify_agent['name'] = daemon.name
+    return daemon
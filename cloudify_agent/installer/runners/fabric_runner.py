@@ -30,10 +30,45 @@ from cloudify.exceptions import CommandExecutionException
 from cloudify.exceptions import CommandExecutionError
 
 from cloudify_agent.installer import exceptions
+from cloudify_agent.installer.runners.stream import OutputStream
 from cloudify_agent.api import utils as api_utils
 
 DEFAULT_REMOTE_EXECUTION_PORT = 22
 
+# fetches a url to stdout with whichever of wget and curl is available.
+FETCH_FUNCTION = """fetch() {{
+    if command -v wget > /dev/null 2>&1; then
+        wget -T 30 -q -O - {url}
+    elif command -v curl > /dev/null 2>&1; then
+        curl -fsSL {url}
+    else
+        echo "Cannot find neither wget nor curl" >&2
+        return 1
+    fi
+}}
+"""
+
+# the archive is checksummed by a background process reading a copy of
+# the stream from a fifo, so it is only read once.
+CHECKSUM_UNTAR = """fifo=$(mktemp -u)
+mkfifo $fifo
+sha256sum < $fifo | cut -d " " -f 1 > $fifo.sum &
+checksum_pid=$!
+fetch | tee $fifo | tar xz --strip={strip} -C {destination}
+status=$?
+wait $checksum_pid
+actual=$(cat $fifo.sum)
+rm -f $fifo $fifo.sum
+if [ $status -ne 0 ]; then
+    exit $status
+fi
+if [ "$actual" != "{checksum}" ]; then
+    echo "Checksum mismatch for {url}: expected {checksum}, got $actual" >&2
+    rm -rf {destination}
+    exit 1
+fi
+"""
+
 COMMON_ENV = {
     'warn_only': True,
     'forward_agent': True,
@@ -103,7 +138,8 @@ class FabricRunner(object):
         self.ping()
         self.logger.debug('SSH connection is ready')
 
-    def run(self, command, execution_env=None, **attributes):
+    def run(self, command, execution_env=None, output_callback=None,
+            **attributes):
 
         """
         Execute a command.
@@ -111,6 +147,9 @@ class FabricRunner(object):
         :param command: The command to execute.
         :param execution_env: environment variables to be applied before
                               running the command
+        :param output_callback: called with every line of output as soon
+                                as it is received. only the last lines of
+                                output are returned.
         :param quiet: run the command silently
         :param attributes: custom attributes passed directly to
                            fabric's run command
@@ -126,11 +165,16 @@ class FabricRunner(object):
         with shell_env(**execution_env):
             with settings(**self.env):
                 try:
-                    with hide('warnings'):
-                        r = fabric_api.run(
-                            command,
-                            quiet=not self.logger.isEnabledFor(logging.DEBUG),
-                            **attributes)
+                    if output_callback:
+                        r = self._run_streamed(command, output_callback,
+                                               **attributes)
+                    else:
+                        with hide('warnings'):
+                            r = fabric_api.run(
+                                command,
+                                quiet=not self.logger.isEnabledFor(
+                                    logging.DEBUG),
+                                **attributes)
                     if r.return_code != 0:
 
                         # by default, fabric combines the stdout
@@ -161,6 +205,18 @@ class FabricRunner(object):
                         error=str(e)
                     )
 
+    @staticmethod
+    def _run_streamed(command, output_callback, **attributes):
+        stream = OutputStream(output_callback)
+        with hide('running', 'warnings'):
+            with settings(output_prefix=False):
+                r = fabric_api.run(command, stdout=stream, **attributes)
+        stream.close()
+        # fabric keeps the whole output as well, but only the last lines
+        # are passed on.
+        r.stdout = stream.getvalue()
+        return r
+
     def sudo(self, command, **attributes):
 
         """
@@ -299,9 +355,35 @@ class FabricRunner(object):
 
         if not self.exists(destination, **attributes):
             self.run('mkdir -p {0}'.format(destination))
-        return self.run('tar xzvf {0} --strip={1} -C {2}'
+        return self.run('tar xzf {0} --strip={1} -C {2}'
                         .format(archive, strip, destination), **attributes)
 
+    def download_and_untar(self, url, destination, strip=1, checksum=None,
+                           **attributes):
+
+        """
+        Downloads an archive and un-tars it while it is downloaded, without
+        writing the archive itself to disk. The download and the extraction
+        run as a single pipeline, which fails if either of them fails.
+
+        :param url: URL to the archive.
+        :param destination: destination directory
+        :param strip: the strip count.
+        :param checksum: the expected sha256 checksum of the archive. if it
+                         does not match, the destination directory is
+                         removed and the command fails.
+        :param attributes: custom attributes passed directly to
+                           fabric's run command
+
+        :return: a response object containing information
+                 about the execution
+        :rtype: FabricCommandExecutionResponse
+        """
+
+        return self.run(
+            _download_and_untar_command(url, destination, strip, checksum),
+            **attributes)
+
     def ping(self, **attributes):
 
         """
@@ -503,3 +585,15 @@ class FabricCommandExecutionResponse(CommandExecutionResponse):
     Wrapper for indicating the command was originated with fabric api.
     """
     pass
+
+
+def _download_and_untar_command(url, destination, strip=1, checksum=None):
+    command = 'set -o pipefail\nmkdir -p {0}\n{1}'.format(
+        destination, FETCH_FUNCTION.format(url=url))
+    if checksum:
+        return command + CHECKSUM_UNTAR.format(url=url,
+                                               strip=strip,
+                                               destination=destination,
+                                               checksum=checksum.lower())
+    return command + 'fetch | tar xz --strip={0} -C {1}\n'.format(
+        strip, destination)
@@ -0,0 +1,98 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import shlex
+import subprocess
+
+from cloudify.exceptions import CommandExecutionException
+from cloudify.utils import CommandExecutionResponse
+from cloudify.utils import LocalCommandRunner
+
+from cloudify_agent.installer.runners.stream import OutputStream
+
+
+class LocalRunner(LocalCommandRunner):
+
+    """
+    A local command runner that can pass the output of a command to a
+    callback while the command is running.
+    """
+
+    def run(self, command, exit_on_failure=True, stdout_pipe=True,
+            stderr_pipe=True, cwd=None, execution_env=None,
+            output_callback=None):
+
+        """
+        Runs local commands.
+
+        :param output_callback: called with every line of output as soon
+                                as it is written. the standard error is
+                                merged into the standard output, and only
+                                the last lines of output are returned.
+
+        See `cloudify.utils.LocalCommandRunner.run` for the other
+        parameters.
+        """
+
+        if output_callback is None:
+            return super(LocalRunner, self).run(
+                command,
+                exit_on_failure=exit_on_failure,
+                stdout_pipe=stdout_pipe,
+                stderr_pipe=stderr_pipe,
+                cwd=cwd,
+                execution_env=execution_env)
+
+        self.logger.debug('[{0}] run: {1}'.format(self.host, command))
+        command_env = os.environ.copy()
+        command_env.update(execution_env or {})
+        p = subprocess.Popen(_split_command(command),
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT,
+                             cwd=cwd,
+                             env=command_env)
+        stream = OutputStream(output_callback)
+        for chunk in iter(lambda: os.read(p.stdout.fileno(), 4096), b''):
+            stream.write(chunk.decode('utf-8', 'replace'))
+        p.stdout.close()
+        stream.close()
+        p.wait()
+
+        out = stream.getvalue()
+        if p.returncode != 0:
+            error = CommandExecutionException(
+                command=command,
+                error=out,
+                output=out,
+                code=p.returncode)
+            if exit_on_failure:
+                raise error
+            self.logger.error(error)
+
+        return CommandExecutionResponse(
+            command=command,
+            std_out=out,
+            std_err=None,
+            return_code=p.returncode)
+
+
+def _split_command(command):
+    # backslashes are not escape characters, so that windows paths are
+    # kept intact (as done by LocalCommandRunner)
+    lex = shlex.shlex(command, posix=True)
+    lex.whitespace_split = True
+    lex.escape = ''
+    return list(lex)
@@ -0,0 +1,79 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+from collections import deque
+
+from cloudify_agent.api import defaults
+
+
+class OutputStream(object):
+
+    """
+    A file-like object that passes the output of a command to a callback
+    line by line, as soon as every line is complete. Only the last lines
+    are kept, so the memory used does not grow with the output.
+
+    :param callback: called with every line of output, without the
+                     line separator.
+    :param tail: the number of last lines to keep.
+    :param max_line_length: lines longer than this are split.
+    """
+
+    def __init__(self,
+                 callback,
+                 tail=defaults.OUTPUT_TAIL_LINES,
+                 max_line_length=defaults.OUTPUT_MAX_LINE_LENGTH):
+        self._callback = callback
+        self._max_line_length = max_line_length
+        self._lines = deque(maxlen=tail)
+        self._partial = ''
+
+    def write(self, data):
+        if not data:
+            return
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line)
+        while len(self._partial) >= self._max_line_length:
+            self._line(self._partial[:self._max_line_length])
+            self._partial = self._partial[self._max_line_length:]
+
+    def flush(self):
+        pass
+
+    def close(self):
+
+        """
+        Pass the last line to the callback, if it was not terminated.
+        """
+
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ''
+
+    def getvalue(self):
+
+        """
+        :return: the last lines of output.
+        :rtype: str
+        """
+
+        return '\n'.join(self._lines)
+
+    def _line(self, line):
+        line = line.rstrip('\r')
+        self._lines.append(line)
+        self._callback(line)
@@ -22,6 +22,7 @@ from cloudify.utils import setup_logger
 
 from cloudify_agent.installer import utils
 from cloudify_agent.api import utils as api_utils
+from cloudify_agent.installer.runners.stream import OutputStream
 
 DEFAULT_WINRM_PORT = '5985'
 DEFAULT_WINRM_URI = 'wsman'
@@ -90,7 +91,8 @@ class WinRMRunner(object):
             auth=(self.session_config['user'],
                   self.session_config['password']))
 
-    def run(self, command, raise_on_failure=True, execution_env=None):
+    def run(self, command, raise_on_failure=True, execution_env=None,
+            output_callback=None):
 
         """
         :param command: The command to execute.
@@ -100,6 +102,9 @@ class WinRMRunner(object):
                                  error and not raise an exception.
         :param execution_env: environment variables to be applied before
                               running the command
+        :param output_callback: called with every line of output as soon
+                                as it is received. only the last lines of
+                                output are returned.
 
         :return a response object with information about the execution
         :rtype WinRMCommandExecutionResponse.
@@ -140,7 +145,10 @@ class WinRMRunner(object):
         if remote_env_file:
             command = 'call {0} & {1}'.format(remote_env_file, command)
         try:
-            response = self.session.run_cmd(command)
+            if output_callback:
+                response = self._run_streamed(command, output_callback)
+            else:
+                response = self.session.run_cmd(command)
         except BaseException as e:
             raise WinRMCommandExecutionError(
                 command=command,
@@ -148,6 +156,32 @@ class WinRMRunner(object):
             )
         return _chk(response)
 
+    def _run_streamed(self, command, output_callback):
+        # the same as session.run_cmd, except that the output is passed on
+        # as it is received, instead of being collected.
+        protocol = self.session.protocol
+        std_out = OutputStream(output_callback)
+        std_err = OutputStream(output_callback)
+        shell_id = protocol.open_shell()
+        try:
+            command_id = protocol.run_command(shell_id, command)
+            try:
+                done = False
+                while not done:
+                    out, err, status_code, done = \
+                        protocol._raw_get_command_output(shell_id,
+                                                         command_id)
+                    std_out.write(out)
+                    std_err.write(err)
+            finally:
+                protocol.cleanup_command(shell_id, command_id)
+        finally:
+            protocol.close_shell(shell_id)
+        std_out.close()
+        std_err.close()
+        return winrm.Response(
+            (std_out.getvalue(), std_err.getvalue(), status_code))
+
     def ping(self):
 
         """
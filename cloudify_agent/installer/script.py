@@ -13,7 +13,7 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
-import jinja2
+import json
 
 from cloudify import utils as cloudify_utils
 
@@ -34,10 +34,13 @@ class AgentInstallationScriptBuilder(AgentInstaller):
             resource = 'script/windows.ps1.template'
         else:
             resource = 'script/linux.sh.template'
-        template = jinja2.Template(utils.get_resource(resource))
+        template = utils.get_template(resource)
         # called before so that custom_env and custom_env_path
         # get populated
         daemon_env = self._create_agent_env()
+        package_manifest = self._package_manifest()
+        if package_manifest:
+            package_manifest = json.dumps(package_manifest)
         return template.render(
             conf=self.cloudify_agent,
             daemon_env=daemon_env,
@@ -45,7 +48,9 @@ class AgentInstallationScriptBuilder(AgentInstaller):
             custom_env=self.custom_env,
             custom_env_path=self.custom_env_path,
             file_server_url=cloudify_utils.get_manager_file_server_url(),
-            configure_flags=self._configure_flags())
+            configure_flags=self._configure_flags(),
+            package_manifest=package_manifest,
+            package_manifest_path=self._package_manifest_path())
 
     def create_custom_env_file_on_target(self, environment):
         if not environment:
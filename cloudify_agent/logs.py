@@ -0,0 +1,321 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Log handlers of the worker log file. Records are passed to a writer thread,
+so that code emitting records (e.g plugin operations) does not wait on file
+I/O, on the rotation of the log file, or on compressing rotated log files.
+
+This module is used by the celery worker and therefore should only import
+modules from the standard library.
+"""
+
+import collections
+import gzip
+import logging
+import logging.handlers
+import os
+import shutil
+import threading
+import time
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 500
+BATCH_DELAY = 0.01
+REPEAT_INTERVAL = 10
+
+# passed to the writer thread to stop it
+_STOP = object()
+
+
+class QueueHandler(logging.Handler):
+
+    """
+    Handler that passes records to a writer thread, which emits them
+    through another handler. Records are written in batches of up to
+    `batch_size` records, and consecutive repetitions of a message are
+    written once every `repeat_interval` seconds, as a count. Emitting
+    a record blocks only when `queue_size` records are waiting to be
+    written.
+
+    The writer thread is started lazily, and started again in processes
+    forked after it was started (e.g celery pool processes).
+    """
+
+    def __init__(self, handler,
+                 queue_size=QUEUE_SIZE,
+                 batch_size=BATCH_SIZE,
+                 repeat_interval=REPEAT_INTERVAL):
+        logging.Handler.__init__(self)
+        self.handler = handler
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.repeat_interval = repeat_interval
+        self._writer = None
+        self._pid = None
+        self._closed = False
+
+    def emit(self, record):
+        try:
+            if self._closed:
+                self.handler.handle(record)
+                return
+            self._prepare(record)
+            if not self._writing():
+                self._start_writer()
+            if len(self._writer.records) >= self.queue_size:
+                self.flush()
+            self._writer.put(record)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+
+        """
+        Wait until every record that was emitted so far is written.
+        """
+
+        if self._writing():
+            written = threading.Event()
+            self._writer.put(written)
+            written.wait()
+
+    def close(self):
+        if self._writing():
+            self._writer.put(_STOP)
+            self._writer.join()
+        self._closed = True
+        self.handler.close()
+        logging.Handler.close(self)
+
+    def _prepare(self, record):
+        # the message arguments and the exception are rendered by the
+        # emitting thread, since they may change or be released once the
+        # record was emitted.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            formatter = self.handler.formatter or logging.Formatter()
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+    def _writing(self):
+        return (self._pid == os.getpid() and
+                self._writer is not None and
+                self._writer.is_alive())
+
+    def _start_writer(self):
+        if self._pid is not None and self._pid != os.getpid():
+            # forked while the writer thread of the parent process may
+            # have held the lock of the handler.
+            self.handler.createLock()
+        self._writer = _Writer(self.handler,
+                               batch_size=self.batch_size,
+                               repeat_interval=self.repeat_interval)
+        self._writer.start()
+        self._pid = os.getpid()
+
+
+class _Writer(threading.Thread):
+
+    """
+    The writer thread of a QueueHandler. Records are appended to a deque,
+    which does not take a lock, and the thread is woken up by an event
+    that is only set when it is not set already.
+    """
+
+    def __init__(self, handler, batch_size, repeat_interval):
+        super(_Writer, self).__init__()
+        self.daemon = True
+        self.handler = handler
+        self.batch_size = batch_size
+        self.repeat_interval = repeat_interval
+        self.records = collections.deque()
+        self._wakeup = threading.Event()
+        self._last_key = None
+        self._last_record = None
+        self._repeats = 0
+        self._first_repeat = None
+
+    def put(self, item):
+        self.records.append(item)
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def run(self):
+        try:
+            self._run()
+        finally:
+            # releases flushes waiting on a writer that stopped
+            for item in self.records:
+                if item is not _STOP and \
+                        not isinstance(item, logging.LogRecord):
+                    item.set()
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._repeats:
+                timeout = max(0, self._first_repeat +
+                              self.repeat_interval - time.time())
+            self._wakeup.wait(timeout)
+            # cleared before taking the records, so that records appended
+            # from now on set it again
+            self._wakeup.clear()
+            output = []
+            if not self.records:
+                self._summarize(output)
+            while self.records:
+                item = self.records.popleft()
+                if item is _STOP:
+                    self._summarize(output)
+                    self._write(output)
+                    return
+                if not isinstance(item, logging.LogRecord):
+                    # an event set once the records before it are written
+                    self._write(output)
+                    output = []
+                    item.set()
+                    continue
+                self._add(item, output)
+                if len(output) >= self.batch_size:
+                    self._write(output)
+                    output = []
+            self._write(output)
+            # lets records accumulate, so that they are written in
+            # batches rather than waking up the writer for every record
+            time.sleep(BATCH_DELAY)
+
+    def _add(self, record, output):
+        key = (record.name, record.levelno, record.msg, record.exc_text)
+        if key == self._last_key:
+            if not self._repeats:
+                self._first_repeat = record.created
+            self._repeats += 1
+            self._last_record = record
+            if record.created - self._first_repeat < self.repeat_interval:
+                return
+            self._summarize(output)
+        else:
+            self._summarize(output)
+            output.append(record)
+        self._last_key = key
+        self._last_record = record
+
+    def _summarize(self, output):
+        if self._repeats:
+            output.append(logging.makeLogRecord(dict(
+                self._last_record.__dict__,
+                msg='Last message repeated {0} times'.format(self._repeats),
+                exc_text=None)))
+            self._repeats = 0
+
+    def _write(self, records):
+        if not records:
+            return
+        handle_batch = getattr(self.handler, 'handle_batch', None)
+        if handle_batch:
+            handle_batch(records)
+            return
+        for record in records:
+            self.handler.handle(record)
+        self.handler.flush()
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+
+    """
+    Rotating file handler that keeps its backups gzipped. Rotated files are
+    compressed by a background thread, and a batch of records is written
+    with a single flush of the log file.
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, **kwargs):
+        logging.handlers.RotatingFileHandler.__init__(
+            self, filename, maxBytes=maxBytes, backupCount=backupCount,
+            **kwargs)
+        self._batching = False
+        self._compressor = None
+
+    def handle_batch(self, records):
+        self.acquire()
+        try:
+            self._batching = True
+            try:
+                for record in records:
+                    self.handle(record)
+            finally:
+                self._batching = False
+            self.flush()
+        finally:
+            self.release()
+
+    def flush(self):
+        if not self._batching:
+            logging.handlers.RotatingFileHandler.flush(self)
+
+    def close(self):
+        self._wait_for_compressor()
+        logging.handlers.RotatingFileHandler.close(self)
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if self.backupCount > 0:
+            # the previous backup must be compressed before it is renamed
+            self._wait_for_compressor()
+            for i in range(self.backupCount - 1, 0, -1):
+                self._rename(self._backup(i), self._backup(i + 1))
+            rotated = '{0}.1'.format(self.baseFilename)
+            self._rename(self.baseFilename, rotated)
+            self._compressor = threading.Thread(target=self._compress,
+                                                args=(rotated, ))
+            self._compressor.daemon = True
+            self._compressor.start()
+        self.stream = self._open()
+
+    def _backup(self, index):
+        return '{0}.{1}.gz'.format(self.baseFilename, index)
+
+    def _wait_for_compressor(self):
+        if self._compressor is not None:
+            self._compressor.join()
+            self._compressor = None
+
+    @staticmethod
+    def _rename(source, destination):
+        if not os.path.exists(source):
+            return
+        if os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+    @classmethod
+    def _compress(cls, path):
+        compressed = '{0}.gz'.format(path)
+        # compressed under a temporary name, so that a partially compressed
+        # file is never taken for a backup
+        tmp_compressed = '{0}.tmp'.format(compressed)
+        with open(path, 'rb') as source:
+            destination = gzip.open(tmp_compressed, 'wb')
+            try:
+                shutil.copyfileobj(source, destination)
+            finally:
+                destination.close()
+        cls._rename(tmp_compressed, compressed)
+        os.remove(path)
@@ -17,14 +17,19 @@ import tempfile
 import time
 import threading
 import ssl
+import socket
 import sys
 import os
 import copy
+import json
 from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 import celery
+from celery import states
+from celery.exceptions import TimeoutError
+from celery.result import ResultSet
 
-import cloudify.manager
 from cloudify import ctx
 from cloudify.exceptions import NonRecoverableError
 
@@ -36,6 +41,7 @@ from cloudify_agent.api.plugins.installer import PluginInstaller
 from cloudify_agent.api.factory import DaemonFactory
 from cloudify_agent.api import defaults
 from cloudify_agent.api import exceptions
+from cloudify_agent.api import rest
 from cloudify_agent.api import utils
 from cloudify_agent.app import app
 from cloudify_agent.installer.config import configuration
@@ -44,16 +50,19 @@ from cloudify_agent.installer.config import configuration
 @operation
 def install_plugins(plugins, **_):
     installer = PluginInstaller(logger=ctx.logger)
-    for plugin in plugins:
-        ctx.logger.info('Installing plugin: {0}'.format(plugin['name']))
-        try:
-            installer.install(plugin=plugin,
-                              deployment_id=ctx.deployment.id,
-                              blueprint_id=ctx.blueprint.id)
-        except exceptions.PluginInstallationError as e:
-            # preserve traceback
-            tpe, value, tb = sys.exc_info()
-            raise NonRecoverableError, NonRecoverableError(str(e)), tb
+    with rest.count_requests() as requests_count:
+        for plugin in plugins:
+            ctx.logger.info('Installing plugin: {0}'.format(plugin['name']))
+            try:
+                installer.install(plugin=plugin,
+                                  deployment_id=ctx.deployment.id,
+                                  blueprint_id=ctx.blueprint.id)
+            except exceptions.PluginInstallationError as e:
+                # preserve traceback
+                tpe, value, tb = sys.exc_info()
+                raise NonRecoverableError, NonRecoverableError(str(e)), tb
+    ctx.logger.debug('Manager REST requests: {0} sent, {1} cached'.format(
+        requests_count['sent'], requests_count['cached']))
 
 
 @operation
@@ -66,7 +75,18 @@ def uninstall_plugins(plugins, **_):
 
 
 @operation
-def restart(new_name=None, delay_period=5, **_):
+def restart(new_name=None, delay_period=5, in_place=False, new_queue=None,
+            **_):
+
+    if in_place and new_name is None:
+        # the worker name is fixed for the lifetime of the worker process,
+        # so only a restart that keeps the name can be done in place.
+        try:
+            _restart_in_place(new_queue)
+            return
+        except exceptions.DaemonException as e:
+            ctx.logger.warning('Failed restarting agent in place, starting '
+                               'a new agent instead: {0}'.format(e))
 
     cloudify_agent = ctx.instance.runtime_properties['cloudify_agent']
     if new_name is None:
@@ -106,7 +126,7 @@ def restart(new_name=None, delay_period=5, **_):
     del attributes['pid_file']
 
     # Get the broker credentials for the daemon
-    attributes.update(ctx.bootstrap_context.broker_config())
+    attributes.update(utils.internal.get_broker_configuration(attributes))
 
     new_daemon = DaemonFactory().new(logger=ctx.logger, **attributes)
 
@@ -127,6 +147,44 @@ def restart(new_name=None, delay_period=5, **_):
     thread.start()
 
 
+def _restart_in_place(new_queue=None):
+    daemon = _load_daemon(logger=ctx.logger)
+    if daemon.pool != 'prefork':
+        # only a process pool can be restarted. other pools ignore the
+        # restart request, but the worker still replies that it started.
+        raise exceptions.DaemonException(
+            'Daemon {0} uses a {1} pool, which can not be restarted in '
+            'place'.format(daemon.name, daemon.pool))
+    destination = ['celery@{0}'.format(daemon.name)]
+    if new_queue and new_queue != daemon.queue:
+        # the new queue is consumed before the current one is cancelled,
+        # so there is no period in which no queue is consumed.
+        start_time = time.time()
+        daemon.consume(new_queue)
+        ctx.logger.info('Daemon {0} rebound to queue {1} in {2:.3f} seconds'
+                        .format(daemon.name, new_queue,
+                                time.time() - start_time))
+        daemon.configure()
+        _save_daemon(daemon)
+
+        cloudify_agent = ctx.instance.runtime_properties['cloudify_agent']
+        cloudify_agent['queue'] = new_queue
+        ctx.instance.runtime_properties['cloudify_agent'] = cloudify_agent
+        ctx.instance.update()
+
+    # the pool processes are replaced once they finish their current task,
+    # so in flight tasks (including this one) are not interrupted.
+    replies = app.control.pool_restart(destination=destination, reply=True)
+    errors = [reply.get('error') for worker_reply in replies or []
+              for reply in worker_reply.values() if reply.get('error')]
+    if not replies or errors:
+        raise exceptions.DaemonException(
+            'Daemon {0} did not restart its pool processes: {1}'
+            .format(daemon.name, ', '.join(errors) or 'no reply'))
+    ctx.logger.info('Daemon {0} restarted its pool processes'
+                    .format(daemon.name))
+
+
 @operation
 def stop(delay_period=5, **_):
     thread = threading.Thread(target=shutdown_current_master,
@@ -172,14 +230,17 @@ def create_new_agent_dict(old_agent):
     return new_agent
 
 
-@contextmanager
-def _celery_client(ctx, agent):
+def _get_broker_config(ctx, agent):
     # We retrieve broker url from old agent in order to support
     # cases when old agent is not connected to current rabbit server.
     if 'broker_config' in agent:
-        broker_config = agent['broker_config']
-    else:
-        broker_config = ctx.bootstrap_context.broker_config()
+        return agent['broker_config']
+    return ctx.bootstrap_context.broker_config()
+
+
+@contextmanager
+def _celery_client(ctx, agent):
+    broker_config = _get_broker_config(ctx, agent)
     broker_url = utils.internal.get_broker_url(broker_config)
     ctx.logger.info('Connecting to {0}'.format(broker_url))
     celery_client = celery.Celery()
@@ -189,7 +250,7 @@ def _celery_client(ctx, agent):
         'BROKER_URL': broker_url,
         'CELERY_RESULT_BACKEND': broker_url
     }
-    if not ManagerVersion(agent['version']).equals(ManagerVersion('3.2')):
+    if not _is_3_2_agent(agent):
         config['CELERY_TASK_RESULT_EXPIRES'] = \
             defaults.CELERY_TASK_RESULT_EXPIRES
     fd, cert_path = tempfile.mkstemp()
@@ -211,6 +272,10 @@ def _celery_client(ctx, agent):
         os.remove(cert_path)
 
 
+def _is_3_2_agent(agent):
+    return ManagerVersion(agent['version']).equals(ManagerVersion('3.2'))
+
+
 def _celery_task_name(version):
     if not version or ManagerVersion(version).greater_than(
             ManagerVersion('3.3.1')):
@@ -221,6 +286,10 @@ def _celery_task_name(version):
 
 def _assert_agent_alive(name, celery_client, version=None):
     tasks = utils.get_agent_registered(name, celery_client)
+    _assert_agent_tasks(name, tasks, version)
+
+
+def _assert_agent_tasks(name, tasks, version=None):
     if not tasks:
         raise NonRecoverableError(
             'Could not access tasks list for agent {0}'.format(name))
@@ -231,40 +300,85 @@ def _assert_agent_alive(name, celery_client, version=None):
 
 
 def _get_manager_version():
-    version_json = cloudify.manager.get_rest_client().manager.get_version()
+    version_json = rest.get_client().manager.get_version()
     return ManagerVersion(version_json['version'])
 
 
-def _run_install_script(old_agent, timeout, validate_only=False):
+def _prepare_old_agent(old_agent, manager_version=None):
     # Assuming that if there is no version info in the agent then
     # this agent was installed by current manager.
     old_agent = copy.deepcopy(old_agent)
     if 'version' not in old_agent:
-        old_agent['version'] = str(_get_manager_version())
-    new_agent = create_new_agent_dict(old_agent)
-    old_agent_version = new_agent['old_agent_version']
-    with _celery_client(ctx, old_agent) as celery_client:
-        old_agent_name = old_agent['name']
-        _assert_agent_alive(old_agent_name, celery_client, old_agent_version)
-        script_format = '{0}/cloudify/install_agent.py'
-        script_url = script_format.format(get_manager_file_server_url())
-        script_runner_task = 'script_runner.tasks.run'
-        cloudify_context = {
-            'type': 'operation',
-            'task_name': script_runner_task,
-            'task_target': old_agent['queue']
-        }
-        kwargs = {'script_path': script_url,
-                  'cloudify_agent': new_agent,
-                  'validate_only': validate_only,
-                  '__cloudify_context': cloudify_context}
-        task = _celery_task_name(old_agent_version)
-        result = celery_client.send_task(
-            task,
-            kwargs=kwargs,
-            queue=old_agent['queue']
-        )
-        returned_agent = result.get(timeout=timeout)
+        old_agent['version'] = str(manager_version or _get_manager_version())
+    return old_agent
+
+
+def _send_install_script(celery_client, old_agent, new_agent,
+                         validate_only):
+    script_format = '{0}/cloudify/install_agent.py'
+    script_url = script_format.format(get_manager_file_server_url())
+    script_runner_task = 'script_runner.tasks.run'
+    cloudify_context = {
+        'type': 'operation',
+        'task_name': script_runner_task,
+        'task_target': old_agent['queue']
+    }
+    kwargs = {'script_path': script_url,
+              'cloudify_agent': new_agent,
+              'validate_only': validate_only,
+              '__cloudify_context': cloudify_context}
+    task = _celery_task_name(new_agent['old_agent_version'])
+    return celery_client.send_task(
+        task,
+        kwargs=kwargs,
+        queue=old_agent['queue']
+    )
+
+
+def _wait_for_install_scripts(celery_client, results, timeout):
+
+    """
+    Waits for many install script tasks sent through the same client.
+    The result queues of all tasks are drained by a single consumer, and
+    results are yielded as soon as they arrive rather than in submission
+    order. The number of pending tasks is logged periodically while the
+    old agents are running the script.
+
+    :param celery_client: the client the tasks were sent with.
+    :param results: the AsyncResult of each sent task.
+    :param timeout: the time in seconds to wait for all the results.
+
+    :return: a generator of (task_id, value) tuples. value is the exception
+             raised by the task, or a TimeoutError, if the task did
+             not succeed.
+    """
+
+    deadline = time.time() + timeout
+    pending = dict((result.id, result) for result in results)
+    while pending:
+        wait = min(deadline - time.time(),
+                   defaults.INSTALL_SCRIPT_PROGRESS_INTERVAL)
+        if wait <= 0:
+            break
+        result_set = ResultSet(list(pending.values()), app=celery_client)
+        try:
+            for task_id, meta in result_set.iter_native(timeout=wait):
+                result = pending.pop(task_id)
+                if meta['status'] == states.SUCCESS:
+                    yield task_id, meta['result']
+                else:
+                    yield task_id, result.backend.exception_to_python(
+                        meta['result'])
+        # the amqp backend lets the socket timeout of draining the result
+        # queues through, rather than raising a TimeoutError
+        except (TimeoutError, socket.timeout):
+            ctx.logger.info('Waiting for the install script to finish on '
+                            '{0} agents'.format(len(pending)))
+    for task_id in pending:
+        yield task_id, TimeoutError('The operation timed out.')
+
+
+def _install_script_result(old_agent, new_agent, returned_agent):
     if returned_agent['name'] != new_agent['name']:
         raise NonRecoverableError(
             'Expected agent name {0}, received {1}'.format(
@@ -277,6 +391,25 @@ def _run_install_script(old_agent, timeout, validate_only=False):
     }
 
 
+def _run_install_script(old_agent, timeout, validate_only=False):
+    old_agent = _prepare_old_agent(old_agent)
+    new_agent = create_new_agent_dict(old_agent)
+    old_agent_version = new_agent['old_agent_version']
+    with _celery_client(ctx, old_agent) as celery_client:
+        old_agent_name = old_agent['name']
+        # an agent that does not reply to the pidbox query is dead, so
+        # there is no point in sending it the script and waiting
+        # for the result.
+        _assert_agent_alive(old_agent_name, celery_client, old_agent_version)
+        result = _send_install_script(celery_client, old_agent, new_agent,
+                                      validate_only)
+        for _, returned_agent in _wait_for_install_scripts(
+                celery_client, [result], timeout):
+            if isinstance(returned_agent, Exception):
+                raise returned_agent
+    return _install_script_result(old_agent, new_agent, returned_agent)
+
+
 def create_agent_from_old_agent(operation_timeout=300):
     if 'cloudify_agent' not in ctx.instance.runtime_properties:
         raise NonRecoverableError(
@@ -317,26 +450,38 @@ def validate_agent_amqp(validate_agent_timeout, fail_on_agent_dead=False,
     agent = ctx.instance.runtime_properties['cloudify_agent']
     agent_name = agent['name']
     result = {}
-    ctx.logger.info(('Checking if agent can be accessed through '
-                     'current rabbitmq'))
-    try:
-        _assert_agent_alive(agent_name, app)
-    except Exception as e:
-        result['agent_alive'] = False
-        result['agent_alive_error'] = str(e)
-        ctx.logger.info('Agent unavailable, reason {0}'.format(str(e)))
-    else:
-        result['agent_alive'] = True
-    ctx.logger.info(('Checking if agent can be accessed through '
-                     'different rabbitmq'))
+
+    # both checks are independent, the check through the current rabbitmq
+    # runs in the background while the install script is validated through
+    # the old one. The background check does not use the operation context
+    # since it is bound to the current thread.
+    pool = ThreadPool(1)
     try:
-        _run_install_script(agent, validate_agent_timeout, validate_only=True)
-    except Exception as e:
-        result['agent_alive_crossbroker'] = False
-        result['agent_alive_crossbroker_error'] = str(e)
-        ctx.logger.info('Agent unavailable, reason {0}'.format(str(e)))
-    else:
-        result['agent_alive_crossbroker'] = True
+        ctx.logger.info(('Checking if agent can be accessed through '
+                         'current rabbitmq'))
+        agent_alive = pool.apply_async(_assert_agent_alive, (agent_name, app))
+        ctx.logger.info(('Checking if agent can be accessed through '
+                         'different rabbitmq'))
+        try:
+            _run_install_script(agent, validate_agent_timeout,
+                                validate_only=True)
+        except Exception as e:
+            result['agent_alive_crossbroker'] = False
+            result['agent_alive_crossbroker_error'] = str(e)
+            ctx.logger.info('Agent unavailable, reason {0}'.format(str(e)))
+        else:
+            result['agent_alive_crossbroker'] = True
+        try:
+            agent_alive.get()
+        except Exception as e:
+            result['agent_alive'] = False
+            result['agent_alive_error'] = str(e)
+            ctx.logger.info('Agent unavailable, reason {0}'.format(str(e)))
+        else:
+            result['agent_alive'] = True
+    finally:
+        pool.close()
+        pool.join()
     result['timestamp'] = time.time()
     ctx.instance.runtime_properties['agent_status'] = result
     if fail_on_agent_dead and not result['agent_alive']:
@@ -344,3 +489,102 @@ def validate_agent_amqp(validate_agent_timeout, fail_on_agent_dead=False,
     if fail_on_agent_not_installable and not result[
             'agent_alive_crossbroker']:
         raise NonRecoverableError(result['agent_alive_crossbroker_error'])
+
+
+@operation
+def validate_agents_amqp(agents, validate_agent_timeout, **_):
+    return validate_agents(agents, validate_agent_timeout)
+
+
+def validate_agents(agents, timeout):
+
+    """
+    Validates many agents in a single call. Agents are grouped by the
+    broker they are connected to, and each broker is queried with a single
+    client and a single pidbox broadcast. The install script validation
+    tasks are sent to all live agents before waiting for any result.
+
+    :param agents: the cloudify_agent runtime properties of the agents.
+    :param timeout: the timeout in seconds to wait for all the install
+                    script results of a single broker.
+
+    :return: the validation status of each agent, keyed by agent name, in
+             the same format as the 'agent_status' runtime property.
+    """
+
+    results = dict((agent['name'], {}) for agent in agents)
+
+    ctx.logger.info(('Checking if {0} agents can be accessed through '
+                     'current rabbitmq'.format(len(agents))))
+    registered = utils.get_agents_registered(list(results.keys()), app)
+    for name, tasks in registered.iteritems():
+        try:
+            _assert_agent_tasks(name, tasks)
+        except Exception as e:
+            results[name]['agent_alive'] = False
+            results[name]['agent_alive_error'] = str(e)
+        else:
+            results[name]['agent_alive'] = True
+
+    manager_version = None
+    if any('version' not in agent for agent in agents):
+        manager_version = _get_manager_version()
+    brokers = {}
+    for agent in agents:
+        old_agent = _prepare_old_agent(agent, manager_version)
+        broker_key = (json.dumps(_get_broker_config(ctx, old_agent),
+                                 sort_keys=True),
+                      _is_3_2_agent(old_agent))
+        brokers.setdefault(broker_key, []).append(old_agent)
+
+    ctx.logger.info(('Checking if agents can be accessed through '
+                     '{0} different rabbitmq'.format(len(brokers))))
+    for old_agents in brokers.itervalues():
+        crossbroker_results = _validate_agents_crossbroker(old_agents,
+                                                           timeout)
+        for name, error in crossbroker_results.iteritems():
+            results[name]['agent_alive_crossbroker'] = error is None
+            if error is not None:
+                results[name]['agent_alive_crossbroker_error'] = error
+
+    timestamp = time.time()
+    for result in results.itervalues():
+        result['timestamp'] = timestamp
+    return results
+
+
+def _validate_agents_crossbroker(old_agents, timeout):
+    errors = {}
+    with _celery_client(ctx, old_agents[0]) as celery_client:
+        registered = utils.get_agents_registered(
+            [old_agent['name'] for old_agent in old_agents], celery_client)
+        pending = {}
+        for old_agent in old_agents:
+            name = old_agent['name']
+            try:
+                new_agent = create_new_agent_dict(old_agent)
+                _assert_agent_tasks(name, registered[name],
+                                    new_agent['old_agent_version'])
+                result = _send_install_script(celery_client, old_agent,
+                                              new_agent, validate_only=True)
+                pending[result.id] = (old_agent, new_agent, result)
+            except Exception as e:
+                errors[name] = str(e)
+        results = [sent for _, _, sent in pending.itervalues()]
+        for task_id, returned_agent in _wait_for_install_scripts(
+                celery_client, results, timeout):
+            old_agent, new_agent, _ = pending[task_id]
+            try:
+                if isinstance(returned_agent, Exception):
+                    raise returned_agent
+                _install_script_result(old_agent, new_agent, returned_agent)
+            except Exception as e:
+                errors[old_agent['name']] = str(e)
+            else:
+                errors[old_agent['name']] = None
+                ctx.logger.info('Agent {0} validated ({1}/{2})'.format(
+                    old_agent['name'],
+                    len([error for error in errors.values()
+                         if error is None]),
+                    len(pending)))
+    return errors
@@ -0,0 +1,302 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+"""
+Fair scheduling of tasks between deployments. Tasks are kept in a bucket per
+deployment (and a separate bucket for the workflows of every deployment).
+Every bucket may only run a limited number of tasks concurrently, and when
+the worker runs at its full capacity, waiting tasks are dispatched from the
+buckets by deficit round robin according to the bucket weights.
+
+Short control tasks (e.g stopping or restarting the agent) have a bucket of
+their own, with reserved slots that are not part of the worker capacity.
+Control tasks are therefore executed right away, even when the worker is
+busy running long tasks.
+
+This module is used by the celery worker and therefore should only import
+modules from the standard library.
+"""
+
+import collections
+import time
+
+WORKFLOWS_SUFFIX = '_workflows'
+CONTROL_BUCKET = '__control__'
+CONTROL_QUEUE_SUFFIX = '.control'
+
+# tasks that are executed in the control bucket, regardless of the queue
+# they were sent to.
+CONTROL_TASKS = [
+    'cloudify_agent.operations.restart',
+    'cloudify_agent.operations.stop',
+    'cloudify_agent.operations.validate_agent_amqp',
+    'cloudify_agent.operations.validate_agents_amqp'
+]
+
+
+class _Bucket(object):
+
+    def __init__(self, key, size, weight, reserved=False):
+        self.key = key
+        self.size = size
+        self.weight = weight
+        self.reserved = reserved
+        self.running = 0
+        self.deficit = 0
+        self.waiting = collections.deque()
+        self.dispatched = 0
+        self.total_wait = 0
+        self.max_wait = 0
+
+
+class FairScheduler(object):
+
+    """
+    Decides which received tasks may run. The scheduler is not thread safe,
+    callers should synchronize calls to submit and done.
+
+    :param capacity: the number of tasks the worker runs concurrently.
+                     0 means the worker capacity is not limited, in which
+                     case only the bucket sizes apply.
+    :param bucket_size: the number of tasks of a single deployment that
+                        may run concurrently.
+    :param workflow_bucket_size: the number of workflows of a single
+                                 deployment that may run concurrently.
+                                 defaults to the bucket_size.
+    :param weights: a dictionary mapping bucket keys to their weight.
+                    a bucket with weight 2 is dispatched twice as many tasks
+                    as a bucket with weight 1 when both have waiting tasks.
+                    buckets have a weight of 1 by default.
+    :param control_slots: the number of control tasks that may run
+                          concurrently in addition to the capacity.
+    :param clock: a function returning the current time in seconds.
+    """
+
+    def __init__(self, capacity=0, bucket_size=5, workflow_bucket_size=None,
+                 weights=None, control_slots=1, clock=time.time):
+        self.capacity = capacity
+        self.bucket_size = bucket_size
+        self.workflow_bucket_size = workflow_bucket_size or bucket_size
+        self.weights = weights or {}
+        self.control_slots = control_slots
+        self._clock = clock
+        self._buckets = {}
+        self._active = collections.deque()
+        self._running = 0
+
+    def submit(self, key, task):
+
+        """
+        Add a received task to its bucket.
+
+        :param key: the bucket key of the task. tasks without a deployment
+                    have a None key, and are only limited by the capacity.
+                    control tasks have the CONTROL_BUCKET key.
+        :param task: an object representing the task.
+
+        :return: the tasks that should be executed now.
+        :rtype: list
+        """
+
+        bucket = self._get_bucket(key)
+        bucket.waiting.append((self._clock(), task))
+        if bucket.reserved:
+            return self._dispatch_reserved(bucket)
+        if len(bucket.waiting) == 1:
+            self._active.append(bucket)
+        return self._dispatch()
+
+    def done(self, key):
+
+        """
+        Mark a task of a bucket as ended.
+
+        :param key: the bucket key of the task.
+
+        :return: the tasks that should be executed now.
+        :rtype: list
+        """
+
+        bucket = self._buckets[key]
+        bucket.running -= 1
+        if bucket.reserved:
+            return self._dispatch_reserved(bucket)
+        self._running -= 1
+        return self._dispatch()
+
+    def stats(self):
+
+        """
+        :return: a dictionary mapping every bucket key to the number of
+                 running and waiting tasks of the bucket, and the time in
+                 seconds dispatched tasks have waited in the bucket.
+        :rtype: dict
+        """
+
+        now = self._clock()
+        stats = {}
+        for key, bucket in self._buckets.items():
+            oldest = bucket.waiting[0][0] if bucket.waiting else now
+            stats[key] = {
+                'size': bucket.size,
+                'weight': bucket.weight,
+                'running': bucket.running,
+                'waiting': len(bucket.waiting),
+                'oldest_wait': now - oldest,
+                'dispatched': bucket.dispatched,
+                'avg_wait': (bucket.total_wait / bucket.dispatched
+                             if bucket.dispatched else 0),
+                'max_wait': bucket.max_wait
+            }
+        return stats
+
+    def _get_bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None and key == CONTROL_BUCKET:
+            bucket = self._buckets[key] = _Bucket(
+                key, self.control_slots, 1, reserved=True)
+        elif bucket is None:
+            if key is None:
+                # limited by the capacity only
+                size = None
+            elif key.endswith(WORKFLOWS_SUFFIX):
+                size = self.workflow_bucket_size
+            else:
+                size = self.bucket_size
+            bucket = self._buckets[key] = _Bucket(
+                key, size, self.weights.get(key, 1))
+        return bucket
+
+    @staticmethod
+    def _is_full(bucket):
+        return bucket.size is not None and bucket.running >= bucket.size
+
+    def _has_capacity(self):
+        return not self.capacity or self._running < self.capacity
+
+    def _dispatch(self):
+        ready = []
+        blocked = 0
+        while (self._active and self._has_capacity() and
+               blocked < len(self._active)):
+            bucket = self._active[0]
+            if self._is_full(bucket):
+                # the bucket may not run more tasks, it keeps its deficit
+                # until one of its tasks ends.
+                self._active.rotate(-1)
+                blocked += 1
+                continue
+            blocked = 0
+            if bucket.deficit < 1:
+                bucket.deficit += bucket.weight
+            while (bucket.deficit >= 1 and bucket.waiting and
+                   not self._is_full(bucket) and self._has_capacity()):
+                ready.append(self._start(bucket))
+                bucket.deficit -= 1
+            if not bucket.waiting:
+                # idle buckets do not accumulate deficit
+                bucket.deficit = 0
+                self._active.popleft()
+            elif bucket.deficit < 1 or self._is_full(bucket):
+                self._active.rotate(-1)
+            # otherwise the worker runs at its full capacity, and the
+            # bucket is dispatched its remaining deficit once a task ends.
+        return ready
+
+    def _dispatch_reserved(self, bucket):
+        ready = []
+        while bucket.waiting and not self._is_full(bucket):
+            ready.append(self._start(bucket))
+        return ready
+
+    def _start(self, bucket):
+        received, task = bucket.waiting.popleft()
+        wait = self._clock() - received
+        bucket.running += 1
+        bucket.dispatched += 1
+        bucket.total_wait += wait
+        bucket.max_wait = max(bucket.max_wait, wait)
+        if not bucket.reserved:
+            self._running += 1
+        return task
+
+
+def control_queue(queue):
+
+    """
+    :param queue: an agent queue.
+
+    :return: the queue of control tasks sent to the agent.
+    """
+
+    return '{0}{1}'.format(queue, CONTROL_QUEUE_SUFFIX)
+
+
+def is_control_task(task_name, queue=None):
+
+    """
+    :param task_name: the name of the operation the task executes.
+    :param queue: the queue the task was received from.
+
+    :return: whether the task should be executed in the control bucket.
+    :rtype: bool
+    """
+
+    return (task_name in CONTROL_TASKS or
+            bool(queue and queue.endswith(CONTROL_QUEUE_SUFFIX)))
+
+
+def parse_weights(value):
+
+    """
+    Parse bucket weights given as 'key:weight,key:weight'.
+
+    :param value: the weights string, or a dictionary mapping bucket keys
+                  to their weight.
+
+    :return: a dictionary mapping bucket keys to their weight.
+    :rtype: dict
+    """
+
+    if isinstance(value, dict):
+        entries = value.items()
+    else:
+        entries = [entry.rpartition(':')[::2]
+                   for entry in (value or '').split(',') if entry.strip()]
+    weights = {}
+    for key, raw in entries:
+        try:
+            weight = float(raw)
+        except (TypeError, ValueError):
+            weight = 0
+        if not key.strip() or weight <= 0:
+            raise ValueError('Invalid weight of bucket {0!r}: {1!r}'
+                             .format(key, raw))
+        weights[key.strip()] = weight
+    return weights
+
+
+def format_weights(weights):
+
+    """
+    Format bucket weights as accepted by parse_weights.
+
+    :param weights: a dictionary mapping bucket keys to their weight, or
+                    a weights string.
+    """
+
+    weights = parse_weights(weights)
+    return ','.join('{0}:{1}'.format(key, weights[key])
+                    for key in sorted(weights))
@@ -13,8 +13,11 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import hashlib
+import json
 import os
 import sys
+from multiprocessing.pool import ThreadPool
 
 import click
 
@@ -27,6 +30,15 @@ from cloudify_agent import VIRTUALENV
 from cloudify_agent.api import utils
 from cloudify_agent.shell.decorators import handle_failures
 
+# records the path the virtualenv was relocated to, so that subsequent
+# configure calls can skip the relocation
+RELOCATION_MANIFEST = '.cfy-agent-relocation.json'
+
+# shebang lines longer than this are not considered at all
+SHEBANG_MAX_LENGTH = 1024
+
+RELOCATION_CONCURRENCY = 8
+
 
 @click.command()
 @click.option('--disable-requiretty',
@@ -97,10 +109,55 @@ def _fix_virtualenv():
 
 
 def _make_environment_relocatable(home_dir):
-    home_dir, lib_dir, inc_dir, bin_dir = path_locations(home_dir)
+    from cloudify_agent.shell.main import get_logger
+    logger = get_logger()
 
-    _fixup_scripts(bin_dir)
+    home_dir, lib_dir, inc_dir, bin_dir = path_locations(home_dir)
+    manifest_path = os.path.join(home_dir, RELOCATION_MANIFEST)
+    if _is_relocated(manifest_path, home_dir, bin_dir):
+        logger.debug('Virtualenv {0} is already relocated'.format(home_dir))
+        return
+    scripts = _fixup_scripts(bin_dir)
     fixup_pth_and_egg_link(home_dir)
+    _write_relocation_manifest(manifest_path, home_dir, bin_dir, scripts)
+
+
+def _is_relocated(manifest_path, home_dir, bin_dir):
+
+    """
+    The relocation can be skipped if it was already done to the same path,
+    no scripts were added or removed since, and the fixed scripts were not
+    modified. Scripts are rewritten in place, so the bin directory
+    modification time stays the same.
+    """
+
+    if not os.path.isfile(manifest_path):
+        return False
+    try:
+        manifest = utils.json_load(manifest_path)
+    except ValueError:
+        return False
+    if (manifest.get('virtualenv') != home_dir or
+            manifest.get('bin_mtime') != os.stat(bin_dir).st_mtime):
+        return False
+    for name, digest in manifest.get('scripts', {}).items():
+        try:
+            with open(os.path.join(bin_dir, name), 'rb') as f:
+                if hashlib.sha1(f.read()).hexdigest() != digest:
+                    return False
+        except (IOError, OSError):
+            return False
+    return True
+
+
+def _write_relocation_manifest(manifest_path, home_dir, bin_dir, scripts):
+    manifest = {
+        'virtualenv': home_dir,
+        'bin_mtime': os.stat(bin_dir).st_mtime,
+        'scripts': scripts
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
 
 
 def _fixup_scripts(bin_dir):
@@ -113,19 +170,38 @@ def _fixup_scripts(bin_dir):
     The relative shebang is platform-specific, but on linux it will consist
     of a /usr/bin/env shebang, and a python snippet that runs the `activate`
     script.
+
+    Files are examined concurrently, and only their first line is read
+    unless they actually need fixing.
+
+    :return: a dictionary of the fixed script names and their sha1 digest.
     """
     from cloudify_agent.shell.main import get_logger
     logger = get_logger()
 
     new_shebang = _get_relative_shebang()
-    for filename in _find_scripts_to_fix(bin_dir):
-        logger.debug('Making script {0} relative'.format(filename))
-        _rewrite_shebang(filename, new_shebang)
-
-
-def _find_scripts_to_fix(bin_dir):
-    """Search bin_dir for files that look like python scripts with a shebang
-    """
+    filenames = list(_list_scripts_candidates(bin_dir))
+    if not filenames:
+        return {}
+
+    pool = ThreadPool(min(len(filenames), RELOCATION_CONCURRENCY))
+    try:
+        digests = pool.map(lambda filename: _fix_script(filename,
+                                                        new_shebang),
+                           filenames)
+    finally:
+        pool.close()
+        pool.join()
+
+    scripts = {}
+    for filename, digest in zip(filenames, digests):
+        if digest:
+            logger.debug('Made script {0} relative'.format(filename))
+            scripts[os.path.basename(filename)] = digest
+    return scripts
+
+
+def _list_scripts_candidates(bin_dir):
     for filename in os.listdir(bin_dir):
 
         if filename in OK_ABS_SCRIPTS:
@@ -136,34 +212,41 @@ def _find_scripts_to_fix(bin_dir):
             # ignore subdirs, e.g. .svn ones.
             continue
 
-        with open(filename, 'rb') as f:
-            try:
-                lines = f.read().decode('utf-8').splitlines()
-            except UnicodeDecodeError:
-                # This is probably a binary program instead
-                # of a script, so just ignore it.
-                continue
-
-        if not lines:
-            continue
-
-        shebang = lines[0]
-        if not (shebang.startswith('#!') and 'bin/python' in shebang):
-            # the file doesn't have a /../bin/python shebang? nothing to fix
-            continue
-
         yield filename
 
 
-def _rewrite_shebang(filename, new_shebang):
-    """Replace the first line of the file with the new shebang"""
+def _fix_script(filename, new_shebang):
+    """Replace the first line of the file with the new shebang, if it
+    looks like a python script with a /../bin/python shebang
+
+    :return: the sha1 digest of the fixed script, or None if the script
+             was not modified.
+    """
     with open(filename, 'rb') as f:
-        lines = f.read().decode('utf-8').splitlines()
+        first_line = f.readline(SHEBANG_MAX_LENGTH)
+        if not _is_python_shebang(first_line):
+            return None
+        try:
+            lines = f.read().decode('utf-8').splitlines()
+        except UnicodeDecodeError:
+            # This is probably a binary program instead
+            # of a script, so just ignore it.
+            return None
+
+    script = relative_script([new_shebang] + lines)
+    content = '\n'.join(script).encode('utf-8')
+    with open(filename, 'wb') as f:
+        f.write(content)
+    return hashlib.sha1(content).hexdigest()
 
-    script = relative_script([new_shebang] + lines[1:])
 
-    with open(filename, 'wb') as f:
-        f.write('\n'.join(script).encode('utf-8'))
+def _is_python_shebang(first_line):
+    # the file doesn't have a /../bin/python shebang? nothing to fix.
+    # a line that was cut at the maximum length is not a shebang either.
+    return (first_line.startswith(b'#!') and
+            b'bin/python' in first_line and
+            (first_line.endswith(b'\n') or
+             len(first_line) < SHEBANG_MAX_LENGTH))
 
 
 def _get_relative_shebang():
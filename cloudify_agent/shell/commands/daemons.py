@@ -14,11 +14,15 @@
 #  * limitations under the License.
 
 import json
+import time
+
 import click
 
 from cloudify_agent.api import defaults
 from cloudify_agent.api import utils as api_utils
 from cloudify_agent.api.factory import DaemonFactory
+from cloudify_agent.api.pool import DaemonPool
+from cloudify_agent.api.pm.base import POOL_PACKAGES
 from cloudify_agent.shell import env
 from cloudify_agent.shell.decorators import handle_failures
 
@@ -121,6 +125,33 @@ from cloudify_agent.shell.decorators import handle_failures
                    'the autoscale configuration. [env {0}]'
               .format(env.CLOUDIFY_DAEMON_MAX_WORKERS),
               envvar=env.CLOUDIFY_DAEMON_MAX_WORKERS)
+@click.option('--control-workers',
+              help='Number of worker slots reserved for control tasks. '
+                   '[env {0}]'
+              .format(env.CLOUDIFY_DAEMON_CONTROL_WORKERS),
+              envvar=env.CLOUDIFY_DAEMON_CONTROL_WORKERS)
+@click.option('--pool',
+              help='The pool implementation executing the tasks. '
+                   '[env {0}]'
+              .format(env.CLOUDIFY_DAEMON_POOL),
+              type=click.Choice(sorted(POOL_PACKAGES)),
+              envvar=env.CLOUDIFY_DAEMON_POOL)
+@click.option('--queue-max-workers',
+              help='Maximum number of concurrent tasks of a single '
+                   'deployment. [env {0}]'
+              .format(env.CLOUDIFY_DAEMON_QUEUE_MAX_WORKERS),
+              envvar=env.CLOUDIFY_DAEMON_QUEUE_MAX_WORKERS)
+@click.option('--workflow-max-workers',
+              help='Maximum number of concurrent workflows of a single '
+                   'deployment. [env {0}]'
+              .format(env.CLOUDIFY_DAEMON_WORKFLOW_MAX_WORKERS),
+              envvar=env.CLOUDIFY_DAEMON_WORKFLOW_MAX_WORKERS)
+@click.option('--deployment-weights',
+              help='Weights of deployments when dispatching held tasks, '
+                   'given as deployment_id:weight,deployment_id:weight. '
+                   '[env {0}]'
+              .format(env.CLOUDIFY_DAEMON_DEPLOYMENT_WEIGHTS),
+              envvar=env.CLOUDIFY_DAEMON_DEPLOYMENT_WEIGHTS)
 @click.option('--log-level',
               help='Log level of the daemon. [env {0}]'
               .format(env.CLOUDIFY_DAEMON_LOG_LEVEL),
@@ -153,25 +184,45 @@ def create(**params):
 
     """
 
-    attributes = dict(**params)
-    custom_arg = attributes.pop('custom_options', ())
-    attributes.update(_parse_custom_options(custom_arg))
     click.echo('Creating...')
-    from cloudify_agent.shell.main import get_logger
-
-    if attributes['broker_get_settings_from_manager']:
-        broker = api_utils.internal.get_broker_configuration(attributes)
-        attributes.update(broker)
+    daemon = _create_daemon(params)
+    click.echo('Successfully created daemon: {0}'
+               .format(daemon.name))
 
-    daemon = DaemonFactory().new(
-        logger=get_logger(),
-        **attributes
-    )
 
-    daemon.create()
+@handle_failures
+def _bootstrap(**params):
+    timings = []
+
+    def timed(phase, func, *args, **kwargs):
+        started = time.time()
+        result = func(*args, **kwargs)
+        timings.append((phase, time.time() - started))
+        return result
+
+    click.echo('Bootstrapping...')
+    daemon = timed('create', _create_daemon, params)
+    timed('configure', daemon.configure)
     _save_daemon(daemon)
-    click.echo('Successfully created daemon: {0}'
-               .format(daemon.name))
+    timed('start', daemon.start,
+          interval=defaults.START_INTERVAL,
+          timeout=defaults.START_TIMEOUT,
+          delete_amqp_queue=defaults.DELETE_AMQP_QUEUE_BEFORE_START)
+    click.echo('Successfully bootstrapped daemon: {0} [{1}]'.format(
+        daemon.name,
+        ', '.join('{0}={1:.2f}s'.format(phase, elapsed)
+                  for phase, elapsed in timings)))
+
+
+# bootstrap accepts the same options as create. it creates, configures
+# and starts the daemon in a single process, instead of running the
+# create, configure and start commands one after the other.
+bootstrap = click.Command(
+    'bootstrap',
+    callback=_bootstrap,
+    params=create.params,
+    context_settings=create.context_settings,
+    help='Creates, configures and starts the daemon.')
 
 
 @click.command()
@@ -348,6 +399,84 @@ def ls():
         click.echo(daemon.name)
 
 
+@click.command()
+@click.option('--size',
+              help='The number of standby daemons to keep started.',
+              type=int)
+@click.option('--template',
+              help='The name of an existing daemon. Standby daemons are '
+                   'created with its attributes.')
+@click.option('--queues-per-daemon',
+              help='The maximum number of queues a claimed daemon consumes '
+                   'from.',
+              type=int,
+              default=1)
+@click.option('--fill',
+              help='Create and start standby daemons until the pool is '
+                   'full.',
+              is_flag=True,
+              default=False)
+@handle_failures
+def pool(size, template, queues_per_daemon, fill):
+
+    """
+    Configures and fills the pool of standby daemons.
+
+    """
+
+    from cloudify_agent.shell.main import get_logger
+    daemon_pool = DaemonPool(logger=get_logger())
+    if size is not None:
+        if template is None:
+            raise click.ClickException('--template should be specified '
+                                       'with --size.')
+        attributes = api_utils.internal.daemon_to_dict(
+            _load_daemon(template))
+        for key in ['name', 'queue', 'queues', 'log_file', 'pid_file']:
+            attributes.pop(key, None)
+        daemon_pool.configure(size, queues_per_daemon, **attributes)
+        click.echo('Successfully configured pool of {0} daemons'
+                   .format(size))
+    if fill:
+        click.echo('Filling...')
+        created = daemon_pool.fill()
+        click.echo('Successfully started {0} standby daemons'
+                   .format(len(created)))
+
+
+@click.command()
+@click.option('--name',
+              help='The name of the daemon. [env {0}]'
+              .format(env.CLOUDIFY_DAEMON_NAME),
+              required=True,
+              envvar=env.CLOUDIFY_DAEMON_NAME)
+@click.option('--add',
+              help='A queue the daemon should consume from.',
+              multiple=True)
+@click.option('--remove',
+              help='A queue the daemon should stop consuming from.',
+              multiple=True)
+@handle_failures
+def queues(name, add, remove):
+
+    """
+    Adds and removes queues of a running daemon.
+
+    """
+
+    daemon = _load_daemon(name)
+    try:
+        for queue in add:
+            daemon.add_queue(queue)
+        for queue in remove:
+            daemon.remove_queue(queue)
+    finally:
+        _save_daemon(daemon)
+    daemon.configure()
+    click.echo('Daemon {0} consumes from queues: {1}'
+               .format(name, ', '.join(daemon.get_queues())))
+
+
 @click.command()
 @click.option('--name',
               help='The name of the daemon. [env {0}]'
@@ -359,6 +488,26 @@ def status(name):
     _load_daemon(name).status()
 
 
+def _create_daemon(params):
+    attributes = dict(**params)
+    custom_arg = attributes.pop('custom_options', ())
+    attributes.update(_parse_custom_options(custom_arg))
+    from cloudify_agent.shell.main import get_logger
+
+    if attributes['broker_get_settings_from_manager']:
+        broker = api_utils.internal.get_broker_configuration(attributes)
+        attributes.update(broker)
+
+    daemon = DaemonFactory().new(
+        logger=get_logger(),
+        **attributes
+    )
+
+    daemon.create()
+    _save_daemon(daemon)
+    return daemon
+
+
 def _load_daemon(name, user=None):
     from cloudify_agent.shell.main import get_logger
     return DaemonFactory(username=user).load(name, logger=get_logger())
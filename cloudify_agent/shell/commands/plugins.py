@@ -0,0 +1,44 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import click
+
+from cloudify_agent.shell.decorators import handle_failures
+
+
+@click.command('warm')
+@click.option('--source',
+              help='URL of the plugin archive, or an absolute path to the '
+                   'plugin directory.',
+              required=True)
+@click.option('--args',
+              help='The install arguments of the plugin.',
+              default='')
+@handle_failures
+def warm(source, args):
+
+    """
+    Builds the wheels of a source plugin and its dependencies
+    into the local wheel cache.
+
+    """
+
+    click.echo('Building wheels...')
+    # imported here so other commands do not import pip and wagon
+    from cloudify_agent.api.plugins.installer import PluginInstaller
+    from cloudify_agent.shell.main import get_logger
+    wheels = PluginInstaller(logger=get_logger()).warm(source, args)
+    click.echo('Successfully cached {0} wheels for {1}'
+               .format(len(wheels), source))
@@ -21,6 +21,11 @@ CLOUDIFY_DAEMON_PROCESS_MANAGEMENT = 'CLOUDIFY_DAEMON_PROCESS_MANAGEMENT'
 CLOUDIFY_DAEMON_NAME = 'CLOUDIFY_DAEMON_NAME'
 CLOUDIFY_DAEMON_MIN_WORKERS = 'CLOUDIFY_DAEMON_MIN_WORKERS'
 CLOUDIFY_DAEMON_MAX_WORKERS = 'CLOUDIFY_DAEMON_MAX_WORKERS'
+CLOUDIFY_DAEMON_POOL = 'CLOUDIFY_DAEMON_POOL'
+CLOUDIFY_DAEMON_CONTROL_WORKERS = 'CLOUDIFY_DAEMON_CONTROL_WORKERS'
+CLOUDIFY_DAEMON_QUEUE_MAX_WORKERS = 'CLOUDIFY_DAEMON_QUEUE_MAX_WORKERS'
+CLOUDIFY_DAEMON_WORKFLOW_MAX_WORKERS = 'CLOUDIFY_DAEMON_WORKFLOW_MAX_WORKERS'
+CLOUDIFY_DAEMON_DEPLOYMENT_WEIGHTS = 'CLOUDIFY_DAEMON_DEPLOYMENT_WEIGHTS'
 CLOUDIFY_MANAGER_IP = 'CLOUDIFY_MANAGER_IP'
 CLOUDIFY_BROKER_IP = 'CLOUDIFY_BROKER_IP'
 CLOUDIFY_BROKER_PORT = 'CLOUDIFY_BROKER_PORT'
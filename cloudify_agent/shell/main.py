@@ -26,6 +26,7 @@ from cloudify_agent.api.utils import logger as api_utils_logger
 from cloudify_agent.shell.commands import daemons
 from cloudify_agent.shell.commands import configure
 from cloudify_agent.shell.commands import installer
+from cloudify_agent.shell.commands import plugins
 
 
 _logger = setup_logger('cloudify_agent.shell.main',
@@ -73,6 +74,11 @@ daemon_sub_command.add_command(daemons.restart)
 daemon_sub_command.add_command(daemons.inspect)
 daemon_sub_command.add_command(daemons.ls)
 daemon_sub_command.add_command(daemons.status)
+daemon_sub_command.add_command(daemons.pool)
+daemon_sub_command.add_command(daemons.queues)
+daemon_sub_command.add_command(daemons.bootstrap)
+
+plugins_sub_command.add_command(plugins.warm)
 
 main.add_command(daemon_sub_command)
 main.add_command(plugins_sub_command)
@@ -0,0 +1,73 @@
+#########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import marshal
+import os
+import sys
+
+from cloudify_agent.api.plugins import bytecode
+
+from cloudify_agent.tests import BaseTest
+
+
+class TestBytecode(BaseTest):
+
+    def _write(self, path, content):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_compile_dir(self):
+        self._write('plugin/module.py', 'x = 1\n')
+        self._write('plugin/package/module.py', 'y = 2\n')
+        self._write('plugin/package/broken.py', 'def f(:\n')
+
+        stats = bytecode.compile_dir('plugin', processes=2)
+        self.assertEqual(2, stats['compiled'])
+        self.assertEqual(1, stats['failed'])
+        self.assertTrue(bytecode.is_compiled('plugin/module.py'))
+        self.assertTrue(bytecode.is_compiled('plugin/package/module.py'))
+        self.assertFalse(bytecode.is_compiled('plugin/package/broken.py'))
+
+        # compiled sources are not compiled again
+        stats = bytecode.compile_dir('plugin', processes=2)
+        self.assertEqual(0, stats['compiled'])
+
+    def test_modified_source(self):
+        self._write('plugin/module.py', 'x = 1\n')
+        bytecode.compile_dir('plugin', processes=1)
+        os.utime('plugin/module.py', (0, 0))
+        self.assertFalse(bytecode.is_compiled('plugin/module.py'))
+
+    def test_destination(self):
+        self._write('staging/package/module.py', 'def f():\n    pass\n')
+        bytecode.compile_dir('staging', processes=1,
+                             destination=os.path.abspath('plugin'))
+        os.rename('staging', 'plugin')
+        self.assertTrue(bytecode.is_compiled('plugin/package/module.py'))
+        code = _load_code(bytecode._compiled_path('plugin/package/module.py'))
+        self.assertEqual(os.path.abspath('plugin/package/module.py'),
+                         code.co_filename)
+
+
+def _load_code(compiled):
+    with open(compiled, 'rb') as f:
+        f.read(bytecode.MTIME_OFFSET + 4)
+        if sys.version_info >= (3, 3):
+            # the source size
+            f.read(4)
+        return marshal.load(f)
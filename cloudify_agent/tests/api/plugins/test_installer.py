@@ -19,10 +19,12 @@ import os
 import platform
 import shutil
 import multiprocessing
+import threading
+import time
 from contextlib import contextmanager
 
 from wagon import utils as wagon_utils
-from mock import patch
+from mock import patch, MagicMock
 
 from cloudify import constants
 from cloudify import dispatch
@@ -291,6 +293,84 @@ class PluginInstallerTest(BaseTest):
             installer.extract_package_name(package_dir))
 
 
+class TestStagingAndTrash(BaseTest):
+
+    def setUp(self):
+        super(TestStagingAndTrash, self).setUp()
+        patcher = patch('cloudify_agent.api.plugins.installer.VIRTUALENV',
+                        self.temp_folder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.installer = installer.PluginInstaller(logger=self.logger)
+        self.plugins_dir = os.path.join(self.temp_folder, 'plugins')
+
+    def test_staging_dir(self):
+        staging_dir = self.installer._staging_dir('plugin')
+        self.assertEqual(os.path.join(self.plugins_dir, '.staging'),
+                         os.path.dirname(staging_dir))
+        self.assertTrue(os.path.basename(staging_dir).startswith('plugin-'))
+
+    @patch('cloudify_agent.api.plugins.installer._TrashReaper.wake')
+    def test_discard(self, wake):
+        plugin_dir = os.path.join(self.plugins_dir, 'deployment-plugin')
+        os.makedirs(os.path.join(plugin_dir, 'lib'))
+        self.installer._discard(plugin_dir)
+        self.assertFalse(os.path.exists(plugin_dir))
+        trash_dir = os.path.join(self.plugins_dir, '.trash')
+        self.assertEqual(1, len(os.listdir(trash_dir)))
+        wake.assert_called_once_with(trash_dir, self.installer.store)
+
+        # deleted in the background
+        installer._TrashReaper(trash_dir, self.installer.store).empty()
+        self.assertEqual([], os.listdir(trash_dir))
+
+        # there is nothing to delete for a missing directory
+        self.installer._discard(plugin_dir)
+        self.assertEqual(1, wake.call_count)
+
+    def test_single_reaper(self):
+        trash_dir = os.path.join(self.plugins_dir, '.trash')
+        for name in ('one', 'two'):
+            plugin_dir = os.path.join(self.plugins_dir, name)
+            os.makedirs(plugin_dir)
+            self.installer._discard(plugin_dir)
+        reapers = [reaper for reaper in threading.enumerate()
+                   if isinstance(reaper, installer._TrashReaper) and
+                   reaper.trash_dir == trash_dir]
+        self.assertEqual(1, len(reapers))
+        deadline = time.time() + 10
+        while os.listdir(trash_dir) and time.time() < deadline:
+            time.sleep(0.1)
+        self.assertEqual([], os.listdir(trash_dir))
+
+
+class TestInstallPluginDir(BaseTest):
+
+    def setUp(self):
+        super(TestInstallPluginDir, self).setUp()
+        patcher = patch('cloudify_agent.api.plugins.installer.VIRTUALENV',
+                        self.temp_folder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.installer = installer.PluginInstaller(logger=self.logger)
+        self.installer.runner = MagicMock()
+        self.installer.wheelhouse = MagicMock()
+        self.installer.wheelhouse.get.return_value = [
+            os.path.join('wheelhouse', 'key', 'cloudify_plugins_common.whl'),
+            os.path.join('wheelhouse', 'key', 'mock_plugin.whl')]
+
+    def test_install_from_wheel_cache(self):
+        self.installer._install_plugin_dir(
+            'key', 'plugin', 'mock-plugin', '-r requirements.txt',
+            '--prefix="dst"')
+        command = self.installer.runner.run.call_args[0][0]
+        self.assertIn('--no-index --find-links {0} mock-plugin '
+                      '-r requirements.txt --prefix="dst"'
+                      .format(os.path.join('wheelhouse', 'key')), command)
+        # dependencies are not installed explicitly
+        self.assertNotIn('.whl', command)
+
+
 class TestGetSourceAndGetArgs(BaseTest):
 
     def test_get_url_and_args_http_no_args(self):
@@ -410,8 +490,8 @@ def _patch_for_install_wagon(package_name, package_version,
 def _patch_client(plugins, download_path=None):
     plugins = [Plugin(p) for p in plugins]
     client = MockClient(plugins, download_path=download_path)
-    with patch('cloudify_agent.api.plugins.installer.get_rest_client',
-               lambda: client):
+    with patch('cloudify_agent.api.rest.get_client',
+               lambda *_: client):
         yield client
 
 
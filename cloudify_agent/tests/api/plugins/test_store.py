@@ -0,0 +1,87 @@
+#########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+
+from cloudify_agent.api.plugins import bytecode
+from cloudify_agent.api.plugins.store import PluginStore
+
+from cloudify_agent.tests import BaseTest
+from cloudify_agent.tests.api.pm import only_os
+
+
+@only_os('posix')
+class TestPluginStore(BaseTest):
+
+    def setUp(self):
+        super(TestPluginStore, self).setUp()
+        self.store = PluginStore(os.path.join(self.temp_folder, 'store'))
+
+    def _create_plugin(self, name, content='content'):
+        path = os.path.join(self.temp_folder, name)
+        os.makedirs(os.path.join(path, 'lib'))
+        with open(os.path.join(path, 'lib', 'module.py'), 'w') as f:
+            f.write(content)
+        os.symlink('lib', os.path.join(path, 'link'))
+        return path
+
+    def _add(self, name, content='content'):
+        source = self._create_plugin('{0}-source'.format(name), content)
+        key = self.store.tree_key(source)
+        self.store.add(key, source, name)
+        return key
+
+    def test_add_and_link(self):
+        key = self._add('one')
+        self.assertTrue(self.store.link(key, 'two'))
+        for name in ['one', 'two']:
+            with open(os.path.join(name, 'link', 'module.py')) as f:
+                self.assertEqual('content', f.read())
+        self.assertEqual(3, os.stat('two/lib/module.py').st_nlink)
+
+    def test_identical_files_are_stored_once(self):
+        self._add('one')
+        self._add('two', content='content')
+        self._add('three', content='other')
+        self.assertEqual(3, os.stat('one/lib/module.py').st_nlink)
+        self.assertEqual(2, os.stat('three/lib/module.py').st_nlink)
+
+    def test_remove(self):
+        key = self._add('one')
+        self.store.link(key, 'two')
+        self.store.remove('one')
+        self.assertFalse(os.path.exists('one'))
+        self.assertEqual(2, os.stat('two/lib/module.py').st_nlink)
+        self.assertTrue(self.store.link(key, 'three'))
+
+        # the last directory removes the unreferenced content
+        for name in ['two', 'three']:
+            self.store.remove(name)
+        self.assertFalse(self.store.link(key, 'four'))
+
+    def test_unknown_tree(self):
+        self.assertFalse(self.store.link('unknown', 'one'))
+        self.assertFalse(os.path.exists('one'))
+
+    def test_sources_keep_their_bytecode(self):
+        for name, mtime in [('one', 1000000000), ('two', 1000000100)]:
+            source = self._create_plugin('{0}-source'.format(name))
+            module = os.path.join(source, 'lib', 'module.py')
+            os.utime(module, (mtime, mtime))
+            bytecode.compile_dir(source, processes=1)
+            self.store.add(self.store.tree_key(source), source, name)
+        for name in ['one', 'two']:
+            self.assertTrue(bytecode.is_compiled(
+                os.path.join(name, 'lib', 'module.py')))
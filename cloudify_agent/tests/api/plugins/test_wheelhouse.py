@@ -0,0 +1,67 @@
+#########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+
+from mock import Mock
+
+from cloudify_agent.api.plugins.wheelhouse import Wheelhouse
+
+from cloudify_agent.tests import BaseTest
+
+
+class TestWheelhouse(BaseTest):
+
+    def setUp(self):
+        super(TestWheelhouse, self).setUp()
+        self.runner = Mock()
+        self.runner.run.side_effect = self._pip_wheel
+        self.wheelhouse = Wheelhouse(
+            os.path.join(self.temp_folder, 'wheelhouse'), self.runner,
+            max_size=10)
+
+    @staticmethod
+    def _pip_wheel(command, cwd=None):
+        wheel_dir = command.split('--wheel-dir ')[1].split()[0]
+        with open(os.path.join(wheel_dir, 'plugin.whl'), 'w') as f:
+            f.write('wheel')
+
+    def test_build_and_get(self):
+        self.assertIsNone(self.wheelhouse.get('key'))
+        wheels = self.wheelhouse.build('key', 'plugin', '-r requirements.txt')
+        self.assertEqual(
+            [os.path.join(self.wheelhouse.root, 'key', 'plugin.whl')],
+            wheels)
+        self.assertEqual(wheels, self.wheelhouse.get('key'))
+        command = self.runner.run.call_args[0][0]
+        self.assertIn(' wheel --wheel-dir ', command)
+        self.assertTrue(command.endswith('plugin -r requirements.txt'))
+
+    def test_failed_build(self):
+        self.runner.run.side_effect = RuntimeError()
+        self.assertRaises(RuntimeError, self.wheelhouse.build, 'key', 'dir')
+        self.assertEqual([], os.listdir(self.wheelhouse.root))
+
+    def test_evict_least_recently_used(self):
+        self.wheelhouse.build('one', 'plugin')
+        os.utime(os.path.join(self.wheelhouse.root, 'one'), (0, 0))
+        self.wheelhouse.build('two', 'plugin')
+        os.utime(os.path.join(self.wheelhouse.root, 'two'), (1, 1))
+        # every entry is 5 bytes, and the cache holds 10
+        self.wheelhouse.get('one')
+        self.wheelhouse.build('three', 'plugin')
+        self.assertIsNotNone(self.wheelhouse.get('one'))
+        self.assertIsNone(self.wheelhouse.get('two'))
+        self.assertIsNotNone(self.wheelhouse.get('three'))
@@ -0,0 +1,95 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+import stat
+
+from mock import MagicMock
+
+from cloudify.utils import LocalCommandRunner
+
+from cloudify_agent.api.pm import installation
+
+from cloudify_agent.tests import BaseTest
+
+
+class TestFileInstallation(BaseTest):
+
+    def _source(self, name, content):
+        path = os.path.join(self.temp_folder, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_apply_plan(self):
+        script = os.path.join(self.temp_folder, 'etc', 'init.d', 'daemon')
+        config = os.path.join(self.temp_folder, 'etc', 'default', 'daemon')
+        installation.apply_plan({
+            'files': [
+                {'source': self._source('script', 'script'),
+                 'destination': script,
+                 'mode': 0o755},
+                {'source': self._source('config', 'config'),
+                 'destination': config,
+                 'mode': 0o644}
+            ],
+            'commands': ['true']
+        })
+        self.assertEqual('script', self._read(script))
+        self.assertEqual('config', self._read(config))
+        self.assertEqual(0o755, stat.S_IMODE(os.stat(script).st_mode))
+        self.assertEqual(0o644, stat.S_IMODE(os.stat(config).st_mode))
+        # no staged files are left behind
+        self.assertEqual(['daemon'], os.listdir(os.path.dirname(script)))
+
+    def test_apply_plan_rollback(self):
+        existing = self._source('existing', 'old')
+        new = os.path.join(self.temp_folder, 'new')
+        self.assertRaises(Exception, installation.apply_plan, {
+            'files': [
+                {'source': self._source('source1', 'updated'),
+                 'destination': existing,
+                 'mode': 0o644},
+                {'source': self._source('source2', 'new'),
+                 'destination': new,
+                 'mode': 0o644}
+            ],
+            'commands': ['false']
+        })
+        self.assertEqual('old', self._read(existing))
+        self.assertFalse(os.path.exists(new))
+        self.assertFalse(os.path.exists('{0}{1}'.format(
+            existing, installation.BACKUP_SUFFIX)))
+
+    def test_apply_single_process(self):
+        runner = MagicMock(wraps=LocalCommandRunner(logger=self.logger))
+        destination = os.path.join(self.temp_folder, 'dst', 'file')
+        source = self._source('source', 'content')
+        file_installation = installation.FileInstallation(runner,
+                                                          self.logger)
+        file_installation.add_file(source, destination, mode=0o600)
+        file_installation.apply(sudo=False)
+        self.assertEqual(1, runner.run.call_count)
+        self.assertEqual('content', self._read(destination))
+        self.assertFalse(os.path.exists(source))
+
+    def test_apply_empty_plan(self):
+        runner = MagicMock()
+        installation.FileInstallation(runner, self.logger).apply()
+        self.assertFalse(runner.run.called)
@@ -0,0 +1,106 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+from mock import patch, MagicMock
+
+from cloudify_agent.api import pool
+
+from cloudify_agent.tests import BaseTest
+
+
+class TestDaemonPool(BaseTest):
+
+    def setUp(self):
+        super(TestDaemonPool, self).setUp()
+        self.daemons = []
+        self.factory = MagicMock(storage=self.temp_folder)
+        self.factory.load_all.side_effect = lambda **_: list(self.daemons)
+        self.pool = pool.DaemonPool(factory=self.factory, logger=self.logger)
+
+    def _add_daemon(self, name, queue=None):
+        daemon = MagicMock()
+        daemon.name = name
+        daemon.queue = queue or name
+        daemon.queues = []
+        daemon.get_queues.side_effect = lambda: [daemon.queue] + daemon.queues
+        daemon.add_queue.side_effect = daemon.queues.append
+        daemon.remove_queue.side_effect = daemon.queues.remove
+        self.daemons.append(daemon)
+        return daemon
+
+    def test_claim_without_pool(self):
+        self._add_daemon('{0}1'.format(pool.STANDBY_PREFIX))
+        self.assertIsNone(self.pool.claim('queue'))
+
+    @patch('cloudify_agent.api.pool.DaemonPool.refill')
+    def test_claim(self, refill):
+        self.pool.configure(1, process_management='detach')
+        self._add_daemon('deployment_worker')
+        standby = self._add_daemon('{0}1'.format(pool.STANDBY_PREFIX))
+
+        def consume(queue):
+            standby.queue = queue
+        standby.consume.side_effect = consume
+
+        self.assertIs(standby, self.pool.claim('queue'))
+        standby.consume.assert_called_once_with('queue')
+        standby.configure.assert_called_once_with()
+        self.factory.save.assert_called_once_with(standby)
+        refill.assert_called_once_with()
+        self.assertIs(standby, self.pool.find('queue'))
+        self.assertEqual([], self.pool.standby())
+
+        # no more standby daemons
+        self.assertIsNone(self.pool.claim('queue2'))
+
+    @patch('cloudify_agent.api.pool.DaemonPool.refill')
+    def test_claim_consolidated(self, refill):
+        self.pool.configure(1, queues_per_daemon=2,
+                            process_management='detach')
+        first = self._add_daemon('{0}1'.format(pool.STANDBY_PREFIX))
+        second = self._add_daemon('{0}2'.format(pool.STANDBY_PREFIX))
+
+        self.assertIs(first, self.pool.claim('queue1'))
+        self.assertIs(first, self.pool.claim('queue2'))
+        self.assertEqual(['queue1', 'queue2'], first.queues)
+        self.assertFalse(first.consume.called)
+        # the pool is only refilled once a standby daemon is claimed
+        refill.assert_called_once_with()
+
+        # the first daemon is full
+        self.assertIs(second, self.pool.claim('queue3'))
+        self.assertIs(first, self.pool.find('queue2'))
+        self.assertEqual([], self.pool.standby())
+
+        self.assertTrue(self.pool.release('queue3'))
+        second.configure.assert_called_with()
+        self.assertEqual([second], self.pool.standby())
+
+        # main queues are not released
+        self.assertFalse(self.pool.release(first.queue))
+        self.assertFalse(self.pool.release('unknown'))
+
+    def test_fill(self):
+        self.pool.configure(2, process_management='detach')
+        self._add_daemon('{0}1'.format(pool.STANDBY_PREFIX))
+
+        def new(**attributes):
+            return self._add_daemon(attributes['name'])
+        self.factory.new.side_effect = new
+
+        created = self.pool.fill()
+        self.assertEqual(1, len(created))
+        created[0].start.assert_called_once_with()
+        self.assertEqual(2, len(self.pool.standby()))
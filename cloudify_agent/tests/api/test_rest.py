@@ -0,0 +1,93 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+from mock import patch, MagicMock
+
+from cloudify_rest_client.node_instances import NodeInstance
+from cloudify_rest_client.responses import ListResponse
+
+from cloudify_agent.api import rest
+
+from cloudify_agent.tests import BaseTest
+
+
+@patch('cloudify_agent.api.rest.requests.Session')
+class TestRestClient(BaseTest):
+
+    def setUp(self):
+        super(TestRestClient, self).setUp()
+        self.addCleanup(rest.clear_clients)
+
+    def _mock_response(self, session):
+        response = session.return_value.get.return_value
+        response.status_code = 200
+        response.json.return_value = {'version': '3.4'}
+        return session.return_value.get
+
+    def test_shared_client(self, session):
+        client = rest.get_client('127.0.0.1', 80)
+        self.assertIs(client, rest.get_client('127.0.0.1', 80))
+        self.assertIsNot(client, rest.get_client('127.0.0.2', 80))
+
+    def test_cached_get(self, session):
+        get = self._mock_response(session)
+        client = rest.get_client('127.0.0.1', 80)
+        with rest.count_requests() as requests_count:
+            self.assertEqual({'version': '3.4'},
+                             client.manager.get_version())
+            self.assertEqual({'version': '3.4'},
+                             client.manager.get_version())
+        self.assertEqual(1, get.call_count)
+        self.assertEqual(1, requests_count['sent'])
+        self.assertEqual(1, requests_count['cached'])
+
+    @patch('cloudify_agent.api.defaults.REST_CACHE_TTL', -1)
+    def test_expired_get(self, session):
+        get = self._mock_response(session)
+        client = rest.get_client('127.0.0.1', 80)
+        client.manager.get_version()
+        client.manager.get_version()
+        self.assertEqual(2, get.call_count)
+
+    @patch('cloudify_agent.api.defaults.NODE_INSTANCES_PAGE_SIZE', 2)
+    def test_deployment_hosts(self, session):
+        node_instances = [
+            NodeInstance({'id': 'host_1', 'host_id': 'host_1',
+                          'runtime_properties': {
+                              'ip': '10.0.0.1',
+                              'cloudify_agent': {'name': 'host_1'}}}),
+            NodeInstance({'id': 'app_1', 'host_id': 'host_1',
+                          'runtime_properties': {'ip': '10.0.0.1'}}),
+            NodeInstance({'id': 'host_2', 'host_id': 'host_2',
+                          'runtime_properties': {'ip': '10.0.0.2'}})
+        ]
+
+        def list_node_instances(_offset, _size, **_):
+            return ListResponse(
+                node_instances[_offset:_offset + _size],
+                {'pagination': {'offset': _offset, 'size': _size,
+                                'total': len(node_instances)}})
+
+        client = MagicMock()
+        client.node_instances.list.side_effect = list_node_instances
+        with patch('cloudify_agent.api.rest.get_client', lambda *_: client):
+            hosts = rest.get_deployment_hosts('deployment')
+            self.assertIs(hosts, rest.get_deployment_hosts('deployment'))
+        self.assertEqual(2, client.node_instances.list.call_count)
+        self.assertEqual(['host_1'], [n['id'] for n in hosts['10.0.0.1']])
+        self.assertEqual(
+            {'name': 'host_1'},
+            hosts['10.0.0.1'][0]['runtime_properties']['cloudify_agent'])
+        self.assertEqual(['host_2'], [n['id'] for n in hosts['10.0.0.2']])
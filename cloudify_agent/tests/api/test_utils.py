@@ -16,6 +16,11 @@
 import os
 import tempfile
 
+from jinja2 import Environment
+from jinja2.bccache import Bucket
+from jinja2.bccache import bc_magic
+from mock import patch, MagicMock
+
 from cloudify.utils import setup_logger
 
 import cloudify_agent
@@ -81,6 +86,57 @@ class TestUtils(BaseTest):
             rendered = f.read()
             self.assertTrue('export MANAGEMENT_IP=127.0.0.1' in rendered)
 
+    def test_rendered_template_to_given_file(self):
+        file_path = os.path.join(self.temp_folder, 'rendered')
+        temp = utils.render_template_to_file(
+            template_path='pm/initd/initd.conf.template',
+            file_path=file_path,
+            manager_ip='127.0.0.1'
+        )
+        self.assertEqual(file_path, temp)
+        with open(file_path) as f:
+            self.assertTrue(f.read().endswith(os.linesep))
+
+    def test_get_template_compiled_once(self):
+        template = utils.get_template(
+            os.path.join('pm', 'initd', 'initd.template'))
+        self.assertIs(template, utils.get_template('pm/initd/initd.template'))
+
+    def test_render_cached_template_for_many_nodes(self):
+        # the cached template does not keep values between renderings
+        for index in range(2):
+            utils.render_template_to_file(
+                template_path='pm/initd/initd.template',
+                file_path=os.path.join(self.temp_folder,
+                                       'initd_{0}'.format(index)),
+                daemon_name='node_{0}'.format(index),
+                config_path='/etc/default/node_{0}'.format(index))
+        for index in range(2):
+            with open(os.path.join(self.temp_folder,
+                                   'initd_{0}'.format(index))) as f:
+                rendered = f.read()
+            self.assertIn('. /etc/default/node_{0}'.format(index), rendered)
+            self.assertNotIn('node_{0}'.format(1 - index), rendered)
+
+    def test_template_bytecode_cache_partial_entry(self):
+        cache_dir = os.path.join(self.temp_folder, 'templates')
+        os.makedirs(cache_dir)
+        cache = utils._TemplateBytecodeCache(cache_dir)
+        bucket = Bucket(Environment(), 'key', 'checksum')
+        bucket.code = compile('x = 1', '<template>', 'exec')
+        cache.dump_bytecode(bucket)
+        self.assertEqual(['__jinja2_key.cache'], os.listdir(cache_dir))
+
+        # an entry that is cut short is compiled again
+        entry_path = os.path.join(cache_dir, '__jinja2_key.cache')
+        with open(entry_path, 'rb') as f:
+            entry = f.read()
+        with open(entry_path, 'wb') as f:
+            f.write(entry[:len(bc_magic) + 1])
+        bucket = Bucket(Environment(), 'key', 'checksum')
+        cache.load_bytecode(bucket)
+        self.assertIsNone(bucket.code)
+
     def test_resource_to_tempfile(self):
         temp = utils.resource_to_tempfile(
             resource_path=os.path.join('pm', 'initd', 'initd.conf.template')
@@ -99,3 +155,24 @@ class TestUtils(BaseTest):
     def test_generate_agent_name(self):
         name = utils.internal.generate_agent_name()
         self.assertIn(defaults.CLOUDIFY_AGENT_PREFIX, name)
+
+    def _get_broker_configuration(self):
+        fetch = MagicMock(return_value={'broker_ip': '10.0.0.1'})
+        env = {utils.internal.CLOUDIFY_DAEMON_STORAGE_DIRECTORY_KEY:
+               self.temp_folder}
+        agent = {'manager_ip': '10.0.0.1', 'manager_port': 80}
+        with patch.dict(os.environ, env):
+            with patch.object(utils._Internal, '_fetch_broker_configuration',
+                              fetch):
+                for _ in range(3):
+                    self.assertEqual(
+                        {'broker_ip': '10.0.0.1'},
+                        utils.internal.get_broker_configuration(agent))
+        return fetch
+
+    def test_get_broker_configuration_cached(self):
+        self.assertEqual(1, self._get_broker_configuration().call_count)
+
+    @patch('cloudify_agent.api.defaults.BROKER_CONFIG_TTL', -1)
+    def test_get_broker_configuration_expired(self):
+        self.assertEqual(3, self._get_broker_configuration().call_count)
@@ -91,3 +91,31 @@ class TestConfiguration(BaseTest):
 
         self.maxDiff = None
         self.assertDictEqual(expected, cloudify_agent)
+
+    def test_shared_runtime(self):
+
+        def directories(**attributes):
+            cloudify_agent = {
+                'name': 'agent',
+                'basedir': '/home/user',
+                'windows': False,
+                'package_url': 'localhost/agent.tar.gz',
+                'shared_env': True
+            }
+            cloudify_agent.update(attributes)
+            configuration.directory_attributes(cloudify_agent)
+            return cloudify_agent
+
+        agent = directories()
+        self.assertEqual('/home/user/agent/work', agent['workdir'])
+        self.assertTrue(agent['runtime_dir'].startswith(
+            '/home/user/cfy-agent-runtime-'))
+        self.assertEqual(os.path.join(agent['runtime_dir'], 'env'),
+                         agent['envdir'])
+
+        # agents installed from the same package share the runtime
+        self.assertEqual(agent['runtime_dir'],
+                         directories(name='other')['runtime_dir'])
+        self.assertNotEqual(agent['runtime_dir'],
+                            directories(version='3.4')['runtime_dir'])
+        self.assertNotIn('runtime_dir', directories(shared_env=False))
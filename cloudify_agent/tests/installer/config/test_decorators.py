@@ -184,3 +184,55 @@ class TestConfigDecorators(unittest.TestCase):
         self.assertEqual(cloudify_agent['attr1'], 'value1')
         self.assertEqual(cloudify_agent['attr2'], 'value2')
         self.assertEqual(cloudify_agent['attr3'], 'value3')
+
+    @patch('cloudify_agent.installer.config.decorators.ctx',
+           mock_context(
+               agent_properties={'attr1': 'value1'},
+               agent_runtime_properties={'attr2': 'value2'},
+               agent_context={'attr3': 'value3'}))
+    @patch('cloudify_agent.installer.config.decorators.AGENT_ATTRIBUTES',
+           {'attr1': {'group': 'g'}, 'attr2': {'group': 'g'},
+            'attr3': {'group': 'g'}, 'attr4': {'group': 'g'},
+            'attr5': {'group': 'g', 'default': 'value5'}})
+    def test_provenance(self):
+
+        @decorators.group('g')
+        def g(_):
+            pass
+
+        cloudify_agent = {'attr4': 'value4'}
+        with decorators.configuration_layers() as layers:
+            g(cloudify_agent)
+            g(cloudify_agent)
+
+        self.assertEqual({
+            'attr1': decorators.NODE_PROPERTIES,
+            'attr2': decorators.RUNTIME_PROPERTIES,
+            'attr3': decorators.BOOTSTRAP_CONTEXT,
+            'attr4': decorators.INPUTS,
+            'attr5': decorators.DEFAULT
+        }, layers.provenance)
+
+    @patch('cloudify_agent.installer.config.decorators.AGENT_ATTRIBUTES',
+           {'attr1': {'group': 'g'}, 'attr2': {'group': 'g'}})
+    def test_layers_built_once(self):
+        context = mock_context(agent_properties={'attr1': 'value1'})
+        context.node.properties['agent_config'] = {'attr2': 'value2'}
+
+        @decorators.group('g')
+        def g(_):
+            pass
+
+        with patch('cloudify_agent.installer.config.decorators.ctx',
+                   context):
+            with patch('cloudify_agent.installer.config.decorators.'
+                       'ConfigurationLayers',
+                       wraps=decorators.ConfigurationLayers) as layers:
+                with decorators.configuration_layers():
+                    g({})
+                    g({})
+        self.assertEqual(1, layers.call_count)
+
+        # node properties are not modified
+        self.assertEqual({'attr1': 'value1'},
+                         context.node.properties['cloudify_agent'])
@@ -13,6 +13,11 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import hashlib
+import os
+import subprocess
+import tarfile
+
 from cloudify_agent.installer import exceptions
 
 # these imports may run on a windows box, in which case they may fail. (if
@@ -20,6 +25,8 @@ from cloudify_agent.installer import exceptions
 # so we can just avoid this import.
 try:
     from cloudify_agent.installer.runners.fabric_runner import FabricRunner
+    from cloudify_agent.installer.runners.fabric_runner import \
+        _download_and_untar_command
 except ImportError:
     FabricRunner = None
 
@@ -75,3 +82,39 @@ class TestValidations(BaseTest):
             validate_connection=False,
             host='host',
             user='password')
+
+
+@only_os('posix')
+class TestDownloadAndUntar(BaseTest):
+
+    def setUp(self):
+        super(TestDownloadAndUntar, self).setUp()
+        os.makedirs('package/env')
+        with open('package/env/file', 'w') as f:
+            f.write('content')
+        with tarfile.open('package.tar.gz', 'w:gz') as tar:
+            tar.add('package')
+        with open('package.tar.gz', 'rb') as f:
+            self.checksum = hashlib.sha256(f.read()).hexdigest()
+
+    def _run(self, checksum=None, package='package.tar.gz'):
+        # wget is replaced by a function that writes the local package
+        command = 'wget() {{ cat {0}; }}\n{1}'.format(
+            package,
+            _download_and_untar_command('url', 'agent', checksum=checksum))
+        return subprocess.call(['bash', '-c', command])
+
+    def test_download_and_untar(self):
+        self.assertEqual(0, self._run())
+        self.assertTrue(os.path.isfile('agent/env/file'))
+
+    def test_checksum(self):
+        self.assertEqual(0, self._run(checksum=self.checksum))
+        self.assertTrue(os.path.isfile('agent/env/file'))
+
+    def test_checksum_mismatch(self):
+        self.assertNotEqual(0, self._run(checksum='0' * 64))
+        self.assertFalse(os.path.exists('agent'))
+
+    def test_download_failure(self):
+        self.assertNotEqual(0, self._run(package='missing.tar.gz'))
@@ -0,0 +1,56 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+from cloudify.exceptions import CommandExecutionException
+
+from cloudify_agent.installer.runners.local_runner import LocalRunner
+from cloudify_agent.installer.runners.local_runner import \
+    _split_command
+
+from cloudify_agent.tests import BaseTest
+from cloudify_agent.tests.api.pm import only_os
+
+
+@only_os('posix')
+class TestLocalRunner(BaseTest):
+
+    def setUp(self):
+        super(TestLocalRunner, self).setUp()
+        self.runner = LocalRunner(logger=self.logger)
+        self.lines = []
+
+    def test_output_callback(self):
+        response = self.runner.run(
+            'bash -c "echo one; echo two >&2"',
+            output_callback=self.lines.append)
+        self.assertEqual(['one', 'two'], self.lines)
+        self.assertEqual('one\ntwo', response.std_out)
+
+    def test_output_callback_failure(self):
+        self.assertRaises(CommandExecutionException,
+                          self.runner.run,
+                          'bash -c "echo one; exit 1"',
+                          output_callback=self.lines.append)
+        self.assertEqual(['one'], self.lines)
+
+
+class TestSplitCommand(BaseTest):
+
+    def test_windows_path(self):
+        self.assertEqual(
+            ['C:\\agent\\Scripts\\cfy-agent', 'configure',
+             '--name', 'agent name'],
+            _split_command('C:\\agent\\Scripts\\cfy-agent configure '
+                           '--name "agent name"'))
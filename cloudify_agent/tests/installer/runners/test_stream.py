@@ -0,0 +1,47 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import unittest
+
+from cloudify_agent.installer.runners.stream import OutputStream
+
+
+class TestOutputStream(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = []
+
+    def test_lines(self):
+        stream = OutputStream(self.lines.append)
+        stream.write('one\r\ntw')
+        self.assertEqual(['one'], self.lines)
+        stream.write('o\nthree')
+        self.assertEqual(['one', 'two'], self.lines)
+        stream.close()
+        self.assertEqual(['one', 'two', 'three'], self.lines)
+        self.assertEqual('one\ntwo\nthree', stream.getvalue())
+
+    def test_tail(self):
+        stream = OutputStream(self.lines.append, tail=2)
+        stream.write('one\ntwo\nthree\n')
+        self.assertEqual(['one', 'two', 'three'], self.lines)
+        self.assertEqual('two\nthree', stream.getvalue())
+
+    def test_long_line(self):
+        stream = OutputStream(self.lines.append, max_line_length=3)
+        stream.write('abcdefg')
+        self.assertEqual(['abc', 'def'], self.lines)
+        stream.close()
+        self.assertEqual(['abc', 'def', 'g'], self.lines)
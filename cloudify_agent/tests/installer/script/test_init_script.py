@@ -13,6 +13,7 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import json
 import os
 
 from cloudify.state import current_ctx
@@ -21,6 +22,7 @@ from cloudify import utils as cloudify_utils
 from cloudify import exceptions
 
 from cloudify_agent.installer import script
+from cloudify_agent.installer import PACKAGE_MANIFEST
 from cloudify_agent.tests import BaseTest
 from cloudify_agent.tests import utils
 from cloudify_agent.tests.api.pm import only_os
@@ -128,6 +130,30 @@ class TestLinuxInitScript(BaseInitScriptTest):
         self._run('create_custom_env_file')
         self.assertFalse(os.path.isfile('custom_agent_env.sh'))
 
+    def test_shared_runtime_package_manifest(self):
+        runtime_dir = os.path.join(self.temp_folder, 'runtime')
+        os.makedirs(os.path.join(runtime_dir, 'env', 'bin'))
+        cfy_agent = os.path.join(runtime_dir, 'env', 'bin', 'cfy-agent')
+        with open(cfy_agent, 'w'):
+            pass
+        os.chmod(cfy_agent, 0755)
+        self.input_cloudify_agent = {
+            'shared_env': True,
+            'runtime_dir': runtime_dir,
+            'package_url': 'http://localhost/agent.tar.gz'
+        }
+        # an extracted runtime is not used until its manifest is written
+        output = self._run('su() { echo installing; }', 'install_agent')
+        self.assertIn('installing', output)
+
+        self._run('write_package_manifest')
+        with open(os.path.join(runtime_dir, PACKAGE_MANIFEST)) as f:
+            manifest = json.load(f)
+        self.assertEqual('http://localhost/agent.tar.gz',
+                         manifest['package_url'])
+        output = self._run('install_agent')
+        self.assertIn('Using the shared agent runtime', output)
+
 
 @only_os('nt')
 class TestWindowsInitScript(BaseInitScriptTest):
@@ -0,0 +1,71 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import os
+
+from mock import patch
+
+from cloudify_agent.installer import PACKAGE_MANIFEST
+from cloudify_agent.installer.linux import LocalLinuxAgentInstaller
+
+from cloudify_agent.tests import BaseTest
+from cloudify_agent.tests.api.pm import only_os
+
+
+@only_os('posix')
+@patch('cloudify_agent.installer.AgentInstaller.run_agent_command')
+@patch('cloudify_agent.installer.LocalInstallerMixin.download_and_extract')
+class TestPackageManifest(BaseTest):
+
+    def _installer(self, **attributes):
+        cloudify_agent = {
+            'package_url': 'http://localhost/agent.tar.gz',
+            'agent_dir': self.temp_folder,
+            'envdir': os.path.join(self.temp_folder, 'env'),
+            'windows': False
+        }
+        cloudify_agent.update(attributes)
+        return LocalLinuxAgentInstaller(cloudify_agent, self.logger)
+
+    def test_installed_package_is_skipped(self, download_and_extract,
+                                          run_agent_command):
+        self._installer(version='3.4')._from_package()
+        self.assertTrue(os.path.isfile(PACKAGE_MANIFEST))
+        self._installer(version='3.4')._from_package()
+        self.assertEqual(1, download_and_extract.call_count)
+        self.assertEqual(1, run_agent_command.call_count)
+
+    def test_other_package_is_installed(self, download_and_extract, _):
+        self._installer(version='3.4')._from_package()
+        self._installer(version='3.4.1')._from_package()
+        self._installer(version='3.4.1', package_checksum='sum')\
+            ._from_package()
+        self.assertEqual(3, download_and_extract.call_count)
+
+    def test_unidentified_package(self, download_and_extract, _):
+        self._installer()._from_package()
+        self._installer()._from_package()
+        self.assertFalse(os.path.isfile(PACKAGE_MANIFEST))
+        self.assertEqual(2, download_and_extract.call_count)
+
+    def test_shared_runtime(self, download_and_extract, run_agent_command):
+        runtime_dir = os.path.join(self.temp_folder, 'runtime')
+        os.makedirs(runtime_dir)
+        self._installer(runtime_dir=runtime_dir)._from_package()
+        self._installer(runtime_dir=runtime_dir)._from_package()
+        download_and_extract.assert_called_once_with(
+            url='http://localhost/agent.tar.gz',
+            destination=runtime_dir)
+        self.assertEqual(1, run_agent_command.call_count)
@@ -13,6 +13,10 @@
 #  * See the License for the specific language governing permissions and
 #  * limitations under the License.
 
+import os
+
+from cloudify_agent.shell.commands import configure
+
 from cloudify_agent.tests.api.pm import only_ci
 from cloudify_agent.tests.api.pm import only_os
 
@@ -26,3 +30,75 @@ class TestConfigureCommandLine(BaseCommandLineTestCase):
     def test_configure(self):
         self._run('cfy-agent configure --disable-requiretty '
                   '--relocated-env')
+
+
+@only_os('posix')
+class TestRelocateVirtualenv(BaseCommandLineTestCase):
+
+    def setUp(self):
+        super(TestRelocateVirtualenv, self).setUp()
+        self.bin_dir = os.path.join(self.temp_folder, 'bin')
+        os.makedirs(self.bin_dir)
+
+    def _create_file(self, name, content):
+        path = os.path.join(self.bin_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_fixup_scripts(self):
+        script = self._create_file(
+            'script', b'#!/tmp/env/bin/python\nimport sys\n')
+        self._create_file('binary', b'\x7fELF\x00\xff')
+        self._create_file('shell', b'#!/bin/bash\necho\n')
+        scripts = configure._fixup_scripts(self.bin_dir)
+        self.assertEqual(['script'], list(scripts.keys()))
+        with open(script) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(configure._get_relative_shebang(), lines[0])
+        self.assertIn('activate_this', lines[2])
+        self.assertEqual('import sys', lines[-1])
+
+        # already fixed scripts are not fixed again
+        self.assertEqual({}, configure._fixup_scripts(self.bin_dir))
+
+    def test_fixup_shebang_only_script(self):
+        self._create_file('script', b'#!/tmp/env/bin/python')
+        self._create_file('long', b'#!/tmp/env/bin/python' +
+                          b' ' * configure.SHEBANG_MAX_LENGTH)
+        scripts = configure._fixup_scripts(self.bin_dir)
+        self.assertEqual(['script'], list(scripts.keys()))
+
+    def test_relocation_manifest(self):
+        manifest_path = os.path.join(self.temp_folder,
+                                     configure.RELOCATION_MANIFEST)
+        self.assertFalse(configure._is_relocated(
+            manifest_path, self.temp_folder, self.bin_dir))
+        configure._write_relocation_manifest(
+            manifest_path, self.temp_folder, self.bin_dir, {})
+        self.assertTrue(configure._is_relocated(
+            manifest_path, self.temp_folder, self.bin_dir))
+        self.assertFalse(configure._is_relocated(
+            manifest_path, '/other/env', self.bin_dir))
+
+        # new scripts were installed since the relocation
+        os.utime(self.bin_dir, (0, 0))
+        self.assertFalse(configure._is_relocated(
+            manifest_path, self.temp_folder, self.bin_dir))
+
+    def test_relocation_manifest_modified_script(self):
+        manifest_path = os.path.join(self.temp_folder,
+                                     configure.RELOCATION_MANIFEST)
+        self._create_file('script', b'#!/tmp/env/bin/python\nimport sys\n')
+        scripts = configure._fixup_scripts(self.bin_dir)
+        configure._write_relocation_manifest(
+            manifest_path, self.temp_folder, self.bin_dir, scripts)
+        self.assertTrue(configure._is_relocated(
+            manifest_path, self.temp_folder, self.bin_dir))
+
+        # replaced by a script with an absolute shebang again
+        bin_mtime = os.stat(self.bin_dir).st_mtime
+        self._create_file('script', b'#!/tmp/env/bin/python\nimport os\n')
+        os.utime(self.bin_dir, (bin_mtime, bin_mtime))
+        self.assertFalse(configure._is_relocated(
+            manifest_path, self.temp_folder, self.bin_dir))
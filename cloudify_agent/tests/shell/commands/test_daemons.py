@@ -15,6 +15,7 @@
 
 from mock import patch
 
+from cloudify_agent.api import defaults
 from cloudify_agent.api import utils
 from cloudify_agent.shell.main import get_logger
 from cloudify_agent.tests.shell.commands import BaseCommandLineTestCase
@@ -51,6 +52,11 @@ class TestPatchedDaemonCommandLine(BaseCommandLineTestCase):
             log_file=None,
             max_workers=None,
             min_workers=None,
+            queue_max_workers=None,
+            workflow_max_workers=None,
+            deployment_weights=None,
+            control_workers=None,
+            pool=None,
             broker_port=None,
             manager_port=None,
             host=None,
@@ -84,6 +90,11 @@ class TestPatchedDaemonCommandLine(BaseCommandLineTestCase):
             workdir=None,
             max_workers=None,
             min_workers=None,
+            queue_max_workers=None,
+            workflow_max_workers=None,
+            deployment_weights=None,
+            control_workers=None,
+            pool=None,
             broker_port=None,
             host=None,
             deployment_id=None,
@@ -115,6 +126,25 @@ class TestPatchedDaemonCommandLine(BaseCommandLineTestCase):
         factory_save = factory_methods[3]
         factory_save.assert_called_once_with(daemon)
 
+    def test_bootstrap(self, *factory_methods):
+        self._run('cfy-agent daemons bootstrap --name=name '
+                  '--process-management=init.d '
+                  '--queue=queue --manager-ip=127.0.0.1 --user=user ')
+
+        factory_new = factory_methods[4]
+        self.assertEqual('name', factory_new.call_args[1]['name'])
+
+        daemon = factory_new.return_value
+        daemon.create.assert_called_once_with()
+        daemon.configure.assert_called_once_with()
+        daemon.start.assert_called_once_with(
+            interval=defaults.START_INTERVAL,
+            timeout=defaults.START_TIMEOUT,
+            delete_amqp_queue=defaults.DELETE_AMQP_QUEUE_BEFORE_START)
+
+        factory_load = factory_methods[2]
+        self.assertFalse(factory_load.called)
+
     def test_start(self, *factory_methods):
         self._run('cfy-agent daemons start --name=name '
                   '--interval 5 --timeout 20 --no-delete-amqp-queue')
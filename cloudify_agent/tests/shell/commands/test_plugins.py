@@ -0,0 +1,28 @@
+#########
+# Copyright (c) 2014 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+from mock import patch
+
+from cloudify_agent.tests.shell.commands import BaseCommandLineTestCase
+
+
+@patch('cloudify_agent.api.plugins.installer.PluginInstaller.warm')
+class TestPluginsCommandLine(BaseCommandLineTestCase):
+
+    def test_warm(self, warm):
+        warm.return_value = ['plugin.whl']
+        self._run('cfy-agent plugins warm --source http://localhost/plugin '
+                  '--args=--no-deps')
+        warm.assert_called_once_with('http://localhost/plugin', '--no-deps')
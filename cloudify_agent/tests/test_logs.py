@@ -0,0 +1,142 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import gzip
+import logging
+import os
+import time
+
+from cloudify_agent import logs
+from cloudify_agent.tests import BaseTest
+from cloudify_agent.tests.api.pm import only_os
+
+
+class LogsTest(BaseTest):
+
+    format = '%(levelname)s %(message)s'
+
+    def setUp(self):
+        super(LogsTest, self).setUp()
+        self.logfile = os.path.join(self.temp_folder, 'worker.log')
+        self.test_logger = logging.getLogger('cloudify_agent.tests.logs')
+        self.test_logger.propagate = False
+        self.test_logger.setLevel(logging.DEBUG)
+        self.addCleanup(setattr, self.test_logger, 'handlers', [])
+
+    def _add_handler(self, handler):
+        handler.setFormatter(logging.Formatter(self.format))
+        self.test_logger.addHandler(handler)
+        return handler
+
+    def _queue_handler(self, **kwargs):
+        file_handler = logs.CompressingRotatingFileHandler(self.logfile)
+        file_handler.setFormatter(logging.Formatter(self.format))
+        return self._add_handler(logs.QueueHandler(file_handler, **kwargs))
+
+    def _read(self):
+        with open(self.logfile) as f:
+            return f.read().splitlines()
+
+
+class TestQueueHandler(LogsTest):
+
+    def test_emit(self):
+        handler = self._queue_handler()
+        for i in range(1000):
+            self.test_logger.info('message %d', i)
+        handler.flush()
+        self.assertEqual(['INFO message {0}'.format(i) for i in range(1000)],
+                         self._read())
+        handler.close()
+
+    def test_exception(self):
+        handler = self._queue_handler()
+        try:
+            raise RuntimeError('error')
+        except RuntimeError:
+            self.test_logger.exception('failed')
+        handler.close()
+        lines = self._read()
+        self.assertEqual('ERROR failed', lines[0])
+        self.assertIn('RuntimeError: error', lines[-1])
+
+    def test_repeated_messages(self):
+        handler = self._queue_handler()
+        self.test_logger.info('first')
+        for _ in range(100):
+            self.test_logger.info('repeated')
+        self.test_logger.info('last')
+        handler.close()
+        self.assertEqual(['INFO first',
+                          'INFO repeated',
+                          'INFO Last message repeated 99 times',
+                          'INFO last'], self._read())
+
+    def test_repeated_messages_interval(self):
+        handler = self._queue_handler(repeat_interval=0.1)
+        for _ in range(3):
+            self.test_logger.info('repeated')
+        time.sleep(0.5)
+        handler.flush()
+        self.assertEqual(['INFO repeated',
+                          'INFO Last message repeated 2 times'],
+                         self._read())
+        handler.close()
+
+    def test_emit_after_close(self):
+        handler = self._queue_handler()
+        handler.close()
+        self.test_logger.info('message')
+        handler.handler.flush()
+        self.assertEqual(['INFO message'], self._read())
+
+    @only_os('posix')
+    def test_fork(self):
+        handler = self._queue_handler()
+        self.test_logger.info('parent')
+        handler.flush()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.test_logger.info('child')
+                handler.flush()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        handler.close()
+        self.assertEqual(['INFO parent', 'INFO child'], self._read())
+
+
+class TestCompressingRotatingFileHandler(LogsTest):
+
+    def test_rollover(self):
+        handler = self._add_handler(logs.CompressingRotatingFileHandler(
+            self.logfile, maxBytes=1024, backupCount=2))
+        for i in range(300):
+            self.test_logger.info('message %d', i)
+        handler.close()
+        self.assertFalse(os.path.exists('{0}.1'.format(self.logfile)))
+        self.assertFalse(os.path.exists('{0}.3.gz'.format(self.logfile)))
+        backups = []
+        for i in (2, 1):
+            f = gzip.open('{0}.{1}.gz'.format(self.logfile, i))
+            try:
+                backups.extend(f.read().decode('utf-8').splitlines())
+            finally:
+                f.close()
+        lines = backups + self._read()
+        self.assertEqual(
+            ['INFO message {0}'.format(i)
+             for i in range(300 - len(lines), 300)], lines)
@@ -15,12 +15,15 @@
 import os
 import platform
 import shutil
+import socket
 import urllib
 
 from contextlib import contextmanager
 
 from mock import patch, MagicMock
 
+from celery import states
+
 from cloudify import constants
 from cloudify import context
 from cloudify import ctx
@@ -30,6 +33,7 @@ from cloudify.state import current_ctx
 from cloudify.workflows import local
 
 from cloudify_agent import operations
+from cloudify_agent.api import exceptions
 from cloudify_agent.api import utils
 from cloudify_agent.installer.config import configuration
 
@@ -94,7 +98,7 @@ class TestInstallNewAgent(BaseDaemonLiveTestCase):
             finally:
                 fs.stop()
 
-    @patch('cloudify.manager.get_rest_client', _MockRestclient)
+    @patch('cloudify_agent.api.rest.get_client', _MockRestclient)
     @only_ci
     def test_install_new_agent(self):
         agent_name = utils.internal.generate_agent_name()
@@ -136,10 +140,17 @@ def _get_celery_mock():
         def get_value(self, *_, **__):
             return self.agent
 
+        def get_many(self, task_ids, **_):
+            return [(task_id, {'status': 'SUCCESS', 'result': self.agent})
+                    for task_id in task_ids]
+
     keeper = AgentKeeper()
+    task_mock.id = 'task_id'
     task_mock.get = keeper.get_value
+    task_mock.backend.get_many = keeper.get_many
     celery_mock = MagicMock()
     celery_mock.send_task = keeper.set_value
+    celery_mock.backend = task_mock.backend
     return MagicMock(return_value=celery_mock)
 
 rest_mock = MagicMock()
@@ -264,3 +275,100 @@ class TestCreateAgentAmqp(BaseTest):
             self.assertNotEquals(old_queue, new_queue)
         finally:
             current_ctx.set(old_context)
+
+    @patch('cloudify_agent.operations.celery.Celery', _get_celery_mock())
+    @patch('cloudify_agent.operations.app', MagicMock())
+    def test_validate_agents(self):
+        context = self._create_node_instance_context()
+        old_context = ctx
+        current_ctx.set(context)
+        try:
+            alive_agent = ctx.instance.runtime_properties['cloudify_agent']
+            dead_agent = dict(alive_agent, name='dead_agent')
+            registered = {
+                alive_agent['name']: {'cloudify.dispatch.dispatch': {}},
+                dead_agent['name']: None
+            }
+            with self._patch_manager_env():
+                with patch('cloudify_agent.api.utils.get_agents_registered',
+                           MagicMock(return_value=registered)) as inspect:
+                    results = operations.validate_agents(
+                        [alive_agent, dead_agent], timeout=10)
+            # a single broadcast per broker
+            self.assertEqual(2, inspect.call_count)
+            self.assertTrue(results[alive_agent['name']]['agent_alive'])
+            self.assertTrue(
+                results[alive_agent['name']]['agent_alive_crossbroker'])
+            self.assertFalse(results['dead_agent']['agent_alive'])
+            self.assertFalse(results['dead_agent']['agent_alive_crossbroker'])
+            self.assertIn('dead_agent',
+                          results['dead_agent']['agent_alive_error'])
+        finally:
+            current_ctx.set(old_context)
+
+    @patch('cloudify_agent.operations.ctx')
+    @patch('cloudify_agent.operations.ResultSet')
+    def test_wait_for_install_scripts_progress(self, result_set, ctx_mock):
+
+        def timed_out():
+            raise socket.timeout()
+            yield
+
+        def finished():
+            yield 'task', {'status': states.SUCCESS, 'result': 'agent'}
+
+        # the first wait times out before the install script finishes
+        iterations = [timed_out(), finished()]
+        result_set.return_value.iter_native.side_effect = \
+            lambda timeout: iterations.pop(0)
+        results = list(operations._wait_for_install_scripts(
+            MagicMock(), [MagicMock(id='task')], timeout=60))
+        self.assertEqual([('task', 'agent')], results)
+        self.assertEqual(1, ctx_mock.logger.info.call_count)
+
+    @patch('cloudify_agent.operations.app')
+    @patch('cloudify_agent.operations._save_daemon')
+    @patch('cloudify_agent.operations._load_daemon')
+    def test_restart_in_place(self, load_daemon, save_daemon, app):
+        daemon = load_daemon.return_value
+        daemon.name = 'agent'
+        daemon.queue = 'queue'
+        daemon.pool = 'prefork'
+        context = self._create_node_instance_context()
+        old_context = ctx
+        current_ctx.set(context)
+        try:
+            app.control.pool_restart.return_value = [
+                {'celery@agent': {'ok': 'reload started'}}]
+            operations._restart_in_place('new_queue')
+            daemon.consume.assert_called_once_with('new_queue')
+            save_daemon.assert_called_once_with(daemon)
+            self.assertEqual('new_queue', ctx.instance.runtime_properties[
+                'cloudify_agent']['queue'])
+
+            app.control.pool_restart.return_value = []
+            self.assertRaises(exceptions.DaemonException,
+                              operations._restart_in_place)
+        finally:
+            current_ctx.set(old_context)
+
+    @patch('cloudify_agent.operations.app')
+    @patch('cloudify_agent.operations._load_daemon')
+    def test_restart_in_place_threads_pool(self, load_daemon, app):
+        daemon = load_daemon.return_value
+        daemon.name = 'agent'
+        daemon.queue = 'queue'
+        daemon.pool = 'threads'
+        context = self._create_node_instance_context()
+        old_context = ctx
+        current_ctx.set(context)
+        try:
+            # the worker replies even though it can not restart its pool
+            app.control.pool_restart.return_value = [
+                {'celery@agent': {'ok': 'reload started'}}]
+            self.assertRaises(exceptions.DaemonException,
+                              operations._restart_in_place, 'new_queue')
+            self.assertFalse(daemon.consume.called)
+            self.assertFalse(app.control.pool_restart.called)
+        finally:
+            current_ctx.set(old_context)
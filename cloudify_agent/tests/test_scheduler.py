@@ -0,0 +1,120 @@
+#########
+# Copyright (c) 2015 GigaSpaces Technologies Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+import unittest
+
+from cloudify_agent import scheduler
+
+
+class TestFairScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.scheduler = scheduler.FairScheduler(
+            capacity=2, bucket_size=2, workflow_bucket_size=1,
+            weights={'heavy': 2}, clock=lambda: self.now)
+
+    def _submit(self, key, count):
+        ready = []
+        for index in range(count):
+            ready.extend(self.scheduler.submit(
+                key, '{0}{1}'.format(key, index)))
+        return ready
+
+    def test_bucket_size(self):
+        scheduler_ = scheduler.FairScheduler(bucket_size=2)
+        self.assertEqual(['d0', 'd1'],
+                         scheduler_.submit('d', 'd0') +
+                         scheduler_.submit('d', 'd1'))
+        self.assertEqual([], scheduler_.submit('d', 'd2'))
+        self.assertEqual(['d2'], scheduler_.done('d'))
+
+    def test_workflow_bucket_size(self):
+        self.assertEqual(['d_workflows0'], self._submit('d_workflows', 2))
+        self.assertEqual(['d_workflows1'],
+                         self.scheduler.done('d_workflows'))
+
+    def test_fair_dispatch(self):
+        self.assertEqual(['busy0', 'busy1'], self._submit('busy', 4))
+        self.assertEqual([], self._submit('small', 1))
+
+        # the small deployment does not wait for all busy tasks
+        self.assertEqual(['busy2'], self.scheduler.done('busy'))
+        self.assertEqual(['small0'], self.scheduler.done('busy'))
+        self.assertEqual(['busy3'], self.scheduler.done('busy'))
+
+    def test_weights(self):
+        scheduler_ = scheduler.FairScheduler(
+            capacity=1, bucket_size=5, weights={'heavy': 2})
+        self.assertEqual(['light0'], scheduler_.submit('light', 'light0'))
+        scheduler_.submit('light', 'light1')
+        scheduler_.submit('light', 'light2')
+        for index in range(4):
+            scheduler_.submit('heavy', 'heavy{0}'.format(index))
+        dispatched = ['light0']
+        for _ in range(6):
+            dispatched.extend(scheduler_.done(dispatched[-1][:-1]))
+        self.assertEqual(['light0', 'light1', 'heavy0', 'heavy1',
+                          'light2', 'heavy2', 'heavy3'], dispatched)
+
+    def test_tasks_without_deployment(self):
+        self.assertEqual(['None0', 'None1'], self._submit(None, 3))
+        self.assertEqual(['None2'], self.scheduler.done(None))
+
+    def test_control_slots(self):
+        self.assertEqual(['busy0', 'busy1'], self._submit('busy', 4))
+
+        # every regular slot is busy, control tasks are not held
+        self.now = 5
+        self.assertEqual(['stop'], self.scheduler.submit(
+            scheduler.CONTROL_BUCKET, 'stop'))
+        self.assertEqual([], self.scheduler.submit(
+            scheduler.CONTROL_BUCKET, 'restart'))
+        self.assertEqual(['restart'],
+                         self.scheduler.done(scheduler.CONTROL_BUCKET))
+        self.assertEqual([], self.scheduler.done(scheduler.CONTROL_BUCKET))
+        self.assertEqual(0, self.scheduler.stats()[
+            scheduler.CONTROL_BUCKET]['max_wait'])
+
+        # control tasks do not take regular slots
+        self.assertEqual(['busy2'], self.scheduler.done('busy'))
+
+    def test_is_control_task(self):
+        self.assertTrue(scheduler.is_control_task(
+            'cloudify_agent.operations.stop', 'agent'))
+        self.assertTrue(scheduler.is_control_task(
+            'script_runner.tasks.run', scheduler.control_queue('agent')))
+        self.assertFalse(scheduler.is_control_task(
+            'script_runner.tasks.run', 'agent'))
+
+    def test_stats(self):
+        self._submit('d', 3)
+        self.now = 10
+        self.scheduler.done('d')
+        stats = self.scheduler.stats()['d']
+        self.assertEqual(2, stats['running'])
+        self.assertEqual(0, stats['waiting'])
+        self.assertEqual(3, stats['dispatched'])
+        self.assertEqual(10, stats['max_wait'])
+
+    def test_parse_weights(self):
+        self.assertEqual({'d': 1, 'd_workflows': 2.5},
+                         scheduler.parse_weights('d:1, d_workflows:2.5'))
+        self.assertEqual({'d': 2}, scheduler.parse_weights({'d': '2'}))
+        self.assertEqual({}, scheduler.parse_weights(None))
+        self.assertEqual('d:2.0,e:1.0',
+                         scheduler.format_weights({'e': 1, 'd': 2}))
+        for weights in ['d', 'd:0', 'd:x']:
+            self.assertRaises(ValueError, scheduler.parse_weights, weights)